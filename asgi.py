@@ -0,0 +1,746 @@
+"""
+ASGI entry point for Avanii Shop
+Serves the I/O-bound advisor endpoints on an event loop with async HTTP clients
+for Gemini and Deepgram, and hands every other request to the Flask app.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+The shop, cart, checkout and admin routes are unchanged and keep running as
+WSGI (through asgiref) on the server's thread pool. These POST routes are
+handled here, with the same request and response shapes as main.py:
+    /api/fertilizer-recommendation
+    /api/fertilizer-recommendation/batch
+    /api/transcribe-audio
+    /api/voice-recommendation
+
+The handlers follow main.py step for step and reuse its prompt, parsing,
+validation, circuit breaker, caches and product matching; only the network
+calls differ. Gemini and Deepgram are called with httpx.AsyncClient and audio
+is streamed from ASGI receive() to Deepgram, so a request waiting on an
+upstream holds no thread. Cache and product-index lookups, which may touch
+the database, run through asyncio.to_thread().
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from urllib.parse import parse_qs
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.sansio import multipart
+
+from main import (
+    app, AIUnavailableError, BULKHEAD_BUSY_PAYLOAD, DeepgramBackend, GeminiClient, LocalTranscriptionBackend,
+    StreamingAudioUpload, TranscriptionUnavailableError, async_bulkheads, async_gemini_in_flight,
+    audio_field_problem, build_recommendation_prompt, bulkhead_busy_headers, cached_transcript_response,
+    check_transcription_quality, count_advisor_call, declared_size_problem, empty_audio_payload, finish_batch,
+    finish_request_metrics, gemini_calls_outstanding, get_fallback_recommendation, get_gemini_client,
+    get_transcription_backend, match_catalog_products, normalize_advisor_input, outbound_call,
+    parse_gemini_recommendation, parse_latency_budget, prepare_batch, recommendation_cache,
+    start_request_metrics, store_recommendation, transcript_response, transcription_error_response,
+    validate_advisor_input,
+)
+
+
+# Largest JSON body accepted by the recommendation endpoints
+MAX_JSON_BODY = 1024 * 1024
+DEEPGRAM_LISTEN_URL = "https://api.deepgram.com/v1/listen"
+DEEPGRAM_TIMEOUT = float(os.environ.get('DEEPGRAM_TIMEOUT', 30))
+
+# One connection pool for all outbound calls, opened on first use and closed at shutdown
+_http_client = None
+
+
+def get_http_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=int(os.environ.get('ASYNC_HTTP_MAX_CONNECTIONS', 200)),
+                max_keepalive_connections=int(os.environ.get('ASYNC_HTTP_MAX_KEEPALIVE', 50)),
+            )
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# ============================================
+# REQUESTS AND RESPONSES
+# ============================================
+
+class AsyncRequest:
+    """The parts of an ASGI HTTP request the advisor routes need"""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope.get('headers', [])
+        }
+        self.args = {
+            name: values[0]
+            for name, values in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()
+        }
+
+    @property
+    def content_length(self):
+        try:
+            return int(self.headers.get('content-length', ''))
+        except ValueError:
+            return None
+
+    async def body(self, max_bytes):
+        """Whole request body, or None once it grows past `max_bytes`"""
+        chunks = []
+        size = 0
+        while True:
+            message = await self.receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > max_bytes:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+
+    async def json(self):
+        """Parsed JSON body; None when it is missing, invalid or too large"""
+        body = await self.body(MAX_JSON_BODY)
+        if not body:
+            return None
+        try:
+            return json.loads(body)
+        except ValueError:
+            return None
+
+
+class ReceiveStream:
+    """File-like view of an ASGI request body whose read() is awaited"""
+
+    def __init__(self, receive):
+        self._receive = receive
+        self._pending = b''
+        self._finished = False
+
+    async def read(self, size=-1):
+        while not self._pending and not self._finished:
+            message = await self._receive()
+            self._pending = message.get('body', b'')
+            if message['type'] == 'http.disconnect' or not message.get('more_body', False):
+                self._finished = True
+        if size is None or size < 0:
+            size = len(self._pending)
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+
+def _header_list(content_type, headers, content_length=None):
+    header_list = [(b'content-type', content_type.encode('latin-1'))]
+    if content_length is not None:
+        header_list.append((b'content-length', str(content_length).encode('latin-1')))
+    for name, value in (headers or {}).items():
+        header_list.append((name.lower().encode('latin-1'), str(value).encode('latin-1')))
+    return header_list
+
+
+async def send_json(send, payload, status=200, headers=None):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': _header_list('application/json', headers, len(body)),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# ============================================
+# ASYNC GEMINI CLIENT
+# ============================================
+
+class AsyncGeminiClient:
+    """
+    Gemini over its REST API with httpx. Configured from the process-wide
+    main.GeminiClient, so it shares the same model, deadline, retry count,
+    backoff and circuit breaker as the threaded routes.
+    """
+
+    URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+    RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, api_key, model_name, timeout, max_retries, breaker):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breaker = breaker
+
+    async def generate_text(self, prompt):
+        """Return the model's text for `prompt` or raise AIUnavailableError"""
+        if not self.breaker.allow():
+            raise AIUnavailableError("Gemini circuit breaker is open")
+
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        deadline = time.monotonic() + self.timeout * (self.max_retries + 1)
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                with outbound_call("gemini"):
+                    response = await get_http_client().post(
+                        self.URL.format(model=self.model_name),
+                        json=body,
+                        headers={'x-goog-api-key': self.api_key},
+                        timeout=min(self.timeout, remaining),
+                    )
+                    response.raise_for_status()
+                    parts = response.json()["candidates"][0]["content"]["parts"]
+                text = "".join(part.get("text", "") for part in parts)
+                self.breaker.record_success()
+                return text
+            except httpx.HTTPStatusError as e:
+                last_error = e
+                if e.response.status_code not in self.RETRYABLE_STATUS:
+                    break
+            except httpx.TransportError as e:
+                # Timeouts and connection errors
+                last_error = e
+            except (KeyError, IndexError, ValueError) as e:
+                # Blocked or malformed response; retrying will not change it
+                last_error = e
+                break
+            if attempt == self.max_retries:
+                break
+            await asyncio.sleep(GeminiClient.backoff(attempt))
+
+        self.breaker.record_failure()
+        raise AIUnavailableError(f"Gemini request failed: {last_error}")
+
+
+_async_gemini_client = None
+
+
+def get_async_gemini_client():
+    """Async twin of main.get_gemini_client(), or None when no API key is configured"""
+    global _async_gemini_client
+    gemini = get_gemini_client()
+    if gemini is None:
+        return None
+    if _async_gemini_client is None:
+        _async_gemini_client = AsyncGeminiClient(
+            api_key=gemini.api_key,
+            model_name=gemini.model_name,
+            timeout=gemini.timeout,
+            max_retries=gemini.max_retries,
+            breaker=gemini.breaker,
+        )
+    return _async_gemini_client
+
+
+# ============================================
+# RECOMMENDATION EXECUTION
+# ============================================
+
+async def get_recommendation_async(user_input):
+    """Async main.get_simple_fertilizer_recommendation(): Gemini, or the keyword fallback on any failure"""
+    gemini = get_async_gemini_client()
+    if gemini is None or gemini.breaker.is_open():
+        return get_fallback_recommendation(user_input)
+    try:
+        llm_text = (await gemini.generate_text(build_recommendation_prompt(user_input))).strip()
+        app.logger.debug("Gemini response for %r: %s", user_input, llm_text)
+        return parse_gemini_recommendation(llm_text, user_input)
+    except Exception as e:
+        app.logger.warning("Gemini AI error: %s", e)
+        return get_fallback_recommendation(user_input)
+
+
+async def _recommend_and_store(text):
+    recommendation = await get_recommendation_async(text)
+    try:
+        await asyncio.to_thread(store_recommendation, text, recommendation)
+    except Exception:
+        app.logger.exception("Storing the recommendation for %r failed", text)
+    return recommendation
+
+
+def submit_gemini_recommendation_async(text):
+    """
+    main.submit_gemini_recommendation() for the event loop: a task that asks
+    Gemini and caches the answer, shared by identical texts, or None once
+    ADVISOR_MAX_PENDING calls are outstanding. Await it through
+    asyncio.shield() so a caller giving up does not cancel it for the others.
+    """
+    task = async_gemini_in_flight.get(text)
+    if task is not None:
+        count_advisor_call("coalesced")
+        return task
+    if gemini_calls_outstanding() >= app.config['ADVISOR_MAX_PENDING']:
+        count_advisor_call("shed")
+        return None
+    task = asyncio.ensure_future(_recommend_and_store(text))
+    async_gemini_in_flight[text] = task
+    count_advisor_call("submitted")
+
+    def _finished(done):
+        if async_gemini_in_flight.get(text) is done:
+            del async_gemini_in_flight[text]
+
+    task.add_done_callback(_finished)
+    return task
+
+
+async def recommend_for_input_async(user_input, budget):
+    """
+    Async main.recommend_for_input(). With a `budget` the Gemini task is raced
+    against it and the keyword fallback is returned, marked provisional, when
+    it runs out; the task keeps running and fills the cache.
+
+    Returns:
+        tuple: (recommendation dict, cache tier or None on a miss)
+    """
+    text = normalize_advisor_input(user_input)
+
+    recommendation, cache_tier = await asyncio.to_thread(recommendation_cache.get, text)
+    if recommendation is None:
+        task = submit_gemini_recommendation_async(text)
+        if task is None:
+            recommendation = get_fallback_recommendation(text)
+        elif budget > 0:
+            try:
+                recommendation = dict(await asyncio.wait_for(asyncio.shield(task), min(budget, 30)))
+            except asyncio.TimeoutError:
+                recommendation = get_fallback_recommendation(text)
+                recommendation["provisional"] = True
+        else:
+            recommendation = dict(await asyncio.shield(task))
+
+    # Attached after caching so stock is always current
+    recommendation["catalog_products"] = await asyncio.to_thread(match_catalog_products, recommendation)
+    return recommendation, cache_tier
+
+
+async def recommend_batch_async(inputs):
+    """
+    Async main.recommend_batch(): the Gemini calls for the distinct uncached
+    descriptions run concurrently on the event loop, within ADVISOR_MAX_PENDING.
+
+    Returns:
+        tuple: (payload dict, HTTP status code)
+    """
+    try:
+        results, pending = await asyncio.to_thread(prepare_batch, inputs)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+
+    tasks = {text: submit_gemini_recommendation_async(text) for text in pending}
+    recommendations = {}
+    for text, task in tasks.items():
+        if task is None:
+            recommendations[text] = get_fallback_recommendation(text)
+        else:
+            recommendations[text] = await asyncio.shield(task)
+
+    return await asyncio.to_thread(finish_batch, results, pending, recommendations), 200
+
+
+# ============================================
+# STREAMING AUDIO UPLOADS
+# ============================================
+
+class AsyncStreamingAudioUpload(StreamingAudioUpload):
+    """
+    main.StreamingAudioUpload over a ReceiveStream. Await open() to advance to
+    the file, then `async for` over its bytes; decoding, the size limit and
+    hashing are the parent's.
+    """
+
+    async def _iter_events(self):
+        while True:
+            event = self._decoder.next_event()
+            if isinstance(event, multipart.NeedData):
+                if self._finished:
+                    return
+                self._feed(await self._stream.read(self.chunk_size))
+                continue
+            yield event
+            if isinstance(event, multipart.Epilogue):
+                return
+
+    async def open(self):
+        """Skip ahead to the requested file field; False if the body has none"""
+        async for event in self._events:
+            if self._is_requested_file(event):
+                return True
+        return False
+
+    async def __aiter__(self):
+        async for event in self._events:
+            if not isinstance(event, multipart.Data):
+                return
+            data = self._take(event)
+            if data:
+                yield data
+            if not event.more_data:
+                return
+
+
+async def _prepend(first_chunk, chunks):
+    yield first_chunk
+    async for chunk in chunks:
+        yield chunk
+
+
+async def transcribe_chunks(backend, chunks, content_type, language):
+    """Run `backend` over an async iterator of audio chunks without blocking the event loop"""
+    if isinstance(backend, DeepgramBackend):
+        # Same request as the SDK makes, with the upload streamed straight through
+        with outbound_call("deepgram"):
+            response = await get_http_client().post(
+                DEEPGRAM_LISTEN_URL,
+                params={"model": backend.model, "language": language,
+                        "smart_format": "true", "punctuate": "true"},
+                headers={'Authorization': f"Token {backend.api_key}",
+                         'Content-Type': content_type or 'application/octet-stream'},
+                content=chunks,
+                timeout=DEEPGRAM_TIMEOUT,
+            )
+            response.raise_for_status()
+        return response.json()["results"]["channels"][0]["alternatives"][0]["transcript"]
+
+    if isinstance(backend, LocalTranscriptionBackend):
+        digest = hashlib.sha256()
+        async for chunk in chunks:
+            digest.update(chunk)
+        if backend.delay:
+            await asyncio.sleep(backend.delay)
+        return backend.phrase_for(digest)
+
+    # Path-based backends block; they get the recording, bounded by AUDIO_MAX_UPLOAD_BYTES, on a thread
+    buffered = [chunk async for chunk in chunks]
+    return await asyncio.to_thread(backend.transcribe, iter(buffered), language)
+
+
+async def transcribe_request_audio_async(req, language="hi"):
+    """
+    Async main.transcribe_audio_body() over the ASGI request body, built from
+    the same steps.
+
+    Returns:
+        tuple: (payload dict, HTTP status code, extra response headers)
+    """
+    upload = None
+    try:
+        problem = declared_size_problem(req.content_length)
+        if problem:
+            return problem
+
+        upload = AsyncStreamingAudioUpload.from_body(
+            ReceiveStream(req.receive), req.headers.get('content-type', ''), 'audio'
+        )
+        problem = audio_field_problem(upload, upload is not None and await upload.open())
+        if problem:
+            return problem
+
+        try:
+            backend = get_transcription_backend()
+        except TranscriptionUnavailableError as e:
+            return {"success": False, "error": str(e)}, 500, {}
+
+        cached = await asyncio.to_thread(
+            cached_transcript_response, backend, req.headers.get('x-audio-sha256', ''), language
+        )
+        if cached:
+            return cached
+
+        # Pull the first chunk so empty uploads never reach the backend
+        chunks = upload.__aiter__()
+        first_chunk = await anext(chunks, b'')
+        if not first_chunk:
+            return empty_audio_payload()
+
+        transcript = await transcribe_chunks(backend, _prepend(first_chunk, chunks), upload.content_type, language)
+        return await asyncio.to_thread(transcript_response, upload, backend, transcript, language)
+
+    except Exception as e:
+        return transcription_error_response(e, upload)
+
+
+# ============================================
+# ASYNC BULKHEADS
+# ============================================
+
+class AsyncBulkhead:
+    """
+    main.Bulkhead for the event loop. Waiting requests hold no thread, so the
+    limits are much higher than the threaded ones; they still cap how many
+    upstream calls one process has open at a time.
+    """
+
+    def __init__(self, name, limit, max_queue, queue_timeout):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.stats = {"admitted": 0, "rejected_full": 0, "rejected_timeout": 0}
+        self._semaphore = None
+
+    async def acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        if self._semaphore.locked():
+            if self.queued >= self.max_queue:
+                self.stats["rejected_full"] += 1
+                return False
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.stats["rejected_timeout"] += 1
+                return False
+            finally:
+                self.queued -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def snapshot(self):
+        data = dict(self.stats)
+        data.update(in_flight=self.in_flight, queued=self.queued, limit=self.limit,
+                    max_queue=self.max_queue, queue_timeout=self.queue_timeout)
+        return data
+
+
+def _make_async_bulkhead(name, limit, max_queue, queue_timeout):
+    """Bulkhead configured by ASYNC_BULKHEAD_<NAME>_LIMIT / _QUEUE / _TIMEOUT"""
+    prefix = f"ASYNC_BULKHEAD_{name.upper()}"
+    return AsyncBulkhead(
+        name,
+        limit=int(os.environ.get(f"{prefix}_LIMIT", limit)),
+        max_queue=int(os.environ.get(f"{prefix}_QUEUE", max_queue)),
+        queue_timeout=float(os.environ.get(f"{prefix}_TIMEOUT", queue_timeout)),
+    )
+
+
+# Registered in main so /admin/api/bulkheads reports them next to the threaded ones
+async_bulkheads.update({
+    "transcription": _make_async_bulkhead("transcription", limit=100, max_queue=100, queue_timeout=2.0),
+    "recommendation": _make_async_bulkhead("recommendation", limit=200, max_queue=200, queue_timeout=2.0),
+})
+
+
+# ============================================
+# ASYNC ADVISOR ROUTES
+# ============================================
+
+async def transcribe_audio(req, send):
+    """Async /api/transcribe-audio"""
+    payload, status_code, headers = await transcribe_request_audio_async(req)
+    await send_json(send, payload, status_code, headers)
+
+
+async def voice_recommendation_api(req, send):
+    """
+    Async /api/voice-recommendation, including ?stream=1 newline-delimited JSON.
+    Like main.py, the recommendation step also takes a recommendation slot.
+    """
+    payload, status_code, headers = await transcribe_request_audio_async(req)
+    if not payload["success"]:
+        payload.setdefault("user_message", "कोई आवाज़ नहीं सुनाई दी। कृपया फिर से रिकॉर्ड करें। / No voice detected. Please record again.")
+        await send_json(send, payload, status_code)
+        return
+
+    transcription = payload["transcription"]
+
+    problem = check_transcription_quality(transcription)
+    if problem:
+        problem["transcription"] = transcription
+        await send_json(send, problem, 400)
+        return
+
+    try:
+        try:
+            budget = parse_latency_budget(req.args.get('latency_budget_ms'))
+        except ValueError:
+            budget = app.config['ADVISOR_LATENCY_BUDGET']
+
+        limiter = async_bulkheads["recommendation"]
+
+        if req.args.get('stream'):
+            headers = dict(headers, **{'X-Accel-Buffering': 'no'})
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': _header_list('application/x-ndjson', headers),
+            })
+            event = {"event": "transcript", "success": True, "transcription": transcription}
+            await send({'type': 'http.response.body',
+                        'body': (json.dumps(event, ensure_ascii=False) + "\n").encode('utf-8'),
+                        'more_body': True})
+            # Headers are already sent, so a full bulkhead or a failure is reported as the final event
+            if not await limiter.acquire():
+                event = dict(BULKHEAD_BUSY_PAYLOAD, event="recommendation")
+            else:
+                try:
+                    recommendation, _ = await recommend_for_input_async(transcription, budget)
+                    event = {"event": "recommendation", "success": True, "recommendation": recommendation}
+                except Exception as e:
+                    event = {"event": "recommendation", "success": False, "error": str(e)}
+                finally:
+                    limiter.release()
+            await send({'type': 'http.response.body',
+                        'body': (json.dumps(event, ensure_ascii=False) + "\n").encode('utf-8')})
+            return
+
+        if not await limiter.acquire():
+            await send_json(send, dict(BULKHEAD_BUSY_PAYLOAD, transcription=transcription), 503,
+                            bulkhead_busy_headers(limiter))
+            return
+        try:
+            recommendation, _ = await recommend_for_input_async(transcription, budget)
+        finally:
+            limiter.release()
+        await send_json(send, {
+            "success": True,
+            "transcription": transcription,
+            "recommendation": recommendation
+        }, 200, headers)
+
+    except Exception as e:
+        await send_json(send, {
+            "success": False,
+            "error": str(e),
+            "transcription": transcription,
+            "user_message": "कुछ तकनीकी समस्या हुई। कृपया फिर से कोशिश करें। / A technical issue occurred. Please try again."
+        }, 500)
+
+
+async def fertilizer_recommendation_api(req, send):
+    """Async /api/fertilizer-recommendation"""
+    try:
+        data = await req.json() or {}
+        user_input = str(data.get('user_input', '')).strip()
+
+        error = validate_advisor_input(user_input)
+        if error:
+            await send_json(send, {"success": False, "error": error}, 400)
+            return
+
+        try:
+            budget = parse_latency_budget(data.get('latency_budget_ms'))
+        except ValueError as e:
+            await send_json(send, {"success": False, "error": str(e)}, 400)
+            return
+
+        recommendation, cache_tier = await recommend_for_input_async(user_input, budget)
+        await send_json(send, recommendation, 200, {
+            'X-Cache': f"HIT-{cache_tier.upper()}" if cache_tier else "MISS"
+        })
+
+    except Exception as e:
+        await send_json(send, {"success": False, "error": str(e)}, 500)
+
+
+async def fertilizer_recommendation_batch_api(req, send):
+    """Async /api/fertilizer-recommendation/batch"""
+    try:
+        data = await req.json() or {}
+        payload, status_code = await recommend_batch_async(data.get('inputs'))
+        await send_json(send, payload, status_code)
+
+    except Exception as e:
+        await send_json(send, {"success": False, "error": str(e)}, 500)
+
+
+ASYNC_ROUTES = {
+    "/api/transcribe-audio": ("transcription", transcribe_audio),
+    "/api/voice-recommendation": ("transcription", voice_recommendation_api),
+    "/api/fertilizer-recommendation": ("recommendation", fertilizer_recommendation_api),
+    "/api/fertilizer-recommendation/batch": ("recommendation", fertilizer_recommendation_batch_api),
+}
+
+
+# ============================================
+# APPLICATION
+# ============================================
+
+flask_application = WsgiToAsgi(app)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_http_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """Advisor POSTs run on the event loop; everything else goes to the Flask app"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    route = None
+    if scope['type'] == 'http' and scope['method'] == 'POST':
+        route = ASYNC_ROUTES.get(scope['path'])
+    if route is None:
+        await flask_application(scope, receive, send)
+        return
+
+    if not app.config['METRICS_ENABLED']:
+        await dispatch(route, scope, receive, send)
+        return
+
+    # Same request metrics as the Flask routes; the status is taken from the response start
+    status = [500]
+
+    async def send_with_status(message):
+        if message['type'] == 'http.response.start':
+            status[0] = message['status']
+        await send(message)
+
+    token = start_request_metrics(scope['path'])
+    try:
+        await dispatch(route, scope, receive, send_with_status)
+    finally:
+        finish_request_metrics(token, scope['method'], status[0])
+
+
+async def dispatch(route, scope, receive, send):
+    group, handler = route
+    limiter = async_bulkheads[group]
+    if not await limiter.acquire():
+        await send_json(send, BULKHEAD_BUSY_PAYLOAD, 503, bulkhead_busy_headers(limiter))
+        return
+    try:
+        await handler(AsyncRequest(scope, receive), send)
+    finally:
+        limiter.release()
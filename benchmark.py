@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Load-test Benchmark for Avanii Shop
+Replays realistic storefront and admin traffic and reports latency percentiles,
+throughput and SQL queries per request.
+
+In-process (Flask test client, no server needed). Without --database-url the run
+uses a throwaway SQLite database with the sample catalog, deleted afterwards:
+    python benchmark.py --mix storefront --requests 2000 --output bench.json
+    python benchmark.py --database-url sqlite:////tmp/bench.db --mix full
+
+Against a running server (start it with QUERY_AUDIT=warn to get query counts):
+    python benchmark.py --url http://localhost:5000 --user bench --password secret \\
+        --admin-user admin --admin-password secret --concurrency 8 --duration 60
+
+The browse, search and filter scenarios run as anonymous visitors (served from the
+full-page cache once warm); member_browse repeats browsing while logged in. The
+checkout scenario places real orders, so never point --url or --database-url at
+production data. In-process runs refuse the development site.db.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+
+# Scenario weights for each traffic mix
+MIXES = {
+    "storefront": {"browse": 35, "member_browse": 10, "search": 15, "filter": 20, "cart": 15, "checkout": 5},
+    "browse": {"browse": 1},
+    "member_browse": {"member_browse": 1},
+    "search": {"search": 1},
+    "filter": {"filter": 1},
+    "cart": {"cart": 1},
+    "checkout": {"checkout": 1},
+    "admin": {"admin": 1},
+    "full": {"browse": 30, "member_browse": 10, "search": 12, "filter": 18, "cart": 15, "checkout": 5, "admin": 10},
+}
+
+# Client each scenario runs as; anything not listed browses anonymously
+SCENARIO_CLIENTS = {"member_browse": "user", "cart": "user", "checkout": "user", "admin": "admin"}
+SCENARIOS_NEEDING_LOGIN = {name for name, client in SCENARIO_CLIENTS.items() if client == "user"}
+SEARCH_TERMS = ["plant", "flower", "cactus", "lily", "fern", "bonsai", "aloe", "orchid", "npk", "urea"]
+SORTS = ["newest", "price_low", "price_high", "name_asc", "name_desc"]
+CHECKOUT_FORM = {
+    "first_name": "Bench", "last_name": "User", "email": "bench@example.com",
+    "phone": "9876543210", "address": "1 Load Test Road", "city": "Pune",
+    "state": "Maharashtra", "country": "india", "postcode": "411001",
+}
+
+
+# ============================================
+# CLIENTS
+# ============================================
+
+class Result:
+    __slots__ = ("label", "status", "seconds", "queries")
+
+    def __init__(self, label, status, seconds, queries):
+        self.label = label
+        self.status = status
+        self.seconds = seconds
+        self.queries = queries
+
+
+class InProcessClient:
+    """Flask test client; logins are done by writing the Flask-Login session directly"""
+
+    def __init__(self, app, user_id=None):
+        self._client = app.test_client()
+        if user_id is not None:
+            with self._client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+
+    def request(self, method, path, data=None):
+        response = self._client.open(path, method=method, data=data)
+        body = response.get_data()
+        return response.status_code, response.headers, body
+
+
+class HttpClient:
+    """httpx client against a running server, logged in through the login forms"""
+
+    def __init__(self, base_url, login=None):
+        import httpx
+        self._client = httpx.Client(base_url=base_url, follow_redirects=False, timeout=30)
+        if login:
+            path, username, password = login
+            response = self._client.post(path, data={"username": username, "password": password})
+            if response.status_code != 302:
+                raise SystemExit(f"Login as {username} failed with HTTP {response.status_code}")
+
+    def request(self, method, path, data=None):
+        response = self._client.request(method, path, data=data)
+        return response.status_code, response.headers, response.content
+
+
+# ============================================
+# SCENARIOS
+# ============================================
+
+class Catalog:
+    """Product and category ids discovered from the shop pages"""
+
+    def __init__(self, client):
+        status, _, body = client.request("GET", "/shop?per_page=100")
+        if status != 200:
+            raise SystemExit(f"GET /shop returned HTTP {status}; is the database initialised?")
+        html = body.decode("utf-8", "replace")
+        self.product_ids = sorted({int(i) for i in re.findall(r'/shop/(\d+)', html)})
+        self.category_ids = sorted({int(i) for i in re.findall(r'[?&]category=(\d+)', html)})
+        if not self.product_ids:
+            raise SystemExit("No products found on /shop; load some data first")
+
+
+def scenario_steps(name, rng, catalog):
+    """(label, method, path, form data) steps for one visit of scenario `name`"""
+    product_id = rng.choice(catalog.product_ids)
+    if name in ("browse", "member_browse"):
+        # Logged-in pages are reported separately; they bypass the anonymous page cache
+        prefix = "member_" if name == "member_browse" else ""
+        return [
+            (f"{prefix}home", "GET", "/", None),
+            (f"{prefix}shop", "GET", "/shop", None),
+            (f"{prefix}shop_page", "GET", f"/shop?page={rng.randint(1, 3)}", None),
+            (f"{prefix}product", "GET", f"/shop/{product_id}", None),
+        ]
+    if name == "search":
+        return [("search", "GET", f"/shop?search={rng.choice(SEARCH_TERMS)}", None),
+                ("product", "GET", f"/shop/{product_id}", None)]
+    if name == "filter":
+        low = rng.choice([0, 5, 10, 15])
+        params = f"min_price={low}&max_price={low + rng.choice([10, 20, 50])}&sort={rng.choice(SORTS)}"
+        if catalog.category_ids:
+            params = f"category={rng.choice(catalog.category_ids)}&{params}"
+        return [("filter", "GET", f"/shop?{params}", None)]
+    if name == "cart":
+        return [
+            ("product", "GET", f"/shop/{product_id}", None),
+            ("add_to_cart", "POST", f"/add-to-cart/{product_id}", {"quantity": "1"}),
+            ("cart", "GET", "/cart", None),
+        ]
+    if name == "checkout":
+        return [
+            ("add_to_cart", "POST", f"/add-to-cart/{product_id}", {"quantity": "1"}),
+            ("checkout_form", "GET", "/checkout", None),
+            ("checkout_submit", "POST", "/checkout", CHECKOUT_FORM),
+        ]
+    if name == "admin":
+        return [
+            ("admin_dashboard", "GET", "/admin/dashboard", None),
+            ("admin_products", "GET", "/admin/products", None),
+            ("admin_orders", "GET", "/admin/orders", None),
+            ("admin_users", "GET", "/admin/users", None),
+        ]
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def run_worker(worker_id, clients, catalog, weights, seed, stop, results, request_limit):
+    """Visit scenarios drawn from `weights` until `stop` is set or the request limit is hit"""
+    rng = random.Random(seed + worker_id)
+    names = list(weights)
+    counts = [weights[name] for name in names]
+    local = []
+    while not stop.is_set():
+        scenario = rng.choices(names, counts)[0]
+        client = clients[SCENARIO_CLIENTS.get(scenario, "anon")]
+        for label, method, path, data in scenario_steps(scenario, rng, catalog):
+            started = time.perf_counter()
+            try:
+                status, headers, _ = client.request(method, path, data)
+            except Exception as e:
+                print(f"worker {worker_id}: {method} {path} failed: {e}", file=sys.stderr)
+                status, headers = 0, {}
+            elapsed = time.perf_counter() - started
+            queries = headers.get("X-Query-Count")
+            local.append(Result(label, status, elapsed, int(queries) if queries is not None else None))
+            if request_limit.take():
+                stop.set()
+                break
+    results.extend(local)
+
+
+class RequestLimit:
+    """Shared countdown of requests; take() returns True once the limit is reached"""
+
+    def __init__(self, limit):
+        self.remaining = limit
+        self._lock = threading.Lock()
+
+    def take(self):
+        if self.remaining is None:
+            return False
+        with self._lock:
+            self.remaining -= 1
+            return self.remaining <= 0
+
+
+# ============================================
+# REPORTING
+# ============================================
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(results, wall_seconds):
+    latencies = sorted(result.seconds * 1000 for result in results)
+    queries = [result.queries for result in results if result.queries is not None]
+    errors = sum(1 for result in results if result.status == 0 or result.status >= 500)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "throughput_rps": round(len(results) / wall_seconds, 2) if wall_seconds else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "p50": round(percentile(latencies, 0.50), 3) if latencies else None,
+            "p95": round(percentile(latencies, 0.95), 3) if latencies else None,
+            "p99": round(percentile(latencies, 0.99), 3) if latencies else None,
+            "max": round(latencies[-1], 3) if latencies else None,
+        },
+        "queries_per_request": {
+            "mean": round(sum(queries) / len(queries), 2) if queries else None,
+            "max": max(queries) if queries else None,
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report):
+    print(f"\n{'Endpoint':<18} {'Reqs':>7} {'Err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'Queries':>8}")
+    print("-" * 70)
+    rows = sorted(report["endpoints"].items()) + [("TOTAL", report["overall"])]
+    for label, stats in rows:
+        latency = stats["latency_ms"]
+        queries = stats["queries_per_request"]["mean"]
+        print(f"{label:<18} {stats['requests']:>7} {stats['errors']:>5} "
+              f"{latency['p50'] or 0:>9.2f} {latency['p95'] or 0:>9.2f} {latency['p99'] or 0:>9.2f} "
+              f"{queries if queries is not None else '-':>8}")
+    print(f"\nThroughput: {report['overall']['throughput_rps']} req/s over {report['wall_seconds']} s")
+
+
+# ============================================
+# SETUP
+# ============================================
+
+def is_site_db(database_url):
+    """True if `database_url` is the development site.db next to main.py"""
+    if not database_url.startswith('sqlite:///'):
+        return False
+    path = database_url[len('sqlite:///'):]
+    site_db = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'site.db')
+    return os.path.abspath(path) == site_db
+
+
+def in_process_clients(args, weights):
+    """Import the app with query counting on and create the benchmark users it needs"""
+    if args.database_url:
+        if is_site_db(args.database_url):
+            raise SystemExit("Refusing to benchmark against site.db; the checkout scenario writes orders")
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        # Never fall back to site.db or an inherited DATABASE_URL
+        args.scratch_dir = tempfile.mkdtemp(prefix='avanii-bench-')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(args.scratch_dir, 'bench.db')}"
+    os.environ.setdefault('QUERY_AUDIT', 'warn')
+    import logging
+    import main
+    from werkzeug.security import generate_password_hash
+
+    main.app.logger.setLevel(logging.ERROR)
+    main.Base.metadata.create_all(main.engine)
+    main.upgrade_schema()
+    if main.db_session.query(main.Product).count() == 0:
+        main.add_sample_data()
+
+    def bench_user(username, is_admin):
+        user = main.db_session.query(main.User).filter_by(username=username).first()
+        if user is None:
+            user = main.User(username=username, email=f"{username}@example.com",
+                             password_hash=generate_password_hash(os.urandom(16).hex()), is_admin=is_admin)
+            main.db_session.add(user)
+            main.db_session.commit()
+        return user.id
+
+    workers = []
+    for worker_id in range(args.concurrency):
+        needs_user = bool(SCENARIOS_NEEDING_LOGIN & set(weights))
+        user_id = bench_user(f"bench-user-{worker_id}", False) if needs_user else None
+        admin_id = bench_user("bench-admin", True) if "admin" in weights else None
+        workers.append({
+            "anon": InProcessClient(main.app),
+            "user": InProcessClient(main.app, user_id),
+            "admin": InProcessClient(main.app, admin_id),
+        })
+    return workers
+
+
+def http_clients(args, weights):
+    if SCENARIOS_NEEDING_LOGIN & set(weights) and not (args.user and args.password):
+        raise SystemExit("The member_browse, cart and checkout scenarios need --user and --password")
+    if "admin" in weights and not (args.admin_user and args.admin_password):
+        raise SystemExit("The admin scenario needs --admin-user and --admin-password")
+    workers = []
+    for _ in range(args.concurrency):
+        user_login = ("/login", args.user, args.password) if args.user else None
+        admin_login = ("/admin/login", args.admin_user, args.admin_password) if "admin" in weights else None
+        workers.append({
+            "anon": HttpClient(args.url),
+            "user": HttpClient(args.url, user_login),
+            "admin": HttpClient(args.url, admin_login),
+        })
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Avanii Shop storefront and admin routes")
+    parser.add_argument("--url", help="Base URL of a running server (default: run the app in-process)")
+    parser.add_argument("--database-url",
+                        help="In-process only: database to benchmark against (default: a temporary SQLite file)")
+    parser.add_argument("--mix", default="storefront", choices=sorted(MIXES), help="Traffic mix")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent virtual users")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests (default 1000 without --duration)")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests before the run")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the traffic")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--user", help="Shop login for the member_browse, cart and checkout scenarios")
+    parser.add_argument("--password")
+    parser.add_argument("--admin-user", help="Admin login for the admin scenario")
+    parser.add_argument("--admin-password")
+    args = parser.parse_args()
+
+    if args.requests is None and args.duration is None:
+        args.requests = 1000
+    weights = MIXES[args.mix]
+    args.scratch_dir = None
+    try:
+        run(args, weights)
+    finally:
+        if args.scratch_dir:
+            shutil.rmtree(args.scratch_dir, ignore_errors=True)
+
+
+def run(args, weights):
+    workers = http_clients(args, weights) if args.url else in_process_clients(args, weights)
+    catalog = Catalog(workers[0]["anon"])
+
+    if args.warmup:
+        warmup_stop = threading.Event()
+        run_worker(-1, workers[0], catalog, weights, args.seed, warmup_stop, [], RequestLimit(args.warmup))
+
+    results = []
+    stop = threading.Event()
+    limit = RequestLimit(args.requests)
+    threads = [
+        threading.Thread(target=run_worker, args=(worker_id, clients, catalog, weights, args.seed, stop, results, limit))
+        for worker_id, clients in enumerate(workers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    if args.duration:
+        stop.wait(args.duration)
+        stop.set()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started
+
+    by_label = {}
+    for result in results:
+        by_label.setdefault(result.label, []).append(result)
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "git_commit": git_commit(),
+            "target": args.url or "in-process",
+            "database": "temporary" if args.scratch_dir else (args.database_url if not args.url else None),
+            "mix": args.mix,
+            "weights": weights,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "products": len(catalog.product_ids),
+        },
+        "wall_seconds": round(wall_seconds, 3),
+        "overall": summarize(results, wall_seconds),
+        "endpoints": {label: summarize(items, wall_seconds) for label, items in by_label.items()},
+    }
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
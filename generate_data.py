@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Synthetic Data Generator for Avanii Shop
+Bulk-loads production-sized catalogs, users, orders and carts for benchmarking.
+
+Examples:
+    python generate_data.py --database-url sqlite:////tmp/avanii_bench.db --products 200000 --users 1000000
+    python generate_data.py --database-url postgresql://localhost/avanii_bench --reset
+
+The target must be given explicitly. The development site.db is refused unless
+--allow-site-db is passed, so a default run never fills it with synthetic rows.
+
+The same --seed always produces the same rows. Each table has its own random
+stream, so changing one volume does not change the others. PostgreSQL is loaded
+with COPY, and every other database with batched executemany INSERTs.
+
+All generated users share the password given by --password (default "benchmark"),
+because hashing a million passwords would take longer than the rest of the load.
+"""
+
+import argparse
+import bisect
+import csv
+import io
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+
+PLANT_WORDS = ["Rose", "Tulip", "Orchid", "Fern", "Cactus", "Succulent", "Bonsai", "Lily", "Aloe",
+               "Snake Plant", "Money Plant", "Tulsi", "Hibiscus", "Jasmine", "Marigold", "Areca Palm",
+               "Bamboo", "Monstera", "Pothos", "Peace Lily", "Croton", "Ixora", "Bougainvillea"]
+FERTILIZER_WORDS = ["NPK 19-19-19", "Urea", "DAP", "Potash", "Vermicompost", "Neem Cake",
+                    "Bone Meal", "Seaweed Extract", "Cow Manure", "Micronutrient Mix", "Zinc Sulphate"]
+ADJECTIVES = ["Classic", "Premium", "Dwarf", "Giant", "Variegated", "Organic", "Hybrid", "Miniature",
+              "Golden", "Red", "White", "Indoor", "Outdoor", "Hanging", "Desert", "Tropical"]
+TAG_VOCABULARY = ["indoor", "outdoor", "flower", "green", "office", "low maintenance", "medicinal",
+                  "potted", "hanging", "sun", "shade", "air purifier", "gift", "organic", "fertilizer",
+                  "nitrogen", "phosphorus", "potassium", "npk", "urea", "compost", "seasonal", "rare", "hot"]
+CITIES = [("Pune", "Maharashtra"), ("Mumbai", "Maharashtra"), ("Nagpur", "Maharashtra"),
+          ("Jaipur", "Rajasthan"), ("Lucknow", "Uttar Pradesh"), ("Patna", "Bihar"),
+          ("Bhopal", "Madhya Pradesh"), ("Indore", "Madhya Pradesh"), ("Ahmedabad", "Gujarat"),
+          ("Ludhiana", "Punjab"), ("Bengaluru", "Karnataka"), ("Chennai", "Tamil Nadu"),
+          ("Hyderabad", "Telangana"), ("Kolkata", "West Bengal"), ("Delhi", "Delhi")]
+FIRST_NAMES = ["Aarav", "Vivaan", "Aditya", "Ishaan", "Rohan", "Priya", "Ananya", "Diya", "Kavya",
+               "Meera", "Ramesh", "Suresh", "Sunita", "Geeta", "Arjun", "Lakshmi", "Harpreet", "Imran"]
+LAST_NAMES = ["Sharma", "Verma", "Patel", "Singh", "Yadav", "Reddy", "Iyer", "Das", "Khan", "Gupta",
+              "Joshi", "Patil", "Nair", "Chauhan", "Mehta"]
+ORDER_STATUSES = ["completed", "completed", "completed", "processing", "pending", "cancelled"]
+IMAGES = [f"img/bg-img/{n}.png" for n in range(40, 49)] + [f"img/bg-img/{n}.jpg" for n in range(1, 40)]
+
+NOW = datetime(2026, 1, 1)
+
+
+def zipf_cumulative_weights(n, exponent=1.1):
+    """Cumulative Zipf weights: a few items get most of the traffic, like real catalogs"""
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def pick(rng, cumulative_weights):
+    """0-based index drawn from cumulative weights with one bisect"""
+    return bisect.bisect_left(cumulative_weights, rng.random() * cumulative_weights[-1])
+
+
+def random_datetime(rng, days_back):
+    return NOW - timedelta(seconds=rng.randrange(days_back * 86400))
+
+
+# ============================================
+# ROW GENERATORS
+# ============================================
+
+def generate_categories(rng, count, first_id):
+    groups = ["Outdoor Plants", "Indoor Plants", "Office Plants", "Potted Plants", "Flowering Plants",
+              "Fertilizers", "Seeds", "Soil & Compost", "Garden Tools", "Planters"]
+    for offset in range(count):
+        category_id = first_id + offset
+        base = groups[offset % len(groups)]
+        name = base if offset < len(groups) else f"{base} {offset // len(groups) + 1}"
+        yield {"id": category_id, "name": f"{name} #{category_id}" if first_id > 1 else name,
+               "description": f"Synthetic category of {base.lower()}"}
+
+
+def generate_products(rng, count, first_id, category_ids):
+    category_weights = zipf_cumulative_weights(len(category_ids), exponent=0.8)
+    tag_weights = zipf_cumulative_weights(len(TAG_VOCABULARY), exponent=0.7)
+    for offset in range(count):
+        product_id = first_id + offset
+        if rng.random() < 0.25:
+            noun = rng.choice(FERTILIZER_WORDS)
+            kind = "fertilizer"
+        else:
+            noun = rng.choice(PLANT_WORDS)
+            kind = "plant"
+        name = f"{rng.choice(ADJECTIVES)} {noun}"
+        tags = {TAG_VOCABULARY[pick(rng, tag_weights)] for _ in range(rng.randint(2, 4))}
+        tags.add(kind)
+        # Log-normal prices cluster around ₹15 with a long tail of expensive items
+        price = min(max(round(rng.lognormvariate(2.7, 0.8)) - 0.01, 0.99), 4999.99)
+        created_at = random_datetime(rng, 3 * 365)
+        yield {
+            "id": product_id,
+            "name": name,
+            "description": f"{name} ({kind}). Synthetic product {product_id} for load testing.",
+            "price": round(price, 2),
+            "image_filename": IMAGES[product_id % len(IMAGES)],
+            "stock": 0 if rng.random() < 0.05 else rng.randint(1, 500),
+            "category_id": category_ids[pick(rng, category_weights)] if category_ids else None,
+            "sku": f"SYN{product_id:09d}",
+            "tags": ", ".join(sorted(tags)),
+            "is_featured": rng.random() < 0.02,
+            "is_hot": rng.random() < 0.05,
+            "is_sale": rng.random() < 0.10,
+            "created_at": created_at,
+            "updated_at": created_at,
+        }
+
+
+def generate_users(rng, count, first_id, password_hash):
+    for offset in range(count):
+        user_id = first_id + offset
+        yield {
+            "id": user_id,
+            "username": f"user{user_id:08d}",
+            "email": f"user{user_id:08d}@example.com",
+            "password_hash": password_hash,
+            "is_admin": False,
+        }
+
+
+def generate_orders(rng, count, first_id, first_item_id, user_ids, product_ids, prices, max_items):
+    """Yields (order row, [order item rows]); popular products appear in more orders"""
+    product_weights = zipf_cumulative_weights(len(product_ids))
+    item_id = first_item_id
+    for offset in range(count):
+        order_id = first_id + offset
+        items = []
+        seen = set()
+        for _ in range(rng.randint(1, max_items)):
+            index = pick(rng, product_weights)
+            if index in seen:
+                continue
+            seen.add(index)
+            quantity = rng.choices((1, 2, 3, 5, 10), (60, 20, 10, 7, 3))[0]
+            items.append({"id": item_id, "order_id": order_id, "product_id": product_ids[index],
+                          "quantity": quantity, "price": prices[index]})
+            item_id += 1
+        city, state = rng.choice(CITIES)
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        order = {
+            "id": order_id,
+            "user_id": rng.choice(user_ids),
+            "first_name": first_name,
+            "last_name": last_name,
+            "email": f"{first_name.lower()}.{last_name.lower()}@example.com",
+            "phone": f"9{rng.randrange(10 ** 9):09d}",
+            "telephone": None,
+            "company": None,
+            "address": f"{rng.randint(1, 999)} Main Road",
+            "city": city,
+            "state": state,
+            "country": "india",
+            "postcode": f"{rng.randint(110001, 855999)}",
+            "order_notes": None,
+            "total_amount": round(sum(item["price"] * item["quantity"] for item in items), 2),
+            "status": rng.choice(ORDER_STATUSES),
+            "created_at": random_datetime(rng, 2 * 365),
+        }
+        yield order, items
+
+
+def generate_carts(rng, count, first_id, first_item_id, user_ids, product_ids):
+    """Yields (cart row, [cart item rows]) for `count` distinct users"""
+    item_id = first_item_id
+    for offset, user_id in enumerate(rng.sample(user_ids, min(count, len(user_ids)))):
+        cart_id = first_id + offset
+        items = []
+        for product_id in rng.sample(product_ids, min(rng.randint(1, 4), len(product_ids))):
+            items.append({"id": item_id, "cart_id": cart_id, "product_id": product_id,
+                          "quantity": rng.randint(1, 3)})
+            item_id += 1
+        yield {"id": cart_id, "user_id": user_id}, items
+
+
+# ============================================
+# LOADERS
+# ============================================
+
+class BulkLoader:
+    """Buffers rows per table and writes them with COPY (PostgreSQL) or executemany INSERTs"""
+
+    def __init__(self, engine, batch_size, use_copy):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.use_copy = use_copy
+        self.buffers = {}
+        self.counts = {}
+
+    def add(self, table, row):
+        buffer = self.buffers.setdefault(table, [])
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes every buffer in one transaction, parents before children (first-added order)"""
+        with self.engine.begin() as conn:
+            for table, rows in self.buffers.items():
+                if not rows:
+                    continue
+                if self.use_copy:
+                    self._copy(conn, table, rows)
+                else:
+                    conn.execute(table.insert(), rows)
+                self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+                self.buffers[table] = []
+
+    def _copy(self, conn, table, rows):
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            # Empty unquoted fields are NULL in COPY's csv format
+            writer.writerow(["" if row[column] is None else row[column] for column in columns])
+        buffer.seek(0)
+        cursor = conn.connection.cursor()
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+
+
+def next_id(conn, table):
+    from sqlalchemy import func, select
+    return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def reset_sequences(engine, tables):
+    """Explicit ids leave PostgreSQL sequences behind; move them past the loaded rows"""
+    from sqlalchemy import text
+    with engine.begin() as conn:
+        for table in tables:
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table.name}), 1))"
+            ))
+
+
+def is_site_db(database_url):
+    """True if `database_url` is the development site.db next to main.py"""
+    if not database_url.startswith('sqlite:///'):
+        return False
+    path = database_url[len('sqlite:///'):]
+    site_db = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'site.db')
+    return os.path.abspath(path) == site_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load synthetic data for benchmarking")
+    parser.add_argument("--database-url", required=True, help="Target database, e.g. sqlite:////tmp/bench.db")
+    parser.add_argument("--allow-site-db", action="store_true", help="Allow loading into the development site.db")
+    parser.add_argument("--categories", type=int, default=40)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--orders", type=int, default=50000)
+    parser.add_argument("--max-items-per-order", type=int, default=5)
+    parser.add_argument("--active-carts", type=int, help="Users with a non-empty cart (default: 5%% of --users)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--password", default="benchmark", help="Password for every generated user")
+    parser.add_argument("--no-copy", action="store_true", help="Use INSERTs on PostgreSQL too")
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables first")
+    parser.add_argument("--yes", action="store_true", help="Do not ask before --reset drops tables")
+    args = parser.parse_args()
+
+    if is_site_db(args.database_url) and not args.allow_site_db:
+        sys.exit("Refusing to load synthetic data into site.db; pass --allow-site-db to do it anyway.")
+    os.environ['DATABASE_URL'] = args.database_url
+    from werkzeug.security import generate_password_hash
+    from main import Base, engine, User, Category, Product, Cart, CartItem, Order, OrderItem
+
+    if args.reset:
+        answer = "yes" if args.yes else input(f"This drops every table in {engine.url.render_as_string(hide_password=True)}. Type 'yes': ")
+        if answer != "yes":
+            sys.exit("Aborted.")
+        Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    is_postgres = engine.dialect.name == "postgresql"
+    use_copy = is_postgres and not args.no_copy
+    if engine.dialect.name == "sqlite":
+        from sqlalchemy import event
+
+        @event.listens_for(engine, "connect")
+        def _fast_sqlite(dbapi_connection, connection_record):
+            # Bulk load only; a crash mid-load can leave a partial database
+            dbapi_connection.execute("PRAGMA synchronous = OFF")
+            dbapi_connection.execute("PRAGMA journal_mode = MEMORY")
+        engine.dispose()
+
+    tables = {model: model.__table__ for model in (Category, Product, User, Order, OrderItem, Cart, CartItem)}
+    with engine.connect() as conn:
+        first_ids = {model: next_id(conn, table) for model, table in tables.items()}
+        existing_user_ids = [row[0] for row in conn.execute(tables[User].select().with_only_columns(tables[User].c.id))]
+        existing_carts = {row[0] for row in conn.execute(tables[Cart].select().with_only_columns(tables[Cart].c.user_id))}
+
+    loader = BulkLoader(engine, args.batch_size, use_copy)
+    started = time.perf_counter()
+
+    def stream(seed_name):
+        return random.Random(f"{args.seed}-{seed_name}")
+
+    def report(label):
+        print(f"  {label}: {loader.counts} ({time.perf_counter() - started:.1f}s)")
+
+    print(f"Loading into {engine.url.render_as_string(hide_password=True)} "
+          f"with {'COPY' if use_copy else 'batched INSERTs'}, seed {args.seed}")
+
+    category_ids = []
+    for row in generate_categories(stream("categories"), args.categories, first_ids[Category]):
+        category_ids.append(row["id"])
+        loader.add(tables[Category], row)
+    loader.flush()
+
+    product_ids, prices = [], []
+    for row in generate_products(stream("products"), args.products, first_ids[Product], category_ids):
+        product_ids.append(row["id"])
+        prices.append(row["price"])
+        loader.add(tables[Product], row)
+    loader.flush()
+    report("catalog")
+
+    password_hash = generate_password_hash(args.password)
+    user_ids = []
+    for row in generate_users(stream("users"), args.users, first_ids[User], password_hash):
+        user_ids.append(row["id"])
+        loader.add(tables[User], row)
+    loader.flush()
+    report("users")
+
+    if product_ids and (user_ids or existing_user_ids):
+        for order, items in generate_orders(stream("orders"), args.orders, first_ids[Order], first_ids[OrderItem],
+                                            user_ids or existing_user_ids, product_ids, prices,
+                                            args.max_items_per_order):
+            loader.add(tables[Order], order)
+            for item in items:
+                loader.add(tables[OrderItem], item)
+        loader.flush()
+        report("orders")
+
+        active_carts = args.active_carts if args.active_carts is not None else len(user_ids) // 20
+        cart_users = [user_id for user_id in user_ids if user_id not in existing_carts]
+        for cart, items in generate_carts(stream("carts"), active_carts, first_ids[Cart], first_ids[CartItem],
+                                          cart_users, product_ids):
+            loader.add(tables[Cart], cart)
+            for item in items:
+                loader.add(tables[CartItem], item)
+        loader.flush()
+        report("carts")
+
+    if is_postgres:
+        reset_sequences(engine, tables.values())
+        with engine.begin() as conn:
+            from sqlalchemy import text
+            conn.execute(text("ANALYZE"))
+
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
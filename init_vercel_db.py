@@ -4,13 +4,15 @@ This script creates tables and admin user for production
 """
 
 import os
-from main import Base, engine, db_session, User, Category, Product, Cart
+from main import Base, engine, db_session, upgrade_schema, User, Category, Product, Cart
 from werkzeug.security import generate_password_hash
 
 def init_database():
     """Create all database tables"""
     print("Creating database tables...")
     Base.metadata.create_all(engine)
+    # Columns added to existing tables since they were first created
+    upgrade_schema()
     print("✅ Database tables created successfully!")
 
 def create_admin_user():
@@ -1,15 +1,35 @@
-from flask import Flask, render_template, url_for, request, redirect, flash, jsonify, session as flask_session
+from flask import Flask, Response, make_response, render_template, url_for, request, redirect, flash, jsonify, stream_with_context, session as flask_session
 from flask_bootstrap import Bootstrap
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import ForeignKey, create_engine, String, Text, Float, Integer, Boolean, DateTime
-from sqlalchemy.orm import Session, relationship
+from sqlalchemy import ForeignKey, create_engine, event, insert, select, String, Text, Float, Integer, Boolean, DateTime
+from sqlalchemy.orm import Session, relationship, joinedload, selectinload, scoped_session, sessionmaker
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from werkzeug.http import parse_options_header
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.sansio import multipart
+from datetime import datetime, timedelta
 from typing import Optional
 import os
 from dotenv import load_dotenv
+import bisect
+import heapq
+import contextvars
+import cProfile
+import itertools
+import importlib
 import tempfile
+import threading
+import time
+import json
+import math
+import hashlib
+import unicodedata
+import random
+import sys
+import re
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 # Load environment variables from .env file
 load_dotenv()
@@ -33,10 +53,25 @@ if os.environ.get('DATABASE_URL'):
 else:
     # Development: Use SQLite
     app.config['SECRET_KEY'] = 'your-secret-key-here-change-in-production'
-    engine = create_engine("sqlite:///site.db", echo=True)
+    # SQL_ECHO=1 logs every statement; per-route counts and timings are on /metrics
+    engine = create_engine("sqlite:///site.db", echo=os.environ.get('SQL_ECHO') == '1')
+
+# Behind Render/Vercel set TRUSTED_PROXIES to the number of proxy hops in front of
+# the app; ProxyFix then takes remote_addr from the X-Forwarded-For entry appended
+# by the outermost trusted proxy, so clients cannot spoof it with their own header
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
 
 bootstrap = Bootstrap(app)
-db_session = Session(engine)
+# One session per thread, closed when the request ends, so concurrent requests never
+# share a transaction and a failed flush cannot poison later requests
+db_session = scoped_session(sessionmaker(bind=engine))
+
+
+@app.teardown_appcontext
+def remove_db_session(exception=None):
+    db_session.remove()
 
 
 login_manager = LoginManager()
@@ -85,6 +120,8 @@ class Product(Base):
     is_hot: Mapped[bool] = mapped_column(Boolean, default=False)
     is_sale: Mapped[bool] = mapped_column(Boolean, default=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # Set on every ORM update; catalog pages derive their ETag and Last-Modified from it
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     cart_items: Mapped[list["CartItem"]] = relationship("CartItem", back_populates="product", cascade="all, delete-orphan")
 
     def __repr__(self):
@@ -167,863 +204,3791 @@ class OrderItem(Base):
     
     def __repr__(self):
         return f"<OrderItem order_id={self.order_id} product_id={self.product_id} qty={self.quantity}>"
+
+class RecommendationCache(Base):
+    __tablename__ = 'recommendation_cache'
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)  # sha256 of the normalized input
+    user_input: Mapped[str] = mapped_column(Text, nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)  # JSON-encoded recommendation
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<RecommendationCache {self.key[:12]}>"
+
+class TranscriptCache(Base):
+    __tablename__ = 'transcript_cache'
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)  # sha256 of the audio bytes
+    model: Mapped[str] = mapped_column(String(50), nullable=False)
+    language: Mapped[str] = mapped_column(String(10), nullable=False)
+    size_bytes: Mapped[int] = mapped_column(Integer, default=0)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)  # JSON-encoded transcript, model and language
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<TranscriptCache {self.key[:12]} {self.model}/{self.language}>"
     
 
-@app.route("/")
-def home():
-    return render_template("index.html")
+# ============================================
+# REQUEST INSTRUMENTATION
+# ============================================
 
+# Cumulative-bucket metrics rendered in the Prometheus text format on /metrics
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+# When set, /metrics requires "Authorization: Bearer <token>"
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
 
-@app.route("/about")
-def about():
-    return render_template("about.html")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
 
 
-@app.route("/login", methods=['GET', 'POST'])
-def login():
-    if current_user.is_authenticated:
-        return redirect(url_for('home'))
-    
-    if request.method == 'POST':
-        username = request.form.get('username')
-        password = request.form.get('password')
-        remember = request.form.get('remember', False)
-        
-        user = db_session.query(User).filter_by(username=username).first()
-        
-        if user and check_password_hash(user.password_hash, password):
-            login_user(user, remember=remember)
-            
-            # Merge session cart with user's database cart
-            if 'cart' in flask_session and flask_session['cart']:
-                # Get or create user's cart
-                user_cart = db_session.query(Cart).filter_by(user_id=user.id).first()
-                if not user_cart:
-                    user_cart = Cart(user_id=user.id)
-                    db_session.add(user_cart)
-                    db_session.commit()
-                
-                # Merge session cart items
-                for product_id_str, quantity in flask_session['cart'].items():
-                    product_id = int(product_id_str)
-                    cart_item = db_session.query(CartItem).filter_by(
-                        cart_id=user_cart.id, 
-                        product_id=product_id
-                    ).first()
-                    
-                    if cart_item:
-                        cart_item.quantity += quantity
-                    else:
-                        cart_item = CartItem(
-                            cart_id=user_cart.id,
-                            product_id=product_id,
-                            quantity=quantity
-                        )
-                        db_session.add(cart_item)
-                
-                db_session.commit()
-                flask_session.pop('cart', None)
-            
-            flash(f'Welcome back, {user.username}!', 'success')
-            next_page = request.args.get('next')
-            return redirect(next_page) if next_page else redirect(url_for('home'))
-        else:
-            flash('Invalid username or password', 'error')
-    
-    return render_template("login.html")
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
 
 
-@app.route("/register", methods=['GET', 'POST'])
-def register():
-    if current_user.is_authenticated:
-        return redirect(url_for('home'))
-    
-    if request.method == 'POST':
-        username = request.form.get('username')
-        email = request.form.get('email')
-        password = request.form.get('password')
-        password_confirm = request.form.get('password_confirm')
-        
-        # Validation
-        if not username or not email or not password:
-            flash('All fields are required', 'error')
-            return render_template("register.html")
-        
-        if password != password_confirm:
-            flash('Passwords do not match', 'error')
-            return render_template("register.html")
-        
-        if len(password) < 6:
-            flash('Password must be at least 6 characters long', 'error')
-            return render_template("register.html")
-        
-        # Check if user already exists
-        if db_session.query(User).filter_by(username=username).first():
-            flash('Username already exists', 'error')
-            return render_template("register.html")
-        
-        if db_session.query(User).filter_by(email=email).first():
-            flash('Email already registered', 'error')
-            return render_template("register.html")
-        
-        # Create new user
-        hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
-        new_user = User(
-            username=username,
-            email=email,
-            password_hash=hashed_password
+class Counter:
+    """Monotonic counter with a fixed set of label names"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and two additions under a lock"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+request_latency = Histogram(
+    "http_request_duration_seconds", "Time spent handling a request, by route",
+    ("method", "route", "status"))
+request_queries = Histogram(
+    "db_statements_per_request", "SQL statements executed while handling one request",
+    ("route",), QUERY_COUNT_BUCKETS)
+db_statements = Counter(
+    "db_statements_total", "SQL statements executed, by route ('-' outside requests)", ("route",))
+db_time = Counter(
+    "db_time_seconds_total", "Time spent executing SQL statements, by route", ("route",))
+outbound_latency = Histogram(
+    "outbound_request_duration_seconds", "Calls to external AI services, by service and outcome",
+    ("service", "outcome"))
+metrics_registry = [request_latency, request_queries, db_statements, db_time, outbound_latency]
+
+
+class RequestMetrics:
+    """Per-request counters filled in by the engine events below"""
+    __slots__ = ("route", "started", "statements", "db_seconds")
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+
+
+# Context variables follow the request into asyncio.to_thread(), unlike thread locals
+current_request_metrics = contextvars.ContextVar("current_request_metrics", default=None)
+
+
+def start_request_metrics(route):
+    """Begin measuring a request; returns the token for finish_request_metrics()"""
+    return current_request_metrics.set(RequestMetrics(route))
+
+
+def finish_request_metrics(token, method, status):
+    metrics = current_request_metrics.get()
+    current_request_metrics.reset(token)
+    if metrics is None:
+        return
+    request_latency.observe(time.perf_counter() - metrics.started,
+                            method=method, route=metrics.route, status=str(status))
+    request_queries.observe(metrics.statements, route=metrics.route)
+
+
+class outbound_call:
+    """Context manager timing one call to an external service"""
+
+    def __init__(self, service):
+        self.service = service
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if app.config['METRICS_ENABLED']:
+            outbound_latency.observe(time.perf_counter() - self.started,
+                                     service=self.service, outcome="error" if exc_type else "ok")
+        return False
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record_statement(statement, elapsed)
+    if not app.config['METRICS_ENABLED']:
+        return
+    metrics = current_request_metrics.get()
+    route = metrics.route if metrics is not None else "-"
+    if metrics is not None:
+        metrics.statements += 1
+        metrics.db_seconds += elapsed
+    db_statements.inc(route=route)
+    db_time.inc(elapsed, route=route)
+
+
+@event.listens_for(engine, "handle_error")
+def _handle_cursor_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def request_route_label():
+    """URL rule of the current request, so /shop/1 and /shop/2 share one series"""
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+@app.before_request
+def begin_request_metrics():
+    if app.config['METRICS_ENABLED']:
+        request.environ['avanii.metrics_token'] = start_request_metrics(request_route_label())
+
+
+@app.after_request
+def end_request_metrics(response):
+    token = request.environ.pop('avanii.metrics_token', None)
+    if token is not None:
+        finish_request_metrics(token, request.method, response.status_code)
+    return response
+
+
+@app.teardown_request
+def abort_request_metrics(error=None):
+    # Only still set when an unhandled exception skipped after_request
+    token = request.environ.pop('avanii.metrics_token', None)
+    if token is not None:
+        finish_request_metrics(token, request.method, 500)
+
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus scrape endpoint"""
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return Response("Unauthorized\n", status=401, mimetype='text/plain')
+    lines = []
+    for metric in metrics_registry:
+        lines.extend(metric.render())
+    return Response("\n".join(lines) + "\n", mimetype='text/plain; version=0.0.4')
+
+
+# ============================================
+# QUERY AUDIT (DEVELOPMENT AND TESTS)
+# ============================================
+
+# 'warn' logs lazy loads, repeated statements and budget overruns; 'raise' also fails
+# requests that go over their query budget (for tests). Anything else disables the audit.
+app.config['QUERY_AUDIT'] = os.environ.get('QUERY_AUDIT', '')
+# A statement run this many times in one request, with different parameters, is flagged
+app.config['QUERY_AUDIT_REPEAT_THRESHOLD'] = int(os.environ.get('QUERY_AUDIT_REPEAT_THRESHOLD', 3))
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in QUERY_AUDIT=raise mode when a view runs more SQL statements than its budget"""
+
+
+class QueryAudit:
+    """Statements and lazy loads seen while handling one request"""
+    __slots__ = ("statements", "by_statement", "lazy_loads")
+
+    def __init__(self):
+        self.statements = 0
+        self.by_statement = {}  # SQL text -> executions
+        self.lazy_loads = {}    # "Model.relationship" -> loads that hit the database
+
+    def report(self, route, budget, repeat_threshold):
+        repeated = sorted(
+            ((count, statement) for statement, count in self.by_statement.items() if count >= repeat_threshold),
+            reverse=True
         )
-        db_session.add(new_user)
-        db_session.commit()
-        
-        # Create cart for user
-        user_cart = Cart(user_id=new_user.id)
-        db_session.add(user_cart)
-        db_session.commit()
-        
-        flash('Registration successful! Please login.', 'success')
-        return redirect(url_for('login'))
-    
-    return render_template("register.html")
+        return {
+            "route": route,
+            "statements": self.statements,
+            "budget": budget,
+            "over_budget": budget is not None and self.statements > budget,
+            "lazy_loads": dict(self.lazy_loads),
+            "repeated_statements": [
+                {"count": count, "statement": " ".join(statement.split())[:200]}
+                for count, statement in repeated
+            ],
+        }
 
 
-@app.route("/logout")
-@login_required
-def logout():
-    logout_user()
-    flash('You have been logged out', 'info')
-    return redirect(url_for('home'))
+current_query_audit = contextvars.ContextVar("current_query_audit", default=None)
+# Most recent reports, newest last, for /admin/api/query-audit
+query_audit_reports = deque(maxlen=100)
 
 
-@app.route("/shop")
-def shop():
-    # Get filter parameters
-    category_filter = request.args.get('category', type=int)
-    min_price = request.args.get('min_price', type=float)
-    max_price = request.args.get('max_price', type=float)
-    sort_by = request.args.get('sort', 'newest')
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 9, type=int)
-    search = request.args.get('search', '')
-
-    # Get price range from all products for slider
-    from sqlalchemy import func
-    price_range = db_session.query(
-        func.min(Product.price).label('min_price'),
-        func.max(Product.price).label('max_price')
-    ).first()
-    
-    # Set default price range if no products exist
-    price_min = price_range.min_price if price_range.min_price else 0
-    price_max = price_range.max_price if price_range.max_price else 100
-    
-    # Use filtered values if provided, otherwise use full range
-    filter_min = min_price if min_price is not None else price_min
-    filter_max = max_price if max_price is not None else price_max
+def query_audit_enabled():
+    return app.config['QUERY_AUDIT'] in ('warn', 'raise')
 
-    # Base query
-    query = db_session.query(Product)
 
-    # Apply filters
-    if category_filter:
-        query = query.filter(Product.category_id == category_filter)
-    
-    if min_price is not None:
-        query = query.filter(Product.price >= min_price)
-    
-    if max_price is not None:
-        query = query.filter(Product.price <= max_price)
-    
-    if search:
-        query = query.filter(Product.name.ilike(f'%{search}%'))
-
-    # Apply sorting
-    if sort_by == 'price_low':
-        query = query.order_by(Product.price.asc())
-    elif sort_by == 'price_high':
-        query = query.order_by(Product.price.desc())
-    elif sort_by == 'name_asc':
-        query = query.order_by(Product.name.asc())
-    elif sort_by == 'name_desc':
-        query = query.order_by(Product.name.desc())
-    else:  # newest
-        query = query.order_by(Product.created_at.desc())
-
-    # Get total count before pagination
-    total = query.count()
-    
-    # Apply pagination
-    products = query.limit(per_page).offset((page - 1) * per_page).all()
-    
-    # Get all categories for sidebar
-    categories = db_session.query(Category).all()
-    
-    # Get best sellers (top 3 featured products)
-    best_sellers = db_session.query(Product).filter(Product.is_featured == True).limit(3).all()
-    
-    # Calculate pagination info
-    total_pages = (total + per_page - 1) // per_page
-    start_item = (page - 1) * per_page + 1
-    end_item = min(page * per_page, total)
-    
-    return render_template("shop.html", 
-                         products=products,
-                         categories=categories,
-                         best_sellers=best_sellers,
-                         total=total,
-                         page=page,
-                         per_page=per_page,
-                         total_pages=total_pages,
-                         start_item=start_item,
-                         end_item=end_item,
-                         sort_by=sort_by,
-                         category_filter=category_filter,
-                         price_min=int(price_min),
-                         price_max=int(price_max),
-                         filter_min=int(filter_min),
-                         filter_max=int(filter_max))
+def query_budget(max_statements):
+    """Declare how many SQL statements a view may run; enforced when QUERY_AUDIT is on"""
+    def decorator(f):
+        f.query_budget = max_statements
+        return f
+    return decorator
 
-@app.route("/shop/<int:product_id>")
-def shop_details(product_id):
-    product = db_session.get(Product, product_id)
-    if not product:
-        flash("Product not found", "error")
-        return redirect(url_for('shop'))
+
+@event.listens_for(engine, "before_cursor_execute")
+def _audit_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    audit = current_query_audit.get()
+    if audit is not None:
+        audit.statements += 1
+        audit.by_statement[statement] = audit.by_statement.get(statement, 0) + 1
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _audit_lazy_load(orm_execute_state):
+    audit = current_query_audit.get()
+    if audit is None or not orm_execute_state.is_select or orm_execute_state.lazy_loaded_from is None:
+        return
+    # The last path element is the relationship being loaded, e.g. Product.category
+    relationship_name = str(orm_execute_state.loader_strategy_path[-1])
+    audit.lazy_loads[relationship_name] = audit.lazy_loads.get(relationship_name, 0) + 1
+
+
+@app.before_request
+def begin_query_audit():
+    if query_audit_enabled():
+        request.environ['avanii.query_audit_token'] = current_query_audit.set(QueryAudit())
+
+
+@app.after_request
+def end_query_audit(response):
+    token = request.environ.pop('avanii.query_audit_token', None)
+    if token is None:
+        return response
+    audit = current_query_audit.get()
+    current_query_audit.reset(token)
     
-    # Get related products (same category, exclude current product)
-    related_products = []
-    if product.category_id:
-        related_products = db_session.query(Product).filter(
-            Product.category_id == product.category_id,
-            Product.id != product_id
-        ).limit(4).all()
+    view = app.view_functions.get(request.endpoint)
+    report = audit.report(request_route_label(), getattr(view, 'query_budget', None),
+                          app.config['QUERY_AUDIT_REPEAT_THRESHOLD'])
+    query_audit_reports.append(report)
     
-    return render_template("shop-details.html", product=product, related_products=related_products)
+    response.headers['X-Query-Count'] = str(report["statements"])
+    if report["budget"] is not None:
+        response.headers['X-Query-Budget'] = str(report["budget"])
+    if report["over_budget"] or report["lazy_loads"] or report["repeated_statements"]:
+        app.logger.warning("Query audit for %s: %s", report["route"], json.dumps(report))
+    if report["over_budget"] and app.config['QUERY_AUDIT'] == 'raise':
+        raise QueryBudgetExceeded(
+            f"{report['route']} ran {report['statements']} SQL statements, budget is {report['budget']}"
+        )
+    return response
 
-@app.route("/add-to-cart/<int:product_id>", methods=['POST'])
-def add_to_cart(product_id):
-    # Check if user is logged in
-    if not current_user.is_authenticated:
-        flash('You should login first to add items to cart', 'error')
+
+# ============================================
+# REQUEST PROFILER
+# ============================================
+
+# Profiles are written to PROFILE_DIR/<route>/ as collapsed stacks (flamegraph.pl,
+# speedscope) or cProfile dumps (pstats, snakeviz), each with a .sql.json breakdown
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.root_path, 'profiles'))
+# Fraction of all requests to profile in collapsed mode (0 = only on admin request)
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+# Seconds between stack samples in collapsed mode
+app.config['PROFILE_INTERVAL'] = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+# Profiles kept per route directory; older ones are deleted as new ones are saved
+app.config['PROFILE_MAX_FILES'] = int(os.environ.get('PROFILE_MAX_FILES', 100))
+
+PROFILE_MODES = {"1": "collapsed", "collapsed": "collapsed", "cprofile": "cprofile"}
+PROFILE_SUFFIXES = (".prof", ".collapsed", ".sql.json")
+
+# cProfile hooks the whole interpreter and only one profiler can be enabled at a
+# time (Python 3.12+ raises on the second), so cProfile captures take turns
+_cprofile_lock = threading.Lock()
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack every `interval` seconds from a helper
+    thread and counts identical stacks, root first, in collapsed-stack form.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = {}  # "root;...;leaf" -> count
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.samples.items()))
+
+
+class RequestProfile:
+    """
+    One profiled request: the stack profiler plus every SQL statement and its duration.
+    A cProfile request that overlaps another one is sampled in collapsed mode instead.
+    """
+
+    def __init__(self, mode, route):
+        self.mode = mode
+        self.route = route
+        self.started = time.perf_counter()
+        self.statements = {}  # SQL text -> [executions, total seconds, slowest]
+        if mode == "cprofile" and not self._start_cprofile():
+            self.mode = "collapsed"
+        if self.mode == "collapsed":
+            self._profiler = StackSampler(threading.get_ident(), app.config['PROFILE_INTERVAL'])
+            self._profiler.start()
+
+    def _start_cprofile(self):
+        if not _cprofile_lock.acquire(blocking=False):
+            return False
+        try:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) is already active
+            _cprofile_lock.release()
+            return False
+        return True
+
+    def record_statement(self, statement, elapsed):
+        entry = self.statements.get(statement)
+        if entry is None:
+            entry = self.statements[statement] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+
+    def stop(self):
+        if self.mode == "cprofile":
+            self._profiler.disable()
+            _cprofile_lock.release()
+        else:
+            self._profiler.stop()
+        self.duration = time.perf_counter() - self.started
+
+    def sql_breakdown(self):
+        rows = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            "statements": sum(entry[0] for _, entry in rows),
+            "db_ms": round(sum(entry[1] for _, entry in rows) * 1000, 3),
+            "by_statement": [
+                {"statement": " ".join(statement.split()), "count": count,
+                 "total_ms": round(total * 1000, 3), "max_ms": round(slowest * 1000, 3)}
+                for statement, (count, total, slowest) in rows
+            ],
+        }
+
+    def save(self, method, url, status):
+        """Write the profile and its SQL breakdown; returns the file name stem"""
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', self.route).strip('_') or 'index'
+        directory = os.path.join(app.config['PROFILE_DIR'], slug)
+        os.makedirs(directory, exist_ok=True)
+        stem = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{os.urandom(3).hex()}"
+        path = os.path.join(directory, stem)
+        
+        if self.mode == "cprofile":
+            self._profiler.dump_stats(path + ".prof")
+        else:
+            with open(path + ".collapsed", "w") as f:
+                f.write(self._profiler.collapsed())
+        
+        summary = {
+            "profile": f"{slug}/{stem}",
+            "mode": self.mode,
+            "route": self.route,
+            "method": method,
+            "url": url,
+            "status": status,
+            "duration_ms": round(self.duration * 1000, 3),
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        with open(path + ".sql.json", "w") as f:
+            json.dump(dict(summary, sql=self.sql_breakdown()), f, indent=2)
+        recent_profiles.append(summary)
+        prune_profiles(directory, app.config['PROFILE_MAX_FILES'])
+        return summary["profile"]
+
+
+def prune_profiles(directory, keep):
+    """Delete all but the newest `keep` profiles in one route directory"""
+    # Stems start with a UTC timestamp, so name order is age order
+    stems = sorted(name[:-len(".sql.json")] for name in os.listdir(directory) if name.endswith(".sql.json"))
+    for stem in stems[:max(len(stems) - keep, 0)]:
+        for suffix in PROFILE_SUFFIXES:
+            try:
+                os.remove(os.path.join(directory, stem + suffix))
+            except FileNotFoundError:
+                pass
+
+
+current_profile = contextvars.ContextVar("current_profile", default=None)
+# Most recent profiles, newest last, for /admin/api/profiles
+recent_profiles = deque(maxlen=50)
+
+
+def requested_profile_mode():
+    """Profiling mode for the current request, or None to run it unprofiled"""
+    flag = request.headers.get('X-Profile') or request.args.get('_profile')
+    if flag:
+        mode = PROFILE_MODES.get(flag.lower())
+        # Only administrators may ask for a profile
+        if mode and current_user.is_authenticated and current_user.is_admin:
+            return mode
+        return None
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    if rate > 0 and random.random() < rate:
+        return "collapsed"
+    return None
+
+
+@app.before_request
+def begin_request_profile():
+    mode = requested_profile_mode()
+    if mode:
+        profile = RequestProfile(mode, request_route_label())
+        request.environ['avanii.profile'] = (profile, current_profile.set(profile))
+
+
+def _finish_request_profile(status):
+    profile, token = request.environ.pop('avanii.profile', (None, None))
+    if profile is None:
+        return None
+    current_profile.reset(token)
+    profile.stop()
+    try:
+        return profile.save(request.method, request.full_path.rstrip('?'), status)
+    except OSError as e:
+        app.logger.warning("Profile write error: %s", e)
+        return None
+
+
+@app.after_request
+def end_request_profile(response):
+    name = _finish_request_profile(response.status_code)
+    if name:
+        response.headers['X-Profile'] = name
+    return response
+
+
+@app.teardown_request
+def abort_request_profile(error=None):
+    # Still set only when an unhandled exception skipped after_request
+    _finish_request_profile(500)
+
+
+# ============================================
+# CATALOG VERSION AND LISTING CACHE
+# ============================================
+
+class MemoryCatalogVersionStore:
+    """Version counter for a single process"""
+
+    shared = False
+
+    def __init__(self):
+        # Starts from the clock so a restarted process never reissues an ETag from before the restart
+        self._version = time.time_ns() // 1000
+        self._lock = threading.Lock()
+
+    def get(self):
+        return self._version
+
+    def incr(self):
+        with self._lock:
+            self._version += 1
+            return self._version
+
+
+class RedisCatalogVersionStore:
+    """Shared version counter so a write in one worker invalidates every worker's caches"""
+
+    shared = True
+
+    def __init__(self, redis_url, key='avanii:catalog-version'):
+        import redis
+        self._redis = redis.Redis.from_url(redis_url)
+        self._key = key
+
+    def get(self):
+        return int(self._redis.get(self._key) or 0)
+
+    def incr(self):
+        return self._redis.incr(self._key)
+
+
+class CatalogVersion:
+    """
+    Number that changes whenever a product or category write is committed.
+    Catalog caches tag their entries with it, so one bump invalidates them all.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.stats = {"bumps": 0, "errors": 0}
+
+    def current(self):
+        """The current version, or None if it cannot be read (callers then skip caching)"""
+        try:
+            return self.store.get()
+        except Exception as e:
+            self.stats["errors"] += 1
+            app.logger.warning("Catalog version read error: %s", e)
+            return None
+
+    def bump(self):
+        self.stats["bumps"] += 1
+        try:
+            self.store.incr()
+        except Exception as e:
+            self.stats["errors"] += 1
+            app.logger.warning("Catalog version write error: %s", e)
+
+    def snapshot(self):
+        data = dict(self.stats)
+        data["version"] = self.current()
+        data["backend"] = type(self.store).__name__
+        return data
+
+
+def _make_catalog_version_store():
+    """Use Redis when CATALOG_REDIS_URL is set and the client is installed"""
+    redis_url = os.environ.get('CATALOG_REDIS_URL')
+    if redis_url:
+        try:
+            return RedisCatalogVersionStore(redis_url)
+        except ImportError:
+            app.logger.warning("CATALOG_REDIS_URL set but redis is not installed, using in-process catalog version")
+    return MemoryCatalogVersionStore()
+
+
+catalog_version = CatalogVersion(_make_catalog_version_store())
+CATALOG_MAPPERS = (Product.__mapper__, Category.__mapper__)
+
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+@event.listens_for(Product, 'after_delete')
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def _catalog_row_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['catalog_changed'] = True
+        if isinstance(target, Product):
+            session.info.setdefault('changed_product_ids', set()).add(target.id)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _catalog_bulk_write(orm_execute_state):
+    """Bulk insert/update/delete statements skip the mapper events above"""
+    if orm_execute_state.is_select:
+        return
+    if orm_execute_state.bind_mapper in CATALOG_MAPPERS:
+        orm_execute_state.session.info['catalog_changed'] = True
+        if orm_execute_state.bind_mapper is Product.__mapper__:
+            # The affected rows are unknown, so product indexes must be rebuilt
+            orm_execute_state.session.info['products_bulk_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_catalog_version(session):
+    # Bumped only after the commit, so a reader that sees the new version also sees the new rows
+    if session.info.pop('catalog_changed', False):
+        catalog_version.bump()
+        product_ids = session.info.pop('changed_product_ids', ())
+        rebuild = session.info.pop('products_bulk_changed', False)
+        suggest_index.products_changed(product_ids, rebuild=rebuild)
+        product_index.products_changed(product_ids, rebuild=rebuild)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_catalog_change(session):
+    for name in ('catalog_changed', 'changed_product_ids', 'products_bulk_changed'):
+        session.info.pop(name, None)
+
+
+class CatalogResultCache:
+    """
+    LRU of values computed from the catalog, tagged with the catalog version
+    they were computed at. An entry from an older version is a miss and is
+    dropped. The TTL bounds staleness when writes happen in another process
+    and no shared version store is configured. `max_bytes` optionally bounds
+    the summed sizes passed to put(), evicting least recently used entries.
+    """
+
+    def __init__(self, name, max_entries, ttl, max_bytes=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (version, expires_at, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "stores": 0, "evictions": 0, "too_large": 0}
+
+    def get(self, key, version):
+        if version is None or not self.max_entries:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == version and entry[1] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry[2]
+                self._bytes -= self._entries.pop(key)[3]
+                self.stats["stale"] += 1
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key, version, value, size=0):
+        if version is None or not self.max_entries:
+            return
+        if self.max_bytes is not None and size > self.max_bytes:
+            self.stats["too_large"] += 1
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[3]
+            self._entries[key] = (version, time.monotonic() + self.ttl, value, size)
+            self._bytes += size
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._bytes -= self._entries.popitem(last=False)[1][3]
+                self.stats["evictions"] += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        Cached value for key at the current catalog version. On a miss it is
+        computed with compute(version) and stored under that version.
+        """
+        version = catalog_version.current()
+        value = self.get(key, version)
+        if value is None:
+            value = compute(version)
+            self.put(key, version, value)
+        return value
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+            data["entries"] = len(self._entries)
+            data["bytes"] = self._bytes
+        lookups = data["hits"] + data["misses"]
+        data["hit_ratio"] = round(data["hits"] / lookups, 4) if lookups else 0.0
+        data["max_entries"] = self.max_entries
+        data["max_bytes"] = self.max_bytes
+        data["ttl_seconds"] = self.ttl
+        return data
+
+
+# Product ids and totals for /shop filter combinations (0 entries disables the cache)
+listing_cache = CatalogResultCache(
+    "shop_listing",
+    max_entries=int(os.environ.get('SHOP_LISTING_CACHE_SIZE', 2048)),
+    ttl=float(os.environ.get('SHOP_LISTING_CACHE_TTL', 300)),
+)
+
+# Names sort by code point everywhere: SQLite's default BINARY collation already
+# does, PostgreSQL would otherwise use the database locale, and the NumPy
+# snapshot sorts Python strings, so both listing paths return the same pages
+SHOP_NAME_SORT = Product.name.collate('C') if engine.dialect.name == 'postgresql' else Product.name
+
+SHOP_SORT_ORDERS = {
+    'newest': (Product.created_at.desc(), Product.id.desc()),
+    'price_low': (Product.price.asc(), Product.id.asc()),
+    'price_high': (Product.price.desc(), Product.id.asc()),
+    'name_asc': (SHOP_NAME_SORT.asc(), Product.id.asc()),
+    'name_desc': (SHOP_NAME_SORT.desc(), Product.id.asc()),
+}
+SHOP_MAX_PER_PAGE = 100
+
+
+def normalize_shop_filters(args):
+    """
+    The /shop filter tuple with equivalent URLs mapped to the same value:
+    (category, min_price, max_price, sort, page, per_page, search)
+    """
+    category = args.get('category', type=int) or None
+    min_price = args.get('min_price', type=float)
+    max_price = args.get('max_price', type=float)
+    sort_by = args.get('sort', 'newest')
+    if sort_by not in SHOP_SORT_ORDERS:
+        sort_by = 'newest'
+    page = max(args.get('page', 1, type=int), 1)
+    per_page = min(max(args.get('per_page', 9, type=int), 1), SHOP_MAX_PER_PAGE)
+    search = ' '.join(args.get('search', '').split()).lower()
+    return (
+        category,
+        round(min_price, 2) if min_price is not None else None,
+        round(max_price, 2) if max_price is not None else None,
+        sort_by, page, per_page, search,
+    )
+
+
+def filtered_products_query(category, min_price, max_price, search):
+    query = db_session.query(Product)
+    if category:
+        query = query.filter(Product.category_id == category)
+    if min_price is not None:
+        query = query.filter(Product.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Product.price <= max_price)
+    if search:
+        # A literal substring match: % and _ typed by the shopper are not wildcards
+        query = query.filter(Product.name.icontains(search, autoescape=True))
+    return query
+
+
+def shop_listing(filters):
+    """(product ids for the page, total matching products), cached per filter tuple"""
+    category, min_price, max_price, sort_by, page, per_page, search = filters
+
+    def compute(version):
+        snapshot = catalog_snapshot(version)
+        if snapshot is not None:
+            return snapshot.listing(filters)
+        query = filtered_products_query(category, min_price, max_price, search)
+        total = query.count()
+        ids = query.with_entities(Product.id).order_by(*SHOP_SORT_ORDERS[sort_by]) \
+            .limit(per_page).offset((page - 1) * per_page).all()
+        return tuple(row.id for row in ids), total
+
+    return listing_cache.get_or_compute(filters, compute)
+
+
+def products_by_ids(product_ids):
+    """Products in the order of product_ids, skipping any deleted since they were cached"""
+    if not product_ids:
+        return []
+    found = {product.id: product for product in db_session.query(Product).filter(Product.id.in_(product_ids))}
+    return [found[product_id] for product_id in product_ids if product_id in found]
+
+
+def catalog_summary():
+    """
+    (lowest price, highest price, product count per category, latest product update),
+    cached per catalog version
+    """
+    from sqlalchemy import func
+
+    def compute(version):
+        snapshot = catalog_snapshot(version)
+        if snapshot is not None:
+            return snapshot.summary()
+        summary = db_session.query(
+            func.min(Product.price), func.max(Product.price), func.max(Product.updated_at)
+        ).first()
+        category_counts = dict(
+            db_session.query(Product.category_id, func.count(Product.id)).group_by(Product.category_id).all()
+        )
+        return summary[0], summary[1], category_counts, summary[2]
+
+    return listing_cache.get_or_compute(('catalog_summary',), compute)
+
+
+PRICE_HISTOGRAM_MAX_BUCKETS = 100
+
+
+def price_histogram(category, search, buckets):
+    """
+    Product counts per equal-width price bucket over the whole catalog's price
+    range (the slider's range), for products matching category and search.
+    Cached per (category, search, buckets) and catalog version.
+    """
+    from sqlalchemy import cast, func
+
+    def compute(version):
+        price_min, price_max = catalog_summary()[:2]
+        low = math.floor(price_min or 0)
+        high = max(math.ceil(price_max or 0), low + 1)
+        width = (high - low) / buckets
+        snapshot = catalog_snapshot(version)
+        if snapshot is not None:
+            counts = snapshot.price_histogram(category, search, low, width, buckets)
+        else:
+            offset = (Product.price - low) / width
+            # CAST truncates in SQLite, which matches floor for the non-negative offsets here
+            bucket = func.floor(offset) if engine.dialect.name == 'postgresql' else cast(offset, Integer)
+            counts = [0] * buckets
+            rows = filtered_products_query(category, None, None, search) \
+                .with_entities(bucket, func.count(Product.id)).group_by(bucket).all()
+            for index, count in rows:
+                # The highest price lands exactly on the upper edge; count it in the last bucket
+                counts[min(max(int(index), 0), buckets - 1)] += count
+        return {
+            "min": low,
+            "max": high,
+            "bucket_width": width,
+            "edges": [round(low + width * index, 2) for index in range(buckets + 1)],
+            "counts": counts,
+            "total": sum(counts),
+        }
+
+    return listing_cache.get_or_compute(('price_histogram', category, search, buckets), compute)
+
+
+# ============================================
+# COLUMNAR CATALOG SNAPSHOT (OPTIONAL, NUMPY)
+# ============================================
+
+class CatalogSnapshot:
+    """
+    Immutable, array-backed copy of the product columns /shop filters and
+    sorts on, answering listing and summary queries with vectorized NumPy
+    operations. Every sort order is precomputed as a permutation, so a query
+    is one boolean mask plus a gather. Equal sort keys fall back to the same
+    id tiebreakers as SHOP_SORT_ORDERS, so pages match the SQL path.
+    """
+
+    def __init__(self, np, version, rows):
+        self.np = np
+        self.version = version
+        count = len(rows)
+        self.ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=count)
+        self.prices = np.fromiter((row.price for row in rows), dtype=np.float64, count=count)
+        # -1 stands in for "no category"
+        self.category_ids = np.fromiter(
+            (row.category_id if row.category_id is not None else -1 for row in rows), dtype=np.int64, count=count
+        )
+        self.created_at = np.fromiter(
+            (int(row.created_at.timestamp() * 1000000) if row.created_at else 0 for row in rows),
+            dtype=np.int64, count=count
+        )
+        self.is_featured = np.fromiter((bool(row.is_featured) for row in rows), dtype=bool, count=count)
+        self.is_hot = np.fromiter((bool(row.is_hot) for row in rows), dtype=bool, count=count)
+        self.is_sale = np.fromiter((bool(row.is_sale) for row in rows), dtype=bool, count=count)
+        # Lowercased names joined by newlines: a substring search is a scan with str.find,
+        # and name_starts maps each match offset back to its row
+        search_names = [(row.name or '').lower().replace('\n', ' ') for row in rows]
+        self.search_text = '\n'.join(search_names)
+        self.name_starts = np.zeros(count, dtype=np.int64)
+        if count > 1:
+            np.cumsum(np.fromiter((len(name) + 1 for name in search_names[:-1]), dtype=np.int64, count=count - 1),
+                      out=self.name_starts[1:])
+        self.last_modified = max((row.updated_at for row in rows if row.updated_at), default=None)
+
+        # Equal names share a rank so ties are broken by id, as in SQL
+        name_ranks = {name: rank for rank, name in enumerate(sorted({row.name for row in rows}))}
+        name_rank = np.fromiter((name_ranks[row.name] for row in rows), dtype=np.int64, count=count)
+        # np.lexsort sorts by the last key first
+        self.orders = {
+            'newest': np.lexsort((-self.ids, -self.created_at)),
+            'price_low': np.lexsort((self.ids, self.prices)),
+            'price_high': np.lexsort((self.ids, -self.prices)),
+            'name_asc': np.lexsort((self.ids, name_rank)),
+            'name_desc': np.lexsort((self.ids, -name_rank)),
+        }
+        for array in (self.ids, self.prices, self.category_ids, self.created_at, self.name_starts,
+                      self.is_featured, self.is_hot, self.is_sale, *self.orders.values()):
+            array.flags.writeable = False
+
+    def mask(self, category, min_price, max_price, search):
+        """Boolean array of the products passing the /shop filters"""
+        np = self.np
+        mask = np.ones(self.ids.size, dtype=bool)
+        if category:
+            mask &= self.category_ids == category
+        if min_price is not None:
+            mask &= self.prices >= min_price
+        if max_price is not None:
+            mask &= self.prices <= max_price
+        if search:
+            mask &= self.name_mask(search)
+        return mask
+
+    def name_mask(self, search):
+        """Products whose lowercased name contains `search` (no newlines, as normalize_shop_filters gives)"""
+        np = self.np
+        text = self.search_text
+        offsets = []
+        position = text.find(search)
+        while position != -1:
+            offsets.append(position)
+            # One match per product is enough, so continue from the next name
+            next_name = text.find('\n', position)
+            if next_name == -1:
+                break
+            position = text.find(search, next_name + 1)
+        mask = np.zeros(self.ids.size, dtype=bool)
+        if offsets:
+            mask[np.searchsorted(self.name_starts, np.array(offsets, dtype=np.int64), side='right') - 1] = True
+        return mask
+
+    def listing(self, filters):
+        """Same result as the SQL listing: (product ids for the page, total)"""
+        category, min_price, max_price, sort_by, page, per_page, search = filters
+        mask = self.mask(category, min_price, max_price, search)
+        order = self.orders[sort_by]
+        matching = order[mask[order]]
+        start = (page - 1) * per_page
+        return tuple(self.ids[matching[start:start + per_page]].tolist()), int(matching.size)
+
+    def price_histogram(self, category, search, low, width, buckets):
+        """Product count per price bucket for the filtered products, in one vectorized pass"""
+        np = self.np
+        prices = self.prices[self.mask(category, None, None, search)]
+        indexes = np.minimum(np.floor((prices - low) / width).astype(np.int64), buckets - 1)
+        return np.bincount(np.maximum(indexes, 0), minlength=buckets).tolist()
+
+    def summary(self):
+        """Same result as the SQL catalog summary"""
+        if not self.ids.size:
+            return None, None, {}, None
+        categories, counts = self.np.unique(self.category_ids, return_counts=True)
+        category_counts = {
+            (category if category != -1 else None): count
+            for category, count in zip(categories.tolist(), counts.tolist())
+        }
+        return float(self.prices.min()), float(self.prices.max()), category_counts, self.last_modified
+
+
+class CatalogSnapshotEngine:
+    """
+    Holds the current CatalogSnapshot and replaces it when the catalog version
+    changes. A new snapshot is built completely before the reference is
+    swapped, so readers always see one consistent version. While one thread
+    is rebuilding, other requests fall back to SQL rather than wait.
+    """
+
+    COLUMNS = (Product.id, Product.price, Product.category_id, Product.created_at, Product.updated_at,
+               Product.name, Product.is_featured, Product.is_hot, Product.is_sale)
+
+    def __init__(self, np):
+        self.np = np
+        self._snapshot = None
+        self._build_lock = threading.Lock()
+        self.stats = {"builds": 0, "fallbacks": 0, "last_build_seconds": 0.0}
+
+    def current(self, version):
+        """Snapshot of the catalog at `version`, or None if the caller should use SQL"""
+        if version is None:
+            return None
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        if not self._build_lock.acquire(blocking=False):
+            self.stats["fallbacks"] += 1
+            return None
+        try:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                started = time.perf_counter()
+                with Session(engine) as snapshot_session:
+                    rows = snapshot_session.execute(select(*self.COLUMNS)).all()
+                snapshot = CatalogSnapshot(self.np, version, rows)
+                self._snapshot = snapshot
+                self.stats["builds"] += 1
+                self.stats["last_build_seconds"] = round(time.perf_counter() - started, 4)
+            return snapshot
+        finally:
+            self._build_lock.release()
+
+    def snapshot(self):
+        data = dict(self.stats)
+        current = self._snapshot
+        data["version"] = current.version if current is not None else None
+        data["products"] = int(current.ids.size) if current is not None else 0
+        return data
+
+
+def _make_catalog_snapshot_engine():
+    """NumPy snapshot when CATALOG_SNAPSHOT=1 and numpy is installed, otherwise /shop uses SQL only"""
+    if os.environ.get('CATALOG_SNAPSHOT') != '1':
+        return None
+    try:
+        import numpy
+    except ImportError:
+        app.logger.warning("CATALOG_SNAPSHOT=1 but numpy is not installed, /shop listings will query the database")
+        return None
+    return CatalogSnapshotEngine(numpy)
+
+
+catalog_snapshots = _make_catalog_snapshot_engine()
+
+
+def catalog_snapshot(version):
+    return catalog_snapshots.current(version) if catalog_snapshots is not None else None
+
+
+# ============================================
+# ANONYMOUS PAGE CACHE
+# ============================================
+
+# Endpoints that render the same HTML for every visitor without a session
+PAGE_CACHE_ENDPOINTS = {'home', 'about', 'shop', 'shop_details', 'fertilizer_advisor'}
+# Response headers replayed from a cached page; instrumentation headers are added fresh per request
+PAGE_CACHE_HEADERS = ('Content-Type', 'Vary', 'ETag', 'Last-Modified', 'Cache-Control')
+
+# Whole rendered responses for anonymous GETs, evicted least recently used beyond PAGE_CACHE_MAX_BYTES
+page_cache = CatalogResultCache(
+    "anonymous_pages",
+    max_entries=int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 10000)),
+    ttl=float(os.environ.get('PAGE_CACHE_TTL', 60)),
+    max_bytes=int(os.environ.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+)
+
+
+def page_cache_key():
+    """Cache key for the current request, or None if it must be rendered for this visitor"""
+    if not page_cache.max_bytes or request.method not in ('GET', 'HEAD'):
+        return None
+    if request.endpoint not in PAGE_CACHE_ENDPOINTS:
+        return None
+    # A session cookie may carry a login, a cart count or flashed messages
+    if (app.config['SESSION_COOKIE_NAME'] in request.cookies
+            or app.config.get('REMEMBER_COOKIE_NAME', 'remember_token') in request.cookies):
+        return None
+    return request.url
+
+
+@app.before_request
+def serve_cached_page():
+    key = page_cache_key()
+    if key is None:
+        return None
+    request.environ['avanii.page_cache_version'] = version = catalog_version.current()
+    cached = page_cache.get(key, version)
+    if cached is None:
+        request.environ['avanii.page_cache_key'] = key
+        return None
+    status, headers, body = cached
+    response = Response(body, status=status, headers=headers)
+    etag = response.get_etag()[0]
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        response = Response(status=304, headers=[header for header in headers if header[0] != 'Content-Type'])
+    response.headers['X-Page-Cache'] = 'HIT'
+    return response
+
+
+@app.after_request
+def store_cached_page(response):
+    key = request.environ.get('avanii.page_cache_key')
+    if key is None:
+        return response
+    response.headers['X-Page-Cache'] = 'MISS'
+    if (request.method != 'GET' or response.status_code != 200 or response.direct_passthrough
+            or 'Set-Cookie' in response.headers or flask_session.modified or '_flashes' in flask_session):
+        return response
+    body = response.get_data()
+    headers = [(name, response.headers[name]) for name in PAGE_CACHE_HEADERS if name in response.headers]
+    page_cache.put(key, request.environ['avanii.page_cache_version'],
+                   (response.status_code, headers, body), size=len(body) + len(key))
+    return response
+
+
+# ============================================
+# CONDITIONAL GET FOR CATALOG PAGES
+# ============================================
+
+# An ETag is only as fresh as the catalog version in it, and the in-process
+# counter never sees writes made by other workers. Catalog pages therefore carry
+# ETags only with a shared version store (CATALOG_REDIS_URL), unless
+# CATALOG_ETAGS_IN_PROCESS=1 declares that a single process serves the site.
+app.config['CATALOG_ETAGS_IN_PROCESS'] = os.environ.get('CATALOG_ETAGS_IN_PROCESS') == '1'
+
+
+def page_personalization():
+    """The part of a storefront page that differs per visitor, or None if it must be rendered"""
+    if '_flashes' in flask_session:
+        return None
+    if current_user.is_authenticated:
+        # The header shows the username and cart size to logged-in users only;
+        # the count is kept for inject_cart_count so the page does not query it twice
+        cart_count = request.environ['avanii.cart_count'] = current_cart_count()
+        return f"u{current_user.id}c{cart_count}"
+    return "anon"
+
+
+def catalog_timestamp(value):
+    """Microseconds since the epoch for ETag parts; 0 for an empty catalog"""
+    return int(value.timestamp() * 1000000) if value else 0
+
+
+def catalog_etag(*parts):
+    """
+    Weak ETag for a catalog page built from cheap identifiers (never the body):
+    the given parts, the catalog version and the visitor's personalization.
+    None when the catalog version is not shared between workers.
+    """
+    if not (catalog_version.store.shared or app.config['CATALOG_ETAGS_IN_PROCESS']):
+        return None
+    version = catalog_version.current()
+    personal = page_personalization()
+    if version is None or personal is None:
+        return None
+    return "-".join(str(part) for part in (*parts, f"v{version}", personal))
+
+
+def set_catalog_validators(response, etag, last_modified):
+    if etag is None:
+        return response
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Always revalidate; the ETag makes that a 304 whenever nothing changed
+    response.cache_control.no_cache = True
+    if current_user.is_authenticated:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    return response
+
+
+def not_modified(etag, last_modified):
+    """A 304 response if the client already holds this version of the page, otherwise None"""
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    return set_catalog_validators(Response(status=304), etag, last_modified)
+
+
+# ============================================
+# LOGIN THROTTLING
+# ============================================
+
+class MemoryThrottleStore:
+    """
+    In-process sliding-window store (one deque of timestamps per key). Keys
+    whose hits have all expired are swept at most once per window, so failures
+    spread over many usernames cannot grow memory without bound.
+    """
+
+    def __init__(self):
+        self._hits = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def count(self, key, window, now):
+        """Return (hits inside the window, timestamp of the oldest one or None)"""
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                return 0, None
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if not hits:
+                del self._hits[key]
+                return 0, None
+            return len(hits), hits[0]
+
+    def add(self, key, window, now):
+        with self._lock:
+            self._hits.setdefault(key, deque()).append(now)
+            if now - self._last_sweep >= window:
+                self._sweep(window, now)
+
+    def _sweep(self, window, now):
+        # Hits are appended in time order, so a key is stale once its newest hit is
+        expired = [key for key, hits in self._hits.items() if not hits or hits[-1] <= now - window]
+        for key in expired:
+            del self._hits[key]
+        self._last_sweep = now
+
+    def __len__(self):
+        return len(self._hits)
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+class RedisThrottleStore:
+    """Shared sliding-window store so every worker sees the same counts"""
+
+    def __init__(self, redis_url, prefix='avanii:throttle:'):
+        import redis
+        self._redis = redis.Redis.from_url(redis_url)
+        self._prefix = prefix
+
+    def count(self, key, window, now):
+        name = self._prefix + key
+        pipe = self._redis.pipeline()
+        pipe.zremrangebyscore(name, 0, now - window)
+        pipe.zcard(name)
+        pipe.zrange(name, 0, 0, withscores=True)
+        _, hits, oldest = pipe.execute()
+        return hits, (oldest[0][1] if oldest else None)
+
+    def add(self, key, window, now):
+        name = self._prefix + key
+        pipe = self._redis.pipeline()
+        pipe.zadd(name, {f"{now}:{os.urandom(4).hex()}": now})
+        pipe.expire(name, int(window) + 1)
+        pipe.execute()
+
+    def reset(self, key):
+        self._redis.delete(self._prefix + key)
+
+
+class LoginThrottle:
+    """
+    Sliding-window limiter for failed logins, keyed per client IP and per username.
+    check() is called before any user lookup or password hashing so rejected
+    attempts cost almost nothing.
+    """
+
+    def __init__(self, store, ip_limit, username_limit, window):
+        self.store = store
+        self.ip_limit = ip_limit
+        self.username_limit = username_limit
+        self.window = window
+        self.stats = {"checked": 0, "rejected_ip": 0, "rejected_username": 0, "failures_recorded": 0}
+        self._stats_lock = threading.Lock()
+
+    def _bump(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _retry_after(self, oldest, now):
+        """Seconds until the oldest failure in the window expires and frees a slot"""
+        if oldest is None:
+            return int(self.window)
+        return max(1, math.ceil(oldest + self.window - now))
+
+    def check(self, scope, ip, username):
+        """Return None if the attempt may proceed, otherwise the seconds to wait"""
+        self._bump("checked")
+        now = time.time()
+        try:
+            hits, oldest = self.store.count(f"{scope}:ip:{ip}", self.window, now)
+            if hits >= self.ip_limit:
+                self._bump("rejected_ip")
+                return self._retry_after(oldest, now)
+            if username:
+                hits, oldest = self.store.count(f"{scope}:user:{username.lower()}", self.window, now)
+                if hits >= self.username_limit:
+                    self._bump("rejected_username")
+                    return self._retry_after(oldest, now)
+        except Exception as e:
+            # Never lock everyone out because the shared backend is down
+            app.logger.warning("Login throttle backend error: %s", e)
+        return None
+
+    def record_failure(self, scope, ip, username):
+        self._bump("failures_recorded")
+        now = time.time()
+        try:
+            self.store.add(f"{scope}:ip:{ip}", self.window, now)
+            if username:
+                self.store.add(f"{scope}:user:{username.lower()}", self.window, now)
+        except Exception as e:
+            app.logger.warning("Login throttle backend error: %s", e)
+
+    def record_success(self, scope, username):
+        try:
+            if username:
+                self.store.reset(f"{scope}:user:{username.lower()}")
+        except Exception as e:
+            app.logger.warning("Login throttle backend error: %s", e)
+
+    def snapshot(self):
+        with self._stats_lock:
+            data = dict(self.stats)
+        data["rejected_total"] = data["rejected_ip"] + data["rejected_username"]
+        data["backend"] = type(self.store).__name__
+        data["window_seconds"] = self.window
+        data["ip_limit"] = self.ip_limit
+        data["username_limit"] = self.username_limit
+        return data
+
+
+def _make_throttle_store():
+    """Use Redis when THROTTLE_REDIS_URL is set and the client is installed"""
+    redis_url = os.environ.get('THROTTLE_REDIS_URL')
+    if redis_url:
+        try:
+            return RedisThrottleStore(redis_url)
+        except ImportError:
+            app.logger.warning("THROTTLE_REDIS_URL set but redis is not installed, using in-memory throttle store")
+    return MemoryThrottleStore()
+
+
+login_throttle = LoginThrottle(
+    _make_throttle_store(),
+    ip_limit=int(os.environ.get('LOGIN_THROTTLE_IP_LIMIT', 20)),
+    username_limit=int(os.environ.get('LOGIN_THROTTLE_USERNAME_LIMIT', 5)),
+    window=float(os.environ.get('LOGIN_THROTTLE_WINDOW', 300)),
+)
+
+
+def client_ip():
+    """Address of the connecting client (X-Forwarded-For is only honoured via ProxyFix)"""
+    return request.remote_addr or 'unknown'
+
+
+@app.route("/")
+def home():
+    return render_template("index.html")
+
+
+@app.route("/about")
+def about():
+    return render_template("about.html")
+
+
+@app.route("/login", methods=['GET', 'POST'])
+def login():
+    if current_user.is_authenticated:
+        return redirect(url_for('home'))
+    
+    if request.method == 'POST':
+        username = request.form.get('username')
+        password = request.form.get('password')
+        remember = request.form.get('remember', False)
+        ip = client_ip()
+        
+        # Reject throttled clients before any DB lookup or password hashing
+        retry_after = login_throttle.check('login', ip, username)
+        if retry_after:
+            flash('Too many login attempts. Please try again later.', 'error')
+            return render_template("login.html"), 429, {'Retry-After': str(retry_after)}
+        
+        user = db_session.query(User).filter_by(username=username).first()
+        
+        if user and check_password_hash(user.password_hash, password):
+            login_throttle.record_success('login', username)
+            login_user(user, remember=remember)
+            
+            # Merge session cart with user's database cart
+            if 'cart' in flask_session and flask_session['cart']:
+                # Get or create user's cart
+                user_cart = db_session.query(Cart).filter_by(user_id=user.id).first()
+                if not user_cart:
+                    user_cart = Cart(user_id=user.id)
+                    db_session.add(user_cart)
+                    db_session.commit()
+                
+                # Merge session cart items
+                for product_id_str, quantity in flask_session['cart'].items():
+                    product_id = int(product_id_str)
+                    cart_item = db_session.query(CartItem).filter_by(
+                        cart_id=user_cart.id, 
+                        product_id=product_id
+                    ).first()
+                    
+                    if cart_item:
+                        cart_item.quantity += quantity
+                    else:
+                        cart_item = CartItem(
+                            cart_id=user_cart.id,
+                            product_id=product_id,
+                            quantity=quantity
+                        )
+                        db_session.add(cart_item)
+                
+                db_session.commit()
+                flask_session.pop('cart', None)
+            
+            flash(f'Welcome back, {user.username}!', 'success')
+            next_page = request.args.get('next')
+            return redirect(next_page) if next_page else redirect(url_for('home'))
+        else:
+            login_throttle.record_failure('login', ip, username)
+            flash('Invalid username or password', 'error')
+    
+    return render_template("login.html")
+
+
+@app.route("/register", methods=['GET', 'POST'])
+def register():
+    if current_user.is_authenticated:
+        return redirect(url_for('home'))
+    
+    if request.method == 'POST':
+        username = request.form.get('username')
+        email = request.form.get('email')
+        password = request.form.get('password')
+        password_confirm = request.form.get('password_confirm')
+        
+        # Validation
+        if not username or not email or not password:
+            flash('All fields are required', 'error')
+            return render_template("register.html")
+        
+        if password != password_confirm:
+            flash('Passwords do not match', 'error')
+            return render_template("register.html")
+        
+        if len(password) < 6:
+            flash('Password must be at least 6 characters long', 'error')
+            return render_template("register.html")
+        
+        # Check if user already exists
+        if db_session.query(User).filter_by(username=username).first():
+            flash('Username already exists', 'error')
+            return render_template("register.html")
+        
+        if db_session.query(User).filter_by(email=email).first():
+            flash('Email already registered', 'error')
+            return render_template("register.html")
+        
+        # Create new user
+        hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+        new_user = User(
+            username=username,
+            email=email,
+            password_hash=hashed_password
+        )
+        db_session.add(new_user)
+        db_session.commit()
+        
+        # Create cart for user
+        user_cart = Cart(user_id=new_user.id)
+        db_session.add(user_cart)
+        db_session.commit()
+        
+        flash('Registration successful! Please login.', 'success')
+        return redirect(url_for('login'))
+    
+    return render_template("register.html")
+
+
+@app.route("/logout")
+@login_required
+def logout():
+    logout_user()
+    flash('You have been logged out', 'info')
+    return redirect(url_for('home'))
+
+
+@app.route("/shop")
+@query_budget(10)
+def shop():
+    # Get filter parameters
+    filters = normalize_shop_filters(request.args)
+    category_filter, min_price, max_price, sort_by, page, per_page, search = filters
+
+    # Price range for the slider and sidebar counts, both computed once per catalog version
+    price_min, price_max, category_counts, last_modified = catalog_summary()
+
+    # Answer revalidations before running the listing query or rendering. The
+    # filters, product count and latest update are in the ETag as well as the
+    # version, so a page never revalidates against a different listing.
+    filters_digest = hashlib.sha1(repr(filters).encode('utf-8')).hexdigest()[:12]
+    etag = catalog_etag("shop", filters_digest, f"n{sum(category_counts.values())}",
+                        f"m{catalog_timestamp(last_modified)}")
+    cached = not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+    
+    # Set default price range if no products exist
+    price_min = price_min if price_min else 0
+    price_max = price_max if price_max else 100
+    
+    # Use filtered values if provided, otherwise use full range
+    filter_min = min_price if min_price is not None else price_min
+    filter_max = max_price if max_price is not None else price_max
+
+    # Page ids and total come from the listing cache; only the page's rows are loaded
+    product_ids, total = shop_listing(filters)
+    products = products_by_ids(product_ids)
+    
+    # Get all categories for sidebar
+    categories = db_session.query(Category).all()
+    
+    # Get best sellers (top 3 featured products)
+    best_sellers = db_session.query(Product).filter(Product.is_featured == True).limit(3).all()
+    
+    # Calculate pagination info
+    total_pages = (total + per_page - 1) // per_page
+    start_item = (page - 1) * per_page + 1
+    end_item = min(page * per_page, total)
+    
+    html = render_template("shop.html", 
+                         products=products,
+                         categories=categories,
+                         category_counts=category_counts,
+                         best_sellers=best_sellers,
+                         total=total,
+                         page=page,
+                         per_page=per_page,
+                         total_pages=total_pages,
+                         start_item=start_item,
+                         end_item=end_item,
+                         sort_by=sort_by,
+                         category_filter=category_filter,
+                         price_min=int(price_min),
+                         price_max=int(price_max),
+                         filter_min=int(filter_min),
+                         filter_max=int(filter_max))
+    return set_catalog_validators(make_response(html), etag, last_modified)
+
+@app.route("/shop/<int:product_id>")
+@query_budget(6)
+def shop_details(product_id):
+    product = db_session.get(Product, product_id, options=[joinedload(Product.category)])
+    if not product:
+        flash("Product not found", "error")
+        return redirect(url_for('shop'))
+
+    # Answer revalidations before loading related products or rendering
+    last_modified = product.updated_at or product.created_at
+    etag = catalog_etag(f"p{product.id}", catalog_timestamp(last_modified))
+    cached = not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+    
+    # Get related products (same category, exclude current product)
+    related_products = []
+    if product.category_id:
+        related_products = db_session.query(Product).filter(
+            Product.category_id == product.category_id,
+            Product.id != product_id
+        ).limit(4).all()
+    
+    html = render_template("shop-details.html", product=product, related_products=related_products)
+    return set_catalog_validators(make_response(html), etag, last_modified)
+
+@app.route("/api/shop/price-histogram")
+@query_budget(4)
+def shop_price_histogram():
+    """
+    Price distribution for the shop slider. Takes the same category and search
+    arguments as /shop plus `buckets`; a client can sum the counts between the
+    slider handles to show a results count without reloading the listing.
+    """
+    filters = normalize_shop_filters(request.args)
+    category_filter, search = filters[0], filters[6]
+    buckets = min(max(request.args.get('buckets', 20, type=int), 1), PRICE_HISTOGRAM_MAX_BUCKETS)
+    histogram = price_histogram(category_filter, search, buckets)
+    return jsonify(dict(histogram, success=True, category=category_filter, search=search))
+
+@app.route("/api/search/suggest")
+@query_budget(3)
+def search_suggest():
+    """Search-as-you-type suggestions for ?q=, most popular first (at most SUGGEST_MAX_RESULTS)"""
+    started = time.perf_counter()
+    limit = min(max(request.args.get('limit', 8, type=int), 1), SUGGEST_MAX_RESULTS)
+    suggestions = suggest_index.suggest(request.args.get('q', ''), limit)
+    response = jsonify({"success": True, "suggestions": suggestions})
+    response.headers['Server-Timing'] = f"suggest;dur={(time.perf_counter() - started) * 1000:.3f}"
+    return response
+
+@app.route("/add-to-cart/<int:product_id>", methods=['POST'])
+def add_to_cart(product_id):
+    # Check if user is logged in
+    if not current_user.is_authenticated:
+        flash('You should login first to add items to cart', 'error')
         return redirect(url_for('login'))
     
-    product = db_session.get(Product, product_id)
-    if not product:
-        return jsonify({'success': False, 'message': 'Product not found'}), 404
+    product = db_session.get(Product, product_id)
+    if not product:
+        return jsonify({'success': False, 'message': 'Product not found'}), 404
+    
+    quantity = int(request.form.get('quantity', 1))
+    
+    if current_user.is_authenticated:
+        # User is logged in, use database cart
+        user_cart = db_session.query(Cart).filter_by(user_id=current_user.id).first()
+        if not user_cart:
+            user_cart = Cart(user_id=current_user.id)
+            db_session.add(user_cart)
+            db_session.commit()
+        
+        cart_item = db_session.query(CartItem).filter_by(
+            cart_id=user_cart.id,
+            product_id=product_id
+        ).first()
+        
+        if cart_item:
+            cart_item.quantity += quantity
+        else:
+            cart_item = CartItem(
+                cart_id=user_cart.id,
+                product_id=product_id,
+                quantity=quantity
+            )
+            db_session.add(cart_item)
+        
+        db_session.commit()
+    
+    flash(f'{product.name} added to cart!', 'success')
+    return redirect(request.referrer or url_for('shop'))
+
+@app.route("/cart")
+@query_budget(6)
+def cart():
+    cart_items = []
+    total = 0
+    
+    if current_user.is_authenticated:
+        # User is logged in, use database cart
+        user_cart = db_session.query(Cart).options(
+            selectinload(Cart.cart_items).selectinload(CartItem.product)
+        ).filter_by(user_id=current_user.id).first()
+        if user_cart:
+            for cart_item in user_cart.cart_items:
+                subtotal = cart_item.get_subtotal()
+                cart_items.append({
+                    'product': cart_item.product,
+                    'quantity': cart_item.quantity,
+                    'subtotal': subtotal
+                })
+                total += subtotal
+    else:
+        # User not logged in, use session cart
+        if 'cart' in flask_session and flask_session['cart']:
+            # One query for every product in the session cart
+            product_ids = [int(product_id_str) for product_id_str in flask_session['cart']]
+            products = {product.id: product for product in
+                        db_session.query(Product).filter(Product.id.in_(product_ids))}
+            for product_id_str, quantity in flask_session['cart'].items():
+                product = products.get(int(product_id_str))
+                if product:
+                    subtotal = product.price * quantity
+                    cart_items.append({
+                        'product': product,
+                        'quantity': quantity,
+                        'subtotal': subtotal
+                    })
+                    total += subtotal
+    
+    return render_template("cart.html", cart_items=cart_items, total=total)
+
+@app.route("/update-cart/<int:product_id>", methods=['POST'])
+def update_cart(product_id):
+    quantity = int(request.form.get('quantity', 1))
+    
+    if current_user.is_authenticated:
+        # User is logged in, update database cart
+        user_cart = db_session.query(Cart).filter_by(user_id=current_user.id).first()
+        if user_cart:
+            cart_item = db_session.query(CartItem).filter_by(
+                cart_id=user_cart.id,
+                product_id=product_id
+            ).first()
+            
+            if cart_item:
+                if quantity <= 0:
+                    db_session.delete(cart_item)
+                else:
+                    cart_item.quantity = quantity
+                db_session.commit()
+    else:
+        # User not logged in, update session cart
+        if 'cart' in flask_session:
+            product_id_str = str(product_id)
+            if quantity <= 0:
+                flask_session['cart'].pop(product_id_str, None)
+            else:
+                flask_session['cart'][product_id_str] = quantity
+            flask_session.modified = True
+    
+    return redirect(url_for('cart'))
+
+@app.route("/remove-from-cart/<int:product_id>")
+def remove_from_cart(product_id):
+    if current_user.is_authenticated:
+        # User is logged in, remove from database cart
+        user_cart = db_session.query(Cart).filter_by(user_id=current_user.id).first()
+        if user_cart:
+            cart_item = db_session.query(CartItem).filter_by(
+                cart_id=user_cart.id,
+                product_id=product_id
+            ).first()
+            if cart_item:
+                db_session.delete(cart_item)
+                db_session.commit()
+    else:
+        # User not logged in, remove from session cart
+        if 'cart' in flask_session:
+            flask_session['cart'].pop(str(product_id), None)
+            flask_session.modified = True
+    
+    flash('Item removed from cart', 'success')
+    return redirect(url_for('cart'))
+
+@app.route("/clear-cart")
+def clear_cart():
+    if current_user.is_authenticated:
+        # User is logged in, clear database cart
+        user_cart = db_session.query(Cart).filter_by(user_id=current_user.id).first()
+        if user_cart:
+            for cart_item in user_cart.cart_items:
+                db_session.delete(cart_item)
+            db_session.commit()
+    else:
+        # User not logged in, clear session cart
+        flask_session.pop('cart', None)
+    
+    flash('Cart cleared', 'success')
+    return redirect(url_for('cart'))
+
+@app.route("/checkout", methods=['GET', 'POST'])
+@query_budget(10)
+@login_required
+def checkout():
+    # Get user's cart
+    user_cart = db_session.query(Cart).options(
+        selectinload(Cart.cart_items).selectinload(CartItem.product)
+    ).filter_by(user_id=current_user.id).first()
+    
+    if not user_cart or not user_cart.cart_items:
+        flash('Your cart is empty', 'error')
+        return redirect(url_for('shop'))
+    
+    if request.method == 'POST':
+        # Validate all required fields
+        first_name = request.form.get('first_name', '').strip()
+        last_name = request.form.get('last_name', '').strip()
+        email = request.form.get('email', '').strip()
+        phone = request.form.get('phone', '').strip()
+        address = request.form.get('address', '').strip()
+        city = request.form.get('city', '').strip()
+        state = request.form.get('state', '').strip()
+        country = request.form.get('country', 'india')
+        
+        # Check if all required fields are filled
+        if not all([first_name, last_name, email, phone, address, city, state]):
+            flash('Please fill in all required fields', 'error')
+            return redirect(url_for('checkout'))
+        
+        # Validate phone number (must be exactly 10 digits)
+        if not phone.isdigit() or len(phone) != 10:
+            flash('Phone number must be exactly 10 digits', 'error')
+            return redirect(url_for('checkout'))
+        
+        # Optional fields
+        telephone = request.form.get('telephone', '').strip()
+        company = request.form.get('company', '').strip()
+        postcode = request.form.get('postcode', '').strip()
+        order_notes = request.form.get('order_notes', '').strip()
+        
+        # Calculate total
+        total_amount = user_cart.get_total()
+        
+        # Create order
+        new_order = Order(
+            user_id=current_user.id,
+            first_name=first_name,
+            last_name=last_name,
+            email=email,
+            phone=phone,
+            telephone=telephone if telephone else None,
+            company=company if company else None,
+            address=address,
+            city=city,
+            state=state,
+            country=country,
+            postcode=postcode if postcode else None,
+            order_notes=order_notes if order_notes else None,
+            total_amount=total_amount,
+            status='pending'
+        )
+        db_session.add(new_order)
+        db_session.flush()  # Get the order ID
+        
+        # Create order items from cart items in one executemany INSERT
+        db_session.execute(insert(OrderItem), [
+            {
+                "order_id": new_order.id,
+                "product_id": cart_item.product_id,
+                "quantity": cart_item.quantity,
+                "price": cart_item.product.price
+            }
+            for cart_item in user_cart.cart_items
+        ])
+        
+        # Clear the cart
+        for cart_item in user_cart.cart_items:
+            db_session.delete(cart_item)
+        
+        db_session.commit()
+        
+        flash(f'Order #{new_order.id} placed successfully! Thank you for your purchase.', 'success')
+        return redirect(url_for('order_confirmation', order_id=new_order.id))
+    
+    # GET request - show checkout form
+    cart_items = []
+    total = user_cart.get_total()
+    
+    for cart_item in user_cart.cart_items:
+        cart_items.append({
+            'product': cart_item.product,
+            'quantity': cart_item.quantity,
+            'subtotal': cart_item.get_subtotal()
+        })
+    
+    return render_template("checkout.html", cart_items=cart_items, total=total, user=current_user)
+
+@app.route("/order-confirmation/<int:order_id>")
+@login_required
+def order_confirmation(order_id):
+    order = db_session.get(Order, order_id)
+    
+    if not order or order.user_id != current_user.id:
+        flash('Order not found', 'error')
+        return redirect(url_for('shop'))
+    
+    return render_template("order-confirmation.html", order=order)
+
+@app.route("/orders")
+@query_budget(6)
+@login_required
+def orders():
+    # Get all orders for the current user
+    user_orders = db_session.query(Order).options(selectinload(Order.order_items)).filter_by(
+        user_id=current_user.id).order_by(Order.created_at.desc()).all()
+    
+    return render_template("orders.html", orders=user_orders)
+
+@app.route("/order/<int:order_id>")
+@query_budget(5)
+@login_required
+def order_details(order_id):
+    order = db_session.get(
+        Order, order_id,
+        options=[selectinload(Order.order_items).joinedload(OrderItem.product)]
+    )
+    
+    if not order or order.user_id != current_user.id:
+        flash('Order not found', 'error')
+        return redirect(url_for('orders'))
+    
+    return render_template("order-details.html", order=order)
+
+def current_cart_count():
+    """Number of items in the visitor's cart"""
+    cart_count = 0
+    if current_user.is_authenticated:
+        # User is logged in, sum the database cart in one query
+        from sqlalchemy import func
+        cart_count = (
+            db_session.query(func.coalesce(func.sum(CartItem.quantity), 0))
+            .join(Cart, CartItem.cart_id == Cart.id)
+            .filter(Cart.user_id == current_user.id)
+            .scalar()
+        )
+    else:
+        # User not logged in, get count from session cart
+        if 'cart' in flask_session:
+            cart_count = sum(flask_session['cart'].values())
+    return cart_count
+
+@app.context_processor
+def inject_cart_count():
+    """Make cart count available to all templates"""
+    cart_count = request.environ.get('avanii.cart_count')
+    if cart_count is None:
+        cart_count = current_cart_count()
+    return dict(cart_count=cart_count)
+
+# ============================================
+# ADMIN ROUTES
+# ============================================
+
+def admin_required(f):
+    """Decorator to require admin access"""
+    from functools import wraps
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated or not current_user.is_admin:
+            flash('Admin access required', 'error')
+            return redirect(url_for('admin_login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+@app.route("/admin/login", methods=['GET', 'POST'])
+def admin_login():
+    if current_user.is_authenticated and current_user.is_admin:
+        return redirect(url_for('admin_dashboard'))
+    
+    if request.method == 'POST':
+        username = request.form.get('username')
+        password = request.form.get('password')
+        ip = client_ip()
+        
+        # Reject throttled clients before any DB lookup or password hashing
+        retry_after = login_throttle.check('admin', ip, username)
+        if retry_after:
+            flash('Too many login attempts. Please try again later.', 'error')
+            return render_template("admin/admin_login.html"), 429, {'Retry-After': str(retry_after)}
+        
+        user = db_session.query(User).filter_by(username=username).first()
+        
+        if user and check_password_hash(user.password_hash, password) and user.is_admin:
+            login_throttle.record_success('admin', username)
+            login_user(user)
+            flash('Welcome to Admin Dashboard!', 'success')
+            return redirect(url_for('admin_dashboard'))
+        else:
+            login_throttle.record_failure('admin', ip, username)
+            flash('Invalid admin credentials', 'error')
+    
+    return render_template("admin/admin_login.html")
+
+@app.route("/admin/dashboard")
+@query_budget(8)
+@admin_required
+def admin_dashboard():
+    # Get statistics
+    total_users = db_session.query(User).count()
+    total_products = db_session.query(Product).count()
+    total_categories = db_session.query(Category).count()
+    total_orders = db_session.query(Order).count()
+    
+    # Get recent orders
+    recent_orders = db_session.query(Order).order_by(Order.created_at.desc()).limit(5).all()
+    
+    # Get total revenue
+    from sqlalchemy import func
+    total_revenue = db_session.query(func.sum(Order.total_amount)).filter(Order.status != 'cancelled').scalar() or 0
+    
+    return render_template("admin/dashboard.html", 
+                         total_users=total_users,
+                         total_products=total_products,
+                         total_categories=total_categories,
+                         total_orders=total_orders,
+                         recent_orders=recent_orders,
+                         total_revenue=total_revenue)
+
+# ============================================
+# ADMIN - USERS MANAGEMENT
+# ============================================
+
+@app.route("/admin/users")
+@query_budget(6)
+@admin_required
+def admin_users():
+    users = db_session.query(User).options(selectinload(User.orders)).all()
+    return render_template("admin/users.html", users=users)
+
+@app.route("/admin/users/<int:user_id>/delete", methods=['POST'])
+@admin_required
+def admin_delete_user(user_id):
+    user = db_session.get(User, user_id)
+    if user and user.id != current_user.id:  # Can't delete yourself
+        db_session.delete(user)
+        db_session.commit()
+        flash(f'User {user.username} deleted successfully', 'success')
+    else:
+        flash('Cannot delete this user', 'error')
+    return redirect(url_for('admin_users'))
+
+# ============================================
+# ADMIN - PRODUCTS MANAGEMENT
+# ============================================
+
+@app.route("/admin/products")
+@query_budget(5)
+@admin_required
+def admin_products():
+    products = db_session.query(Product).options(selectinload(Product.category)).all()
+    return render_template("admin/products.html", products=products)
+
+@app.route("/admin/products/add", methods=['GET', 'POST'])
+@admin_required
+def admin_add_product():
+    if request.method == 'POST':
+        product = Product(
+            name=request.form.get('name'),
+            description=request.form.get('description'),
+            price=float(request.form.get('price')),
+            image_filename=request.form.get('image_filename'),
+            stock=int(request.form.get('stock')),
+            category_id=int(request.form.get('category_id')) if request.form.get('category_id') else None,
+            sku=request.form.get('sku'),
+            tags=request.form.get('tags'),
+            is_featured=bool(request.form.get('is_featured')),
+            is_hot=bool(request.form.get('is_hot')),
+            is_sale=bool(request.form.get('is_sale'))
+        )
+        db_session.add(product)
+        db_session.commit()
+        flash('Product added successfully', 'success')
+        return redirect(url_for('admin_products'))
+    
+    categories = db_session.query(Category).all()
+    return render_template("admin/product_form.html", product=None, categories=categories)
+
+@app.route("/admin/products/<int:product_id>/edit", methods=['GET', 'POST'])
+@admin_required
+def admin_edit_product(product_id):
+    product = db_session.get(Product, product_id)
+    if not product:
+        flash('Product not found', 'error')
+        return redirect(url_for('admin_products'))
+    
+    if request.method == 'POST':
+        product.name = request.form.get('name')
+        product.description = request.form.get('description')
+        product.price = float(request.form.get('price'))
+        product.image_filename = request.form.get('image_filename')
+        product.stock = int(request.form.get('stock'))
+        product.category_id = int(request.form.get('category_id')) if request.form.get('category_id') else None
+        product.sku = request.form.get('sku')
+        product.tags = request.form.get('tags')
+        product.is_featured = bool(request.form.get('is_featured'))
+        product.is_hot = bool(request.form.get('is_hot'))
+        product.is_sale = bool(request.form.get('is_sale'))
+        
+        db_session.commit()
+        flash('Product updated successfully', 'success')
+        return redirect(url_for('admin_products'))
+    
+    categories = db_session.query(Category).all()
+    return render_template("admin/product_form.html", product=product, categories=categories)
+
+@app.route("/admin/products/<int:product_id>/delete", methods=['POST'])
+@admin_required
+def admin_delete_product(product_id):
+    product = db_session.get(Product, product_id)
+    if product:
+        db_session.delete(product)
+        db_session.commit()
+        flash('Product deleted successfully', 'success')
+    return redirect(url_for('admin_products'))
+
+# ============================================
+# ADMIN - CATEGORIES MANAGEMENT
+# ============================================
+
+@app.route("/admin/categories")
+@query_budget(5)
+@admin_required
+def admin_categories():
+    from sqlalchemy import func
+    categories = db_session.query(Category).all()
+    category_counts = dict(
+        db_session.query(Product.category_id, func.count(Product.id)).group_by(Product.category_id).all()
+    )
+    return render_template("admin/categories.html", categories=categories, category_counts=category_counts)
+
+@app.route("/admin/categories/add", methods=['GET', 'POST'])
+@admin_required
+def admin_add_category():
+    if request.method == 'POST':
+        category = Category(
+            name=request.form.get('name'),
+            description=request.form.get('description')
+        )
+        db_session.add(category)
+        db_session.commit()
+        flash('Category added successfully', 'success')
+        return redirect(url_for('admin_categories'))
+    
+    return render_template("admin/category_form.html", category=None)
+
+@app.route("/admin/categories/<int:category_id>/edit", methods=['GET', 'POST'])
+@admin_required
+def admin_edit_category(category_id):
+    category = db_session.get(Category, category_id)
+    if not category:
+        flash('Category not found', 'error')
+        return redirect(url_for('admin_categories'))
+    
+    if request.method == 'POST':
+        category.name = request.form.get('name')
+        category.description = request.form.get('description')
+        db_session.commit()
+        flash('Category updated successfully', 'success')
+        return redirect(url_for('admin_categories'))
+    
+    return render_template("admin/category_form.html", category=category)
+
+@app.route("/admin/categories/<int:category_id>/delete", methods=['POST'])
+@admin_required
+def admin_delete_category(category_id):
+    category = db_session.get(Category, category_id)
+    if category:
+        db_session.delete(category)
+        db_session.commit()
+        flash('Category deleted successfully', 'success')
+    return redirect(url_for('admin_categories'))
+
+# ============================================
+# ADMIN - ORDERS MANAGEMENT
+# ============================================
+
+@app.route("/admin/orders")
+@query_budget(6)
+@admin_required
+def admin_orders():
+    orders = db_session.query(Order).options(selectinload(Order.order_items)).order_by(Order.created_at.desc()).all()
+    return render_template("admin/orders.html", orders=orders)
+
+@app.route("/admin/orders/<int:order_id>")
+@query_budget(5)
+@admin_required
+def admin_order_details(order_id):
+    order = db_session.get(
+        Order, order_id,
+        options=[joinedload(Order.user), selectinload(Order.order_items).joinedload(OrderItem.product)]
+    )
+    if not order:
+        flash('Order not found', 'error')
+        return redirect(url_for('admin_orders'))
+    return render_template("admin/order_details.html", order=order)
+
+@app.route("/admin/orders/<int:order_id>/update-status", methods=['POST'])
+@admin_required
+def admin_update_order_status(order_id):
+    order = db_session.get(Order, order_id)
+    if order:
+        new_status = request.form.get('status')
+        order.status = new_status
+        db_session.commit()
+        flash(f'Order #{order_id} status updated to {new_status}', 'success')
+    return redirect(url_for('admin_order_details', order_id=order_id))
+
+@app.route("/admin/orders/<int:order_id>/delete", methods=['POST'])
+@admin_required
+def admin_delete_order(order_id):
+    order = db_session.get(Order, order_id)
+    if order:
+        db_session.delete(order)
+        db_session.commit()
+        flash('Order deleted successfully', 'success')
+    return redirect(url_for('admin_orders'))
+
+# ============================================
+# ADMIN - CHANGE PASSWORD
+# ============================================
+
+@app.route("/admin/change-password", methods=['GET', 'POST'])
+@admin_required
+def admin_change_password():
+    if request.method == 'POST':
+        current_password = request.form.get('current_password')
+        new_password = request.form.get('new_password')
+        confirm_password = request.form.get('confirm_password')
+        
+        # Verify current password
+        if not check_password_hash(current_user.password_hash, current_password):
+            flash('Current password is incorrect', 'error')
+            return redirect(url_for('admin_change_password'))
+        
+        # Check if new passwords match
+        if new_password != confirm_password:
+            flash('New passwords do not match', 'error')
+            return redirect(url_for('admin_change_password'))
+        
+        # Check password length
+        if len(new_password) < 6:
+            flash('New password must be at least 6 characters long', 'error')
+            return redirect(url_for('admin_change_password'))
+        
+        # Update password - get fresh user from database
+        user = db_session.get(User, current_user.id)
+        user.password_hash = generate_password_hash(new_password)
+        db_session.commit()
+        
+        flash('Password changed successfully!', 'success')
+        return redirect(url_for('admin_dashboard'))
+    
+    return render_template("admin/change_password.html")
+
+# ============================================
+# ADMIN - PERFORMANCE STATS
+# ============================================
+
+@app.route("/admin/api/throttle-stats")
+@admin_required
+def admin_throttle_stats():
+    """Counters for attempts rejected by the login throttle"""
+    return jsonify(login_throttle.snapshot())
+
+@app.route("/admin/api/advisor-cache-stats")
+@admin_required
+def admin_advisor_cache_stats():
+    """Hit/miss counters for the fertilizer recommendation cache"""
+    return jsonify(recommendation_cache.snapshot())
+
+@app.route("/admin/api/transcript-cache-stats")
+@admin_required
+def admin_transcript_cache_stats():
+    """Hit/miss counters for the audio transcript cache"""
+    return jsonify(transcript_cache.snapshot())
+
+@app.route("/admin/api/catalog-cache-stats")
+@admin_required
+def admin_catalog_cache_stats():
+    """Catalog version, cache counters, and the state of the in-memory catalog indexes"""
+    return jsonify({
+        "catalog_version": catalog_version.snapshot(),
+        "listing_cache": listing_cache.snapshot(),
+        "page_cache": page_cache.snapshot(),
+        "snapshot": catalog_snapshots.snapshot() if catalog_snapshots is not None else None,
+        "suggest_index": suggest_index.snapshot()
+    })
+
+@app.route("/admin/api/gemini-breaker")
+@admin_required
+def admin_gemini_breaker():
+    """Current state of the Gemini circuit breaker and of the calls queued behind it"""
+    data = gemini_breaker.snapshot()
+    with _gemini_in_flight_lock:
+        data["calls"] = dict(advisor_stats, in_flight=gemini_calls_outstanding(),
+                             max_pending=app.config['ADVISOR_MAX_PENDING'])
+    return jsonify(data)
+
+@app.route("/admin/api/bulkheads")
+@admin_required
+def admin_bulkheads():
+    """In-flight and queued request counts per advisor endpoint group"""
+    data = {name: limiter.snapshot() for name, limiter in bulkheads.items()}
+    # Only present when the app is served through asgi.py
+    if async_bulkheads:
+        data["async"] = {name: limiter.snapshot() for name, limiter in async_bulkheads.items()}
+    return jsonify(data)
+
+@app.route("/admin/api/profiles")
+@admin_required
+def admin_profiles():
+    """Recently saved request profiles; the files are under PROFILE_DIR"""
+    return jsonify({
+        "directory": app.config['PROFILE_DIR'],
+        "sample_rate": app.config['PROFILE_SAMPLE_RATE'],
+        "profiles": list(recent_profiles)
+    })
+
+@app.route("/admin/api/query-audit")
+@admin_required
+def admin_query_audit():
+    """Latest per-request query audit reports (QUERY_AUDIT=warn or raise)"""
+    return jsonify({
+        "mode": app.config['QUERY_AUDIT'] or "off",
+        "reports": list(query_audit_reports)
+    })
+
+
+
+
+
+
+
+
+
+
+
+
+def init_db():
+    """Initialize the database with tables"""
+    Base.metadata.create_all(engine)
+    upgrade_schema()
+    print("Database tables created successfully!")
+
+def upgrade_schema():
+    """
+    Add columns introduced after an existing database was created; safe to run
+    repeatedly. Run by init_db() and init_vercel_db.py, never on import, so
+    importing main does not issue DDL and concurrent cold starts cannot race on it.
+    """
+    from sqlalchemy import inspect, text
+    inspector = inspect(engine)
+    if not inspector.has_table('products'):
+        return
+    columns = {column['name'] for column in inspector.get_columns('products')}
+    if 'updated_at' not in columns:
+        column_type = DateTime().compile(dialect=engine.dialect)
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE products ADD COLUMN updated_at {column_type}"))
+            conn.execute(text("UPDATE products SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)"))
+        print("Added products.updated_at")
+
+def add_sample_data():
+    """Add sample products and categories for testing"""
+    # Check if data already exists
+    if db_session.query(Category).count() > 0:
+        print("Sample data already exists!")
+        return
+    
+    # Add categories
+    categories_data = [
+        {"name": "Outdoor Plants", "description": "Plants perfect for outdoor gardens"},
+        {"name": "Indoor Plants", "description": "Plants for indoor decoration"},
+        {"name": "Office Plants", "description": "Low maintenance plants for offices"},
+        {"name": "Potted Plants", "description": "Plants in decorative pots"},
+        {"name": "Flowering Plants", "description": "Beautiful flowering plants"}
+    ]
     
-    quantity = int(request.form.get('quantity', 1))
+    categories = []
+    for cat_data in categories_data:
+        category = Category(**cat_data)
+        db_session.add(category)
+        categories.append(category)
     
-    if current_user.is_authenticated:
-        # User is logged in, use database cart
-        user_cart = db_session.query(Cart).filter_by(user_id=current_user.id).first()
-        if not user_cart:
-            user_cart = Cart(user_id=current_user.id)
-            db_session.add(user_cart)
-            db_session.commit()
-        
-        cart_item = db_session.query(CartItem).filter_by(
-            cart_id=user_cart.id,
-            product_id=product_id
-        ).first()
-        
-        if cart_item:
-            cart_item.quantity += quantity
-        else:
-            cart_item = CartItem(
-                cart_id=user_cart.id,
-                product_id=product_id,
-                quantity=quantity
-            )
-            db_session.add(cart_item)
-        
-        db_session.commit()
+    db_session.commit()
     
-    flash(f'{product.name} added to cart!', 'success')
-    return redirect(request.referrer or url_for('shop'))
-
-@app.route("/cart")
-def cart():
-    cart_items = []
-    total = 0
+    # Add sample products
+    products_data = [
+        {"name": "Cactus Flower", "description": "Beautiful cactus with colorful flowers", "price": 10.99, "image_filename": "img/bg-img/40.png", "stock": 50, "category": categories[0], "sku": "CT201801", "tags": "cactus, flower, hot", "is_hot": True, "is_featured": True},
+        {"name": "Tulip Flower", "description": "Classic tulip plant", "price": 11.99, "image_filename": "img/bg-img/41.png", "stock": 30, "category": categories[4], "sku": "CT201802", "tags": "tulip, flower", "is_featured": True},
+        {"name": "Recuerdos Plant", "description": "Elegant indoor plant", "price": 9.99, "image_filename": "img/bg-img/34.jpg", "stock": 40, "category": categories[1], "sku": "CT201803", "tags": "indoor, green", "is_featured": True},
+        {"name": "Succulent Mix", "description": "Mixed succulent arrangement", "price": 15.99, "image_filename": "img/bg-img/42.png", "stock": 25, "category": categories[3], "sku": "CT201804", "tags": "succulent, potted"},
+        {"name": "Fern Plant", "description": "Lush green fern", "price": 12.50, "image_filename": "img/bg-img/43.png", "stock": 35, "category": categories[1], "sku": "CT201805", "tags": "fern, indoor, green"},
+        {"name": "Aloe Vera", "description": "Medicinal aloe vera plant", "price": 8.99, "image_filename": "img/bg-img/44.png", "stock": 60, "category": categories[2], "sku": "CT201806", "tags": "aloe, medicinal"},
+        {"name": "Snake Plant", "description": "Low maintenance snake plant", "price": 14.99, "image_filename": "img/bg-img/45.png", "stock": 45, "category": categories[2], "sku": "CT201807", "tags": "snake plant, office"},
+        {"name": "Orchid", "description": "Beautiful orchid flower", "price": 25.99, "image_filename": "img/bg-img/46.png", "stock": 20, "category": categories[4], "sku": "CT201808", "tags": "orchid, flower, elegant"},
+        {"name": "Peace Lily", "description": "Peaceful white lily", "price": 18.99, "image_filename": "img/bg-img/47.png", "stock": 28, "category": categories[1], "sku": "CT201809", "tags": "lily, flower, peace", "is_sale": True},
+        {"name": "Bonsai Tree", "description": "Miniature bonsai tree", "price": 35.99, "image_filename": "img/bg-img/48.png", "stock": 15, "category": categories[3], "sku": "CT201810", "tags": "bonsai, tree, miniature"},
+    ]
     
-    if current_user.is_authenticated:
-        # User is logged in, use database cart
-        user_cart = db_session.query(Cart).filter_by(user_id=current_user.id).first()
-        if user_cart:
-            for cart_item in user_cart.cart_items:
-                subtotal = cart_item.get_subtotal()
-                cart_items.append({
-                    'product': cart_item.product,
-                    'quantity': cart_item.quantity,
-                    'subtotal': subtotal
-                })
-                total += subtotal
-    else:
-        # User not logged in, use session cart
-        if 'cart' in flask_session and flask_session['cart']:
-            for product_id_str, quantity in flask_session['cart'].items():
-                product = db_session.get(Product, int(product_id_str))
-                if product:
-                    subtotal = product.price * quantity
-                    cart_items.append({
-                        'product': product,
-                        'quantity': quantity,
-                        'subtotal': subtotal
-                    })
-                    total += subtotal
+    for prod_data in products_data:
+        product = Product(**prod_data)
+        db_session.add(product)
     
-    return render_template("cart.html", cart_items=cart_items, total=total)
+    db_session.commit()
+    print("Sample data added successfully!")
 
-@app.route("/update-cart/<int:product_id>", methods=['POST'])
-def update_cart(product_id):
-    quantity = int(request.form.get('quantity', 1))
-    
-    if current_user.is_authenticated:
-        # User is logged in, update database cart
-        user_cart = db_session.query(Cart).filter_by(user_id=current_user.id).first()
-        if user_cart:
-            cart_item = db_session.query(CartItem).filter_by(
-                cart_id=user_cart.id,
-                product_id=product_id
-            ).first()
-            
-            if cart_item:
-                if quantity <= 0:
-                    db_session.delete(cart_item)
-                else:
-                    cart_item.quantity = quantity
-                db_session.commit()
+# ============================================
+# GEMINI CLIENT
+# ============================================
+
+class AIUnavailableError(Exception):
+    """Raised when the AI backend is failing, timing out or the breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through (half-open).
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.stats = {"successes": 0, "failures": 0, "short_circuited": 0, "opened": 0}
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let one trial request probe the upstream
+                self.state = "half-open"
+                return True
+            self.stats["short_circuited"] += 1
+            return False
+
+    def is_open(self):
+        """True while calls would be rejected, without consuming the half-open trial"""
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self.stats["successes"] += 1
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.stats["failures"] += 1
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.stats["opened"] += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+            data["state"] = self.state
+            data["consecutive_failures"] = self.failures
+        return data
+
+
+class GeminiClient:
+    """
+    Long-lived Gemini client. The API is configured and the gRPC channel opened
+    once per process, and every call gets a deadline, bounded retries and goes
+    through the circuit breaker.
+    """
+
+    RETRYABLE = ("DeadlineExceeded", "ServiceUnavailable", "InternalServerError", "ResourceExhausted", "TooManyRequests")
+
+    def __init__(self, api_key, model_name, timeout, max_retries, breaker):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breaker = breaker
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import google.generativeai as genai
+                    from google.generativeai import client as genai_client
+                    genai.configure(api_key=self.api_key)
+                    self._client = genai_client.get_default_generative_client()
+        return self._client
+
+    def generate_text(self, prompt):
+        """Return the model's text for `prompt` or raise AIUnavailableError"""
+        if not self.breaker.allow():
+            raise AIUnavailableError("Gemini circuit breaker is open")
+
+        from google.ai import generativelanguage as glm
+        from google.generativeai.types import GenerateContentResponse
+
+        request = glm.GenerateContentRequest(
+            model=f"models/{self.model_name}",
+            contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])]
+        )
+        deadline = time.monotonic() + self.timeout * (self.max_retries + 1)
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                with outbound_call("gemini"):
+                    response = self._get_client().generate_content(
+                        request, timeout=min(self.timeout, remaining), retry=None
+                    )
+                    text = GenerateContentResponse.from_response(response).text
+                self.breaker.record_success()
+                return text
+            except Exception as e:
+                last_error = e
+                if type(e).__name__ not in self.RETRYABLE or attempt == self.max_retries:
+                    break
+                time.sleep(self.backoff(attempt))
+
+        self.breaker.record_failure()
+        raise AIUnavailableError(f"Gemini request failed: {last_error}")
+
+    @staticmethod
+    def backoff(attempt):
+        """Short exponential backoff with jitter before the retry after `attempt`"""
+        return min(0.2 * (2 ** attempt), 2.0) * (0.5 + random.random() / 2)
+
+
+gemini_breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get('GEMINI_BREAKER_THRESHOLD', 5)),
+    reset_timeout=float(os.environ.get('GEMINI_BREAKER_RESET', 30)),
+)
+_gemini_client = None
+
+
+def get_gemini_client():
+    """Process-wide Gemini client, or None when no API key is configured"""
+    global _gemini_client
+    gemini_api_key = os.getenv('GEMINI_API_KEY')
+    if not gemini_api_key:
+        return None
+    if _gemini_client is None:
+        _gemini_client = GeminiClient(
+            api_key=gemini_api_key,
+            model_name=os.environ.get('GEMINI_MODEL', 'gemini-2.0-flash-exp'),
+            timeout=float(os.environ.get('GEMINI_TIMEOUT', 8)),
+            max_retries=int(os.environ.get('GEMINI_MAX_RETRIES', 1)),
+            breaker=gemini_breaker,
+        )
+    return _gemini_client
+
+
+# ============================================
+# HINGLISH TEXT NORMALIZATION
+# ============================================
+
+# Land units and their size in acres
+LAND_UNITS_IN_ACRES = {
+    'acres': 1.0, 'acre': 1.0, 'एकड़': 1.0,
+    'bigha': 0.62, 'बीघा': 0.62,
+    'hectares': 2.47, 'hectare': 2.47, 'हेक्टेयर': 2.47,
+}
+
+# Devanagari number words are unambiguous and converted wherever they appear
+DEVANAGARI_NUMBER_WORDS = {
+    'आधा': 0.5, 'डेढ़': 1.5, 'ढाई': 2.5,
+    'एक': 1, 'दो': 2, 'तीन': 3, 'चार': 4, 'पांच': 5, 'पाँच': 5,
+    'छह': 6, 'छः': 6, 'सात': 7, 'आठ': 8, 'नौ': 9, 'दस': 10,
+    'ग्यारह': 11, 'बारह': 12, 'तेरह': 13, 'चौदह': 14, 'पंद्रह': 15,
+    'सोलह': 16, 'सत्रह': 17, 'अठारह': 18, 'उन्नीस': 19, 'बीस': 20,
+    'पच्चीस': 25, 'तीस': 30, 'चालीस': 40, 'पचास': 50, 'साठ': 60,
+    'सत्तर': 70, 'अस्सी': 80, 'नब्बे': 90, 'सौ': 100,
+}
+
+# Romanized words like 'do', 'char' or 'bees' are also English words, so they
+# are only converted when a land unit or multiplier follows
+ROMAN_NUMBER_WORDS = {
+    'aadha': 0.5, 'adha': 0.5, 'dedh': 1.5, 'dhai': 2.5, 'dhaai': 2.5,
+    'ek': 1, 'do': 2, 'teen': 3, 'char': 4, 'chaar': 4, 'paanch': 5, 'panch': 5,
+    'chhe': 6, 'chah': 6, 'saat': 7, 'aath': 8, 'nau': 9, 'das': 10,
+    'gyarah': 11, 'barah': 12, 'terah': 13, 'chaudah': 14, 'pandrah': 15,
+    'solah': 16, 'satrah': 17, 'atharah': 18, 'unnis': 19, 'bees': 20,
+    'pachees': 25, 'tees': 30, 'chalees': 40, 'pachas': 50, 'saath': 60,
+    'sattar': 70, 'assi': 80, 'nabbe': 90,
+}
+
+NUMBER_MULTIPLIERS = {'सौ': 100, 'sau': 100, 'हज़ार': 1000, 'हजार': 1000, 'hazar': 1000, 'hazaar': 1000}
+
+# One translation pass: Devanagari digits, the danda, and the diacritics that
+# transliterated (ISO) Hindi leaves behind
+NORMALIZE_TABLE = str.maketrans({
+    **{chr(0x0966 + digit): str(digit) for digit in range(10)},
+    '।': '.', '॥': '.',
+    'ā': 'a', 'ī': 'i', 'ū': 'u', 'ṛ': 'ri', 'ṝ': 'ri', 'ḷ': 'l', 'ḹ': 'l',
+    'ē': 'e', 'ō': 'o', 'ṃ': 'n', 'ṁ': 'n', 'ḥ': 'h', 'ṅ': 'ng', 'ñ': 'ny',
+    'ṭ': 't', 'ḍ': 'd', 'ṇ': 'n', 'ś': 'sh', 'ṣ': 'sh',
+})
+
+
+def regex_alternation(terms):
+    """Regex alternation of literal terms, longest first so prefixes never shadow them"""
+    return '|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+
+
+def _compile_number_pattern():
+    word_char = r'0-9a-z\u0900-\u097F'
+    left, right = rf'(?<![{word_char}])', rf'(?![{word_char}])'
+
+    multiplier = rf'(?:\s+(?P<multiplier>{regex_alternation(NUMBER_MULTIPLIERS)}){right})?'
+    follows_unit = rf'(?=\s*(?:{regex_alternation(LAND_UNITS_IN_ACRES)}|{regex_alternation(NUMBER_MULTIPLIERS)}){right})'
+    number = (
+        rf'{left}(?:(?P<digits>\d+(?:\.\d+)?)'
+        rf'|(?P<hindi>{regex_alternation(DEVANAGARI_NUMBER_WORDS)}){right}'
+        rf'|(?P<roman>{regex_alternation(ROMAN_NUMBER_WORDS)}){follows_unit})'
+    )
+    return re.compile(rf'(?P<space>\s+)|{number}{multiplier}')
+
+
+NUMBER_PATTERN = _compile_number_pattern()
+
+
+def _replace_number(match):
+    if match.group('space'):
+        return ' '
+    if match.group('digits'):
+        value = float(match.group('digits'))
+    elif match.group('hindi'):
+        value = DEVANAGARI_NUMBER_WORDS[match.group('hindi')]
     else:
-        # User not logged in, update session cart
-        if 'cart' in flask_session:
-            product_id_str = str(product_id)
-            if quantity <= 0:
-                flask_session['cart'].pop(product_id_str, None)
-            else:
-                flask_session['cart'][product_id_str] = quantity
-            flask_session.modified = True
-    
-    return redirect(url_for('cart'))
+        value = ROMAN_NUMBER_WORDS[match.group('roman')]
+    if match.group('multiplier'):
+        value *= NUMBER_MULTIPLIERS[match.group('multiplier')]
+    elif match.group('digits'):
+        return match.group('digits')
+    return f"{value:g}"
+
+
+def normalize_advisor_input(user_input):
+    """
+    Canonical form of a farmer's description, computed once per request and
+    consumed by both recommenders and the recommendation cache key.
+
+    NFKC-normalizes and casefolds the text, maps Devanagari digits and leftover
+    transliteration diacritics through one translation table, then in a single
+    regex pass collapses whitespace and turns number words ("तीन", "पच्चीस",
+    "dedh bigha", "do sau acre") into digits.
+    """
+    text = unicodedata.normalize('NFKC', user_input).casefold().translate(NORMALIZE_TABLE)
+    text = NUMBER_PATTERN.sub(_replace_number, text)
+    return text.strip(' .,!?')
+
+
+# ============================================
+# ADVISOR RESULT CACHES
+# ============================================
+
+class TwoTierCache:
+    """
+    In-memory LRU in front of a SQL table, both with TTL expiry.
+    `table` is a model with key, payload, created_at and expires_at columns;
+    `max_db_rows` optionally bounds the table by pruning the oldest rows.
+    """
+
+    def __init__(self, table, max_entries, ttl, max_db_rows=None):
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_db_rows = max_db_rows
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._table_ready = False
+        self._create_lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "expired": 0, "db_errors": 0}
+
+    def _bump(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _ensure_table(self):
+        if not self._table_ready:
+            # Serialized: concurrent checkfirst creates race on the same table
+            with self._create_lock:
+                if not self._table_ready:
+                    self.table.__table__.create(engine, checkfirst=True)
+                    self._table_ready = True
+
+    def _remember(self, key, payload, expires_at):
+        with self._lock:
+            self._memory[key] = (payload, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get_by_key(self, key):
+        """Return (payload, tier) or (None, None) on a miss"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return dict(entry[0]), "memory"
+                del self._memory[key]
+                self.stats["expired"] += 1
+
+        try:
+            self._ensure_table()
+            with Session(engine) as cache_session:
+                row = cache_session.get(self.table, key)
+                if row is not None:
+                    if row.expires_at > datetime.utcnow():
+                        payload = json.loads(row.payload)
+                        expires_at = now + (row.expires_at - datetime.utcnow()).total_seconds()
+                        self._remember(key, payload, expires_at)
+                        self._bump("db_hits")
+                        return dict(payload), "db"
+                    cache_session.delete(row)
+                    cache_session.commit()
+                    self._bump("expired")
+        except Exception as e:
+            self._bump("db_errors")
+            app.logger.warning("%s read error: %s", self.table.__tablename__, e)
+
+        self._bump("misses")
+        return None, None
+
+    def put_by_key(self, key, payload, **columns):
+        self._remember(key, dict(payload), time.time() + self.ttl)
+        self._bump("stores")
+        try:
+            self._ensure_table()
+            with Session(engine) as cache_session:
+                cache_session.merge(self.table(
+                    key=key,
+                    payload=json.dumps(payload, ensure_ascii=False),
+                    created_at=datetime.utcnow(),
+                    expires_at=datetime.utcnow() + timedelta(seconds=self.ttl),
+                    **columns
+                ))
+                if self.max_db_rows and self.stats["stores"] % 100 == 0:
+                    self._prune(cache_session)
+                cache_session.commit()
+        except Exception as e:
+            self._bump("db_errors")
+            app.logger.warning("%s write error: %s", self.table.__tablename__, e)
+
+    def _prune(self, cache_session):
+        """Drop expired rows and everything beyond the newest max_db_rows"""
+        cache_session.query(self.table).filter(self.table.expires_at <= datetime.utcnow()).delete()
+        cutoff = cache_session.query(self.table.created_at).order_by(
+            self.table.created_at.desc()
+        ).offset(self.max_db_rows).limit(1).scalar()
+        if cutoff is not None:
+            cache_session.query(self.table).filter(self.table.created_at <= cutoff).delete()
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+            data["memory_entries"] = len(self._memory)
+        lookups = data["memory_hits"] + data["db_hits"] + data["misses"]
+        data["hit_ratio"] = round((data["memory_hits"] + data["db_hits"]) / lookups, 4) if lookups else 0.0
+        data["ttl_seconds"] = self.ttl
+        data["max_entries"] = self.max_entries
+        return data
+
+
+class RecommendationResultCache(TwoTierCache):
+    """Gemini recommendations keyed on the output of normalize_advisor_input"""
+
+    def __init__(self, max_entries, ttl):
+        super().__init__(RecommendationCache, max_entries, ttl)
+
+    @staticmethod
+    def make_key(normalized_input):
+        return hashlib.sha256(normalized_input.encode('utf-8')).hexdigest()
+
+    def get(self, normalized_input):
+        """Return (recommendation, tier) or (None, None) on a miss"""
+        return self.get_by_key(self.make_key(normalized_input))
+
+    def put(self, normalized_input, recommendation):
+        self.put_by_key(self.make_key(normalized_input), recommendation, user_input=normalized_input)
+
+
+class TranscriptResultCache(TwoTierCache):
+    """Transcripts keyed on the SHA-256 of the uploaded audio bytes"""
+
+    def __init__(self, max_entries, ttl, max_db_rows):
+        super().__init__(TranscriptCache, max_entries, ttl, max_db_rows)
+
+    def get(self, audio_sha256, model, language):
+        """Return (transcript payload, tier) if this audio was already transcribed with the same settings"""
+        payload, tier = self.get_by_key(audio_sha256)
+        if payload is not None and (payload.get("model"), payload.get("language")) != (model, language):
+            return None, None
+        return payload, tier
+
+    def put(self, audio_sha256, transcript, model, language, size_bytes):
+        payload = {"transcript": transcript, "model": model, "language": language}
+        self.put_by_key(audio_sha256, payload, model=model, language=language, size_bytes=size_bytes)
+
+
+recommendation_cache = RecommendationResultCache(
+    max_entries=int(os.environ.get('ADVISOR_CACHE_SIZE', 1024)),
+    ttl=int(os.environ.get('ADVISOR_CACHE_TTL', 7 * 24 * 3600)),
+)
+
+transcript_cache = TranscriptResultCache(
+    max_entries=int(os.environ.get('TRANSCRIPT_CACHE_SIZE', 256)),
+    ttl=int(os.environ.get('TRANSCRIPT_CACHE_TTL', 30 * 24 * 3600)),
+    max_db_rows=int(os.environ.get('TRANSCRIPT_CACHE_DB_ROWS', 10000)),
+)
+
+
+# ============================================
+# RECOMMENDATION EXECUTION
+# ============================================
+
+# Seconds to wait for Gemini before answering with the keyword fallback (0 = always wait)
+app.config['ADVISOR_LATENCY_BUDGET'] = float(os.environ.get('ADVISOR_LATENCY_BUDGET', 0))
+# Maximum number of descriptions accepted by the batch endpoint
+app.config['ADVISOR_BATCH_MAX'] = int(os.environ.get('ADVISOR_BATCH_MAX', 50))
+# Letters and digits (Latin or Devanagari); transcripts with fewer than three are noise
+TRANSCRIPT_SIGNAL_CHARS = re.compile(r'[a-zA-Z0-9\u0900-\u097F]')
+# Shared, bounded pool for Gemini calls (hedged and batch requests)
+ADVISOR_LLM_WORKERS = int(os.environ.get('ADVISOR_LLM_WORKERS', 8))
+advisor_executor = ThreadPoolExecutor(
+    max_workers=ADVISOR_LLM_WORKERS,
+    thread_name_prefix='advisor-llm'
+)
+# Distinct Gemini calls allowed to be running or queued on the executor at once.
+# Hedged requests return at their budget while their call keeps going, so this,
+# not the bulkhead, is what bounds outstanding Gemini work; past it the keyword
+# fallback is served without calling Gemini.
+app.config['ADVISOR_MAX_PENDING'] = int(os.environ.get('ADVISOR_MAX_PENDING', ADVISOR_LLM_WORKERS * 4))
+
+_gemini_in_flight = {}  # normalized input -> Future, shared by identical requests
+_gemini_in_flight_lock = threading.Lock()
+# The same for asgi.py's event loop (normalized input -> asyncio.Task), filled there
+async_gemini_in_flight = {}
+advisor_stats = {"submitted": 0, "coalesced": 0, "shed": 0}
+
+
+def gemini_calls_outstanding():
+    """Gemini calls running or queued, threaded and async together"""
+    return len(_gemini_in_flight) + len(async_gemini_in_flight)
+
+
+def count_advisor_call(outcome):
+    """Bump one of advisor_stats: submitted, coalesced or shed"""
+    with _gemini_in_flight_lock:
+        advisor_stats[outcome] += 1
+
+
+def submit_gemini_recommendation(text):
+    """
+    Future for get_simple_fertilizer_recommendation(text) on the advisor executor.
+    Identical texts share the call already in flight; the answer is cached once
+    it arrives, however long the callers waited. None when ADVISOR_MAX_PENDING
+    calls are already outstanding.
+    """
+    with _gemini_in_flight_lock:
+        future = _gemini_in_flight.get(text)
+        if future is not None:
+            advisor_stats["coalesced"] += 1
+            return future
+        if gemini_calls_outstanding() >= app.config['ADVISOR_MAX_PENDING']:
+            advisor_stats["shed"] += 1
+            return None
+        future = advisor_executor.submit(get_simple_fertilizer_recommendation, text)
+        _gemini_in_flight[text] = future
+        advisor_stats["submitted"] += 1
+
+    def _finished(done):
+        with _gemini_in_flight_lock:
+            if _gemini_in_flight.get(text) is done:
+                del _gemini_in_flight[text]
+        try:
+            store_recommendation(text, done.result())
+        except Exception:
+            app.logger.exception("Storing the recommendation for %r failed", text)
+
+    future.add_done_callback(_finished)
+    return future
+
+
+def validate_advisor_input(user_input):
+    """Return an error message for unusable farmer input, or None if it is fine"""
+    if not user_input:
+        return "Empty input received"
+    if len(user_input) < 10:
+        return "Input too short. Please provide more details about your land and crops."
+    return None
 
-@app.route("/remove-from-cart/<int:product_id>")
-def remove_from_cart(product_id):
-    if current_user.is_authenticated:
-        # User is logged in, remove from database cart
-        user_cart = db_session.query(Cart).filter_by(user_id=current_user.id).first()
-        if user_cart:
-            cart_item = db_session.query(CartItem).filter_by(
-                cart_id=user_cart.id,
-                product_id=product_id
-            ).first()
-            if cart_item:
-                db_session.delete(cart_item)
-                db_session.commit()
-    else:
-        # User not logged in, remove from session cart
-        if 'cart' in flask_session:
-            flask_session['cart'].pop(str(product_id), None)
-            flask_session.modified = True
-    
-    flash('Item removed from cart', 'success')
-    return redirect(url_for('cart'))
 
-@app.route("/clear-cart")
-def clear_cart():
-    if current_user.is_authenticated:
-        # User is logged in, clear database cart
-        user_cart = db_session.query(Cart).filter_by(user_id=current_user.id).first()
-        if user_cart:
-            for cart_item in user_cart.cart_items:
-                db_session.delete(cart_item)
-            db_session.commit()
-    else:
-        # User not logged in, clear session cart
-        flask_session.pop('cart', None)
-    
-    flash('Cart cleared', 'success')
-    return redirect(url_for('cart'))
+def check_transcription_quality(transcription):
+    """
+    Reject transcripts that are empty, too short or mostly noise.
+    Returns an error payload with a bilingual user_message, or None if usable.
+    """
+    text = transcription.strip()
+    if len(text) < 5:
+        return {
+            "success": False,
+            "error": "Transcription too short",
+            "user_message": "आवाज़ स्पष्ट नहीं थी। कृपया ज़ोर से और साफ़ बोलें। / Voice was not clear. Please speak louder and clearer."
+        }
+    if len(TRANSCRIPT_SIGNAL_CHARS.findall(text)) < 3:
+        return {
+            "success": False,
+            "error": "Invalid transcription - mostly noise",
+            "user_message": "केवल शोर सुनाई दिया। कृपया शांत जगह में रिकॉर्ड करें। / Only noise detected. Please record in a quiet place."
+        }
+    if len(text) < 10:
+        return {
+            "success": False,
+            "error": "Transcription too short",
+            "user_message": "कृपया अधिक जानकारी दें। अपनी ज़मीन, मिट्टी और फसल के बारे में बताएं। / Please provide more information about your land, soil and crops."
+        }
+    return None
 
-@app.route("/checkout", methods=['GET', 'POST'])
-@login_required
-def checkout():
-    # Get user's cart
-    user_cart = db_session.query(Cart).filter_by(user_id=current_user.id).first()
-    
-    if not user_cart or not user_cart.cart_items:
-        flash('Your cart is empty', 'error')
-        return redirect(url_for('shop'))
-    
-    if request.method == 'POST':
-        # Validate all required fields
-        first_name = request.form.get('first_name', '').strip()
-        last_name = request.form.get('last_name', '').strip()
-        email = request.form.get('email', '').strip()
-        phone = request.form.get('phone', '').strip()
-        address = request.form.get('address', '').strip()
-        city = request.form.get('city', '').strip()
-        state = request.form.get('state', '').strip()
-        country = request.form.get('country', 'india')
-        
-        # Check if all required fields are filled
-        if not all([first_name, last_name, email, phone, address, city, state]):
-            flash('Please fill in all required fields', 'error')
-            return redirect(url_for('checkout'))
-        
-        # Validate phone number (must be exactly 10 digits)
-        if not phone.isdigit() or len(phone) != 10:
-            flash('Phone number must be exactly 10 digits', 'error')
-            return redirect(url_for('checkout'))
-        
-        # Optional fields
-        telephone = request.form.get('telephone', '').strip()
-        company = request.form.get('company', '').strip()
-        postcode = request.form.get('postcode', '').strip()
-        order_notes = request.form.get('order_notes', '').strip()
-        
-        # Calculate total
-        total_amount = user_cart.get_total()
-        
-        # Create order
-        new_order = Order(
-            user_id=current_user.id,
-            first_name=first_name,
-            last_name=last_name,
-            email=email,
-            phone=phone,
-            telephone=telephone if telephone else None,
-            company=company if company else None,
-            address=address,
-            city=city,
-            state=state,
-            country=country,
-            postcode=postcode if postcode else None,
-            order_notes=order_notes if order_notes else None,
-            total_amount=total_amount,
-            status='pending'
-        )
-        db_session.add(new_order)
-        db_session.flush()  # Get the order ID
-        
-        # Create order items from cart items
-        for cart_item in user_cart.cart_items:
-            order_item = OrderItem(
-                order_id=new_order.id,
-                product_id=cart_item.product_id,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price
-            )
-            db_session.add(order_item)
-        
-        # Clear the cart
-        for cart_item in user_cart.cart_items:
-            db_session.delete(cart_item)
-        
-        db_session.commit()
-        
-        flash(f'Order #{new_order.id} placed successfully! Thank you for your purchase.', 'success')
-        return redirect(url_for('order_confirmation', order_id=new_order.id))
+
+def store_recommendation(user_input, recommendation):
+    """Cache AI answers; the keyword fallback is instant and not worth caching"""
+    if recommendation.get("source") == "gemini":
+        recommendation_cache.put(user_input, recommendation)
+
+
+def parse_latency_budget(value):
+    """Milliseconds from a request to seconds, ADVISOR_LATENCY_BUDGET when absent; ValueError if not numeric"""
+    if value is None:
+        return app.config['ADVISOR_LATENCY_BUDGET']
+    try:
+        return float(value) / 1000
+    except (TypeError, ValueError):
+        raise ValueError("latency_budget_ms must be a number")
+
+
+def recommend_for_input(user_input, budget):
+    """
+    Cache lookup, then Gemini (hedged when `budget` seconds > 0; the answer is
+    cached as it arrives), then matching catalog products from the product index.
     
-    # GET request - show checkout form
-    cart_items = []
-    total = user_cart.get_total()
+    Returns:
+        tuple: (recommendation dict, cache tier or None on a miss)
+    """
+    # Normalized once; the cache key and both recommenders use the same text
+    text = normalize_advisor_input(user_input)
     
-    for cart_item in user_cart.cart_items:
-        cart_items.append({
-            'product': cart_item.product,
-            'quantity': cart_item.quantity,
-            'subtotal': cart_item.get_subtotal()
-        })
+    # Serve repeated descriptions from the cache instead of calling Gemini again
+    recommendation, cache_tier = recommendation_cache.get(text)
+    if recommendation is None:
+        if budget > 0:
+            recommendation = get_hedged_recommendation(text, min(budget, 30))
+        else:
+            future = submit_gemini_recommendation(text)
+            recommendation = dict(future.result()) if future is not None else get_fallback_recommendation(text)
     
-    return render_template("checkout.html", cart_items=cart_items, total=total, user=current_user)
+    # Attached after caching so stock is always current
+    recommendation["catalog_products"] = match_catalog_products(recommendation)
+    return recommendation, cache_tier
 
-@app.route("/order-confirmation/<int:order_id>")
-@login_required
-def order_confirmation(order_id):
-    order = db_session.get(Order, order_id)
-    
-    if not order or order.user_id != current_user.id:
-        flash('Order not found', 'error')
-        return redirect(url_for('shop'))
-    
-    return render_template("order-confirmation.html", order=order)
 
-@app.route("/orders")
-@login_required
-def orders():
-    # Get all orders for the current user
-    user_orders = db_session.query(Order).filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
-    
-    return render_template("orders.html", orders=user_orders)
+def get_hedged_recommendation(user_input, budget):
+    """
+    Race Gemini against the local fallback.
 
-@app.route("/order/<int:order_id>")
-@login_required
-def order_details(order_id):
-    order = db_session.get(Order, order_id)
-    
-    if not order or order.user_id != current_user.id:
-        flash('Order not found', 'error')
-        return redirect(url_for('orders'))
-    
-    return render_template("order-details.html", order=order)
+    The Gemini call runs on the advisor executor while the keyword fallback is
+    computed inline. If Gemini answers within `budget` seconds its answer is
+    returned, otherwise the fallback is returned marked as provisional and the
+    late Gemini answer still fills the cache for the next request. When too
+    many Gemini calls are outstanding the fallback is returned as final.
+    """
+    future = submit_gemini_recommendation(user_input)
+    fallback = get_fallback_recommendation(user_input)
+    if future is None:
+        return fallback
+
+    try:
+        # A copy: coalesced requests share the future's result
+        return dict(future.result(timeout=budget))
+    except FuturesTimeoutError:
+        fallback["provisional"] = True
+        return fallback
 
-@app.context_processor
-def inject_cart_count():
-    """Make cart count available to all templates"""
-    cart_count = 0
-    if current_user.is_authenticated:
-        # User is logged in, get count from database cart
-        user_cart = db_session.query(Cart).filter_by(user_id=current_user.id).first()
-        if user_cart:
-            cart_count = user_cart.get_item_count()
-    else:
-        # User not logged in, get count from session cart
-        if 'cart' in flask_session:
-            cart_count = sum(flask_session['cart'].values())
-    return dict(cart_count=cart_count)
 
 # ============================================
-# ADMIN ROUTES
+# STREAMING AUDIO UPLOADS
 # ============================================
 
-def admin_required(f):
-    """Decorator to require admin access"""
-    from functools import wraps
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated or not current_user.is_admin:
-            flash('Admin access required', 'error')
-            return redirect(url_for('admin_login'))
-        return f(*args, **kwargs)
-    return decorated_function
+# Largest accepted recording, enforced while the body is being streamed
+app.config['AUDIO_MAX_UPLOAD_BYTES'] = int(os.environ.get('AUDIO_MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+app.config['AUDIO_UPLOAD_CHUNK_SIZE'] = int(os.environ.get('AUDIO_UPLOAD_CHUNK_SIZE', 64 * 1024))
 
-@app.route("/admin/login", methods=['GET', 'POST'])
-def admin_login():
-    if current_user.is_authenticated and current_user.is_admin:
-        return redirect(url_for('admin_dashboard'))
-    
-    if request.method == 'POST':
-        username = request.form.get('username')
-        password = request.form.get('password')
+
+def upload_too_large_payload():
+    max_mb = app.config['AUDIO_MAX_UPLOAD_BYTES'] / (1024 * 1024)
+    return {
+        "success": False,
+        "error": f"Audio file too large. Maximum size is {round(max_mb, 1):g} MB"
+    }, 413, {}
+
+
+class UploadTooLargeError(Exception):
+    """Raised while streaming when an upload exceeds AUDIO_MAX_UPLOAD_BYTES"""
+
+
+class StreamingAudioUpload:
+    """
+    Pulls one file field out of a multipart request body incrementally.
+
+    The body is read from the WSGI stream chunk by chunk and fed to werkzeug's
+    sans-IO multipart decoder, so the file is never spooled to disk or held in
+    memory as a whole. Call open() to advance to the file, then iterate to get
+    its bytes. asgi.py subclasses it to read an ASGI body with await; the
+    decoding, size limit and hashing below are shared.
+    """
+
+    def __init__(self, stream, boundary, field_name, max_bytes, chunk_size):
+        self._stream = stream
+        # Room for one chunk plus the partial boundary the decoder holds back between reads
+        self._decoder = multipart.MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=chunk_size + 64 * 1024)
+        self._field_name = field_name
+        self._finished = False
+        self._events = self._iter_events()
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.filename = None
+        self.content_type = None
+        self.bytes_read = 0
+        self.sha256 = hashlib.sha256()  # updated as chunks stream through
+
+    @classmethod
+    def from_body(cls, stream, content_type, field_name='audio'):
+        """Build an upload reader for a request body, or None if it is not multipart"""
+        mimetype, options = parse_options_header(content_type or '')
+        boundary = options.get('boundary')
+        if mimetype.lower() != 'multipart/form-data' or not boundary:
+            return None
+        return cls(stream, boundary, field_name,
+                   app.config['AUDIO_MAX_UPLOAD_BYTES'], app.config['AUDIO_UPLOAD_CHUNK_SIZE'])
+
+    def _feed(self, chunk):
+        """Hand the decoder the next chunk read from the body; empty means end of body"""
+        if not chunk:
+            self._finished = True
+        self._decoder.receive_data(chunk or None)
+
+    def _iter_events(self):
+        while True:
+            event = self._decoder.next_event()
+            if isinstance(event, multipart.NeedData):
+                if self._finished:
+                    return
+                self._feed(self._stream.read(self.chunk_size))
+                continue
+            yield event
+            if isinstance(event, multipart.Epilogue):
+                return
+
+    def _is_requested_file(self, event):
+        if isinstance(event, multipart.File) and event.name == self._field_name:
+            self.filename = event.filename
+            self.content_type = event.headers.get('content-type')
+            return True
+        return False
+
+    def _take(self, event):
+        """Count, limit and hash the bytes of one Data event"""
+        if event.data:
+            self.bytes_read += len(event.data)
+            if self.bytes_read > self.max_bytes:
+                raise UploadTooLargeError(f"Audio upload exceeds {self.max_bytes} bytes")
+            self.sha256.update(event.data)
+        return event.data
+
+    def open(self):
+        """Skip ahead to the requested file field; False if the body has none"""
+        for event in self._events:
+            if self._is_requested_file(event):
+                return True
+        return False
+
+    def __iter__(self):
+        for event in self._events:
+            if not isinstance(event, multipart.Data):
+                return
+            data = self._take(event)
+            if data:
+                yield data
+            if not event.more_data:
+                return
+
+
+# ============================================
+# TRANSCRIPTION BACKENDS
+# ============================================
+
+class TranscriptionUnavailableError(Exception):
+    """Raised when the configured transcription backend cannot be used"""
+
+
+class TranscriptionBackend:
+    """
+    Interface for speech-to-text providers used by /api/transcribe-audio.
+    transcribe() receives an iterable of audio byte chunks and returns the
+    transcript text (empty string if no speech was found).
+    """
+    name = "base"
+    model = "unknown"
+
+    def transcribe(self, chunks, language):
+        raise NotImplementedError
+
+
+class DeepgramBackend(TranscriptionBackend):
+    """Deepgram prerecorded API; the client is created once and streams the chunks upstream"""
+    name = "deepgram"
+
+    def __init__(self, api_key, model="nova-2"):
+        from deepgram import DeepgramClient
+        self.api_key = api_key
+        self.model = model
+        self._client = DeepgramClient(api_key)
+
+    def transcribe(self, chunks, language):
+        from deepgram import PrerecordedOptions, FileSource
         
-        user = db_session.query(User).filter_by(username=username).first()
+        payload: FileSource = {
+            "stream": chunks,
+        }
         
-        if user and check_password_hash(user.password_hash, password) and user.is_admin:
-            login_user(user)
-            flash('Welcome to Admin Dashboard!', 'success')
-            return redirect(url_for('admin_dashboard'))
-        else:
-            flash('Invalid admin credentials', 'error')
-    
-    return render_template("admin/admin_login.html")
+        options = PrerecordedOptions(
+            model=self.model,
+            language=language,
+            smart_format=True,
+            punctuate=True,
+        )
+        
+        with outbound_call("deepgram"):
+            response = self._client.listen.prerecorded.v("1").transcribe_file(payload, options)
+        return response["results"]["channels"][0]["alternatives"][0]["transcript"]
+
+
+class PathTranscriptionBackend(TranscriptionBackend):
+    """
+    Adapter for file-path transcribers such as reference/speech_recog.py's
+    transcribe_audio(temp_path, language). The chunks are spooled to a temp
+    file because that interface needs a path.
+    """
+    name = "path"
+
+    def __init__(self, transcribe_func, model):
+        self._transcribe_func = transcribe_func
+        self.model = model
+
+    def transcribe(self, chunks, language):
+        with tempfile.NamedTemporaryFile(suffix='.webm') as temp_audio:
+            for chunk in chunks:
+                temp_audio.write(chunk)
+            temp_audio.flush()
+            return self._transcribe_func(temp_audio.name, language=language)
+
+
+class LocalTranscriptionBackend(TranscriptionBackend):
+    """
+    Deterministic stand-in for tests and load benchmarks: no network, no API key.
+    The transcript is chosen from fixed farmer phrases by a hash of the audio,
+    after an optional simulated delay.
+    """
+    name = "local"
+    model = "local-v1"
+
+    PHRASES = [
+        "मेरे पास दो एकड़ जमीन है और मैं गेहूं उगाता हूं",
+        "mere paas teen bigha khet hai, tomato aur aloo ki kheti karta hoon",
+        "I have 5 acre land, the wheat leaves are turning yellow",
+        "पांच एकड़ धान का खेत है, जड़ कमजोर है और रोग लग रहा है",
+    ]
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def transcribe(self, chunks, language):
+        digest = hashlib.sha256()
+        for chunk in chunks:
+            digest.update(chunk)
+        if self.delay:
+            time.sleep(self.delay)
+        return self.phrase_for(digest)
 
-@app.route("/admin/dashboard")
-@admin_required
-def admin_dashboard():
-    # Get statistics
-    total_users = db_session.query(User).count()
-    total_products = db_session.query(Product).count()
-    total_categories = db_session.query(Category).count()
-    total_orders = db_session.query(Order).count()
+    def phrase_for(self, digest):
+        """Phrase picked by a finished sha256 of the audio"""
+        return self.PHRASES[digest.digest()[0] % len(self.PHRASES)]
+
+
+_transcription_backend = None
+_transcription_backend_lock = threading.Lock()
+
+
+def get_transcription_backend():
+    """
+    Backend selected by TRANSCRIPTION_BACKEND: 'deepgram' (default), 'local',
+    or 'module:function' for a path-based transcriber. Built once per process.
+    """
+    global _transcription_backend
+    if _transcription_backend is None:
+        with _transcription_backend_lock:
+            if _transcription_backend is None:
+                _transcription_backend = _build_transcription_backend(
+                    os.environ.get('TRANSCRIPTION_BACKEND', 'deepgram')
+                )
+    return _transcription_backend
+
+
+def _build_transcription_backend(spec):
+    if spec == 'local':
+        return LocalTranscriptionBackend(delay=float(os.environ.get('LOCAL_TRANSCRIBE_DELAY', 0)))
     
-    # Get recent orders
-    recent_orders = db_session.query(Order).order_by(Order.created_at.desc()).limit(5).all()
+    if ':' in spec:
+        module_name, func_name = spec.split(':', 1)
+        try:
+            transcribe_func = getattr(importlib.import_module(module_name), func_name)
+        except (ImportError, AttributeError) as e:
+            raise TranscriptionUnavailableError(f"Cannot load transcription backend {spec}: {str(e)}")
+        return PathTranscriptionBackend(transcribe_func, model=spec)
     
-    # Get total revenue
-    from sqlalchemy import func
-    total_revenue = db_session.query(func.sum(Order.total_amount)).filter(Order.status != 'cancelled').scalar() or 0
+    if spec != 'deepgram':
+        raise TranscriptionUnavailableError(f"Unknown transcription backend: {spec}")
     
-    return render_template("admin/dashboard.html", 
-                         total_users=total_users,
-                         total_products=total_products,
-                         total_categories=total_categories,
-                         total_orders=total_orders,
-                         recent_orders=recent_orders,
-                         total_revenue=total_revenue)
+    deepgram_api_key = os.getenv('DEEPGRAM_API_KEY')
+    if not deepgram_api_key:
+        raise TranscriptionUnavailableError("Deepgram API key not configured")
+    return DeepgramBackend(deepgram_api_key, model=os.environ.get('DEEPGRAM_MODEL', 'nova-2'))
+
 
 # ============================================
-# ADMIN - USERS MANAGEMENT
+# CATALOG PRODUCT INDEX
 # ============================================
 
-@app.route("/admin/users")
-@admin_required
-def admin_users():
-    users = db_session.query(User).all()
-    return render_template("admin/users.html", users=users)
+class ProductTextIndex:
+    """
+    In-memory TF-IDF index over product name, tags and description, used to
+    map advisor recommendations onto real catalog products.
 
-@app.route("/admin/users/<int:user_id>/delete", methods=['POST'])
-@admin_required
-def admin_delete_user(user_id):
-    user = db_session.get(User, user_id)
-    if user and user.id != current_user.id:  # Can't delete yourself
-        db_session.delete(user)
-        db_session.commit()
-        flash(f'User {user.username} deleted successfully', 'success')
-    else:
-        flash('Cannot delete this user', 'error')
-    return redirect(url_for('admin_users'))
+    Postings are kept per term so a query only touches the products sharing a
+    term with it. Committed product writes mark ids dirty (see
+    _bump_catalog_version) and only those rows are re-read and re-indexed
+    before the next query; a bulk statement forces a full reload. Refreshes
+    and searches both run under the lock, so a search never sees the
+    postings half-updated.
+    """
 
-# ============================================
-# ADMIN - PRODUCTS MANAGEMENT
-# ============================================
+    TOKEN = re.compile(r'[a-z0-9\u0900-\u097F]+')
+    FIELD_WEIGHTS = (("name", 2.0), ("tags", 2.0), ("description", 1.0))
 
-@app.route("/admin/products")
-@admin_required
-def admin_products():
-    products = db_session.query(Product).all()
-    return render_template("admin/products.html", products=products)
+    def __init__(self):
+        self._postings = {}   # term -> {product_id: weighted tf}
+        self._doc_terms = {}  # product_id -> {term: weighted tf}
+        self._norms = {}      # product_id -> length normalisation
+        self._meta = {}       # product_id -> display fields
+        self._dirty = set()
+        self._loaded = False
+        self._lock = threading.Lock()
 
-@app.route("/admin/products/add", methods=['GET', 'POST'])
-@admin_required
-def admin_add_product():
-    if request.method == 'POST':
-        product = Product(
-            name=request.form.get('name'),
-            description=request.form.get('description'),
-            price=float(request.form.get('price')),
-            image_filename=request.form.get('image_filename'),
-            stock=int(request.form.get('stock')),
-            category_id=int(request.form.get('category_id')) if request.form.get('category_id') else None,
-            sku=request.form.get('sku'),
-            tags=request.form.get('tags'),
-            is_featured=bool(request.form.get('is_featured')),
-            is_hot=bool(request.form.get('is_hot')),
-            is_sale=bool(request.form.get('is_sale'))
-        )
-        db_session.add(product)
-        db_session.commit()
-        flash('Product added successfully', 'success')
-        return redirect(url_for('admin_products'))
-    
-    categories = db_session.query(Category).all()
-    return render_template("admin/product_form.html", product=None, categories=categories)
+    @classmethod
+    def tokenize(cls, text):
+        return cls.TOKEN.findall((text or '').lower())
 
-@app.route("/admin/products/<int:product_id>/edit", methods=['GET', 'POST'])
-@admin_required
-def admin_edit_product(product_id):
-    product = db_session.get(Product, product_id)
-    if not product:
-        flash('Product not found', 'error')
-        return redirect(url_for('admin_products'))
-    
-    if request.method == 'POST':
-        product.name = request.form.get('name')
-        product.description = request.form.get('description')
-        product.price = float(request.form.get('price'))
-        product.image_filename = request.form.get('image_filename')
-        product.stock = int(request.form.get('stock'))
-        product.category_id = int(request.form.get('category_id')) if request.form.get('category_id') else None
-        product.sku = request.form.get('sku')
-        product.tags = request.form.get('tags')
-        product.is_featured = bool(request.form.get('is_featured'))
-        product.is_hot = bool(request.form.get('is_hot'))
-        product.is_sale = bool(request.form.get('is_sale'))
-        
-        db_session.commit()
-        flash('Product updated successfully', 'success')
-        return redirect(url_for('admin_products'))
-    
-    categories = db_session.query(Category).all()
-    return render_template("admin/product_form.html", product=product, categories=categories)
+    def _remove(self, product_id):
+        for term in self._doc_terms.pop(product_id, {}):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._norms.pop(product_id, None)
+        self._meta.pop(product_id, None)
 
-@app.route("/admin/products/<int:product_id>/delete", methods=['POST'])
-@admin_required
-def admin_delete_product(product_id):
-    product = db_session.get(Product, product_id)
-    if product:
-        db_session.delete(product)
-        db_session.commit()
-        flash('Product deleted successfully', 'success')
-    return redirect(url_for('admin_products'))
+    def _add(self, product):
+        counts = {}
+        for field, weight in self.FIELD_WEIGHTS:
+            for term in self.tokenize(getattr(product, field)):
+                counts[term] = counts.get(term, 0) + weight
+        terms = {term: 1 + math.log(count) for term, count in counts.items()}
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[product.id] = tf
+        self._doc_terms[product.id] = terms
+        self._norms[product.id] = math.sqrt(sum(tf * tf for tf in terms.values())) or 1.0
+        self._meta[product.id] = {
+            "id": product.id,
+            "name": product.name,
+            "price": product.price,
+            "stock": product.stock,
+            "image_filename": product.image_filename,
+            # Built without a request context so async callers can use the index too
+            "url": app.url_map.bind('').build('shop_details', {'product_id': product.id}),
+        }
 
-# ============================================
-# ADMIN - CATEGORIES MANAGEMENT
-# ============================================
+    def products_changed(self, product_ids, rebuild=False):
+        """Called after a commit: re-read these products, or everything when `rebuild`"""
+        with self._lock:
+            if rebuild:
+                self._loaded = False
+            self._dirty.update(product_ids)
 
-@app.route("/admin/categories")
-@admin_required
-def admin_categories():
-    categories = db_session.query(Category).all()
-    return render_template("admin/categories.html", categories=categories)
+    def _refresh(self):
+        """Load everything on first use, afterwards re-read only dirty products (lock held)"""
+        if self._loaded and not self._dirty:
+            return
+        with Session(engine) as index_session:
+            if not self._loaded:
+                for product_id in list(self._doc_terms):
+                    self._remove(product_id)
+                for product in index_session.query(Product).all():
+                    self._add(product)
+                self._loaded = True
+                self._dirty.clear()
+                return
+            dirty, self._dirty = self._dirty, set()
+            for product_id in dirty:
+                self._remove(product_id)
+                product = index_session.get(Product, product_id)
+                if product is not None:
+                    self._add(product)
 
-@app.route("/admin/categories/add", methods=['GET', 'POST'])
-@admin_required
-def admin_add_category():
-    if request.method == 'POST':
-        category = Category(
-            name=request.form.get('name'),
-            description=request.form.get('description')
+    def search(self, query_terms, limit=3, in_stock_only=False):
+        """Best matching products for a list of query terms, highest score first"""
+        with self._lock:
+            self._refresh()
+            return self._search(query_terms, limit, in_stock_only)
+
+    def _search(self, query_terms, limit, in_stock_only):
+        total_docs = len(self._doc_terms) or 1
+        scores = {}
+        for term in set(query_terms):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log((1 + total_docs) / (1 + len(postings))) + 1
+            for product_id, tf in postings.items():
+                scores[product_id] = scores.get(product_id, 0.0) + tf * idf
+
+        ranked = sorted(
+            ((score / self._norms[product_id], product_id) for product_id, score in scores.items()),
+            reverse=True
         )
-        db_session.add(category)
-        db_session.commit()
-        flash('Category added successfully', 'success')
-        return redirect(url_for('admin_categories'))
-    
-    return render_template("admin/category_form.html", category=None)
+        results = []
+        for score, product_id in ranked:
+            meta = self._meta[product_id]
+            if in_stock_only and not meta["stock"]:
+                continue
+            results.append(dict(meta, score=round(score, 4)))
+            if len(results) >= limit:
+                break
+        return results
 
-@app.route("/admin/categories/<int:category_id>/edit", methods=['GET', 'POST'])
-@admin_required
-def admin_edit_category(category_id):
-    category = db_session.get(Category, category_id)
-    if not category:
-        flash('Category not found', 'error')
-        return redirect(url_for('admin_categories'))
-    
-    if request.method == 'POST':
-        category.name = request.form.get('name')
-        category.description = request.form.get('description')
-        db_session.commit()
-        flash('Category updated successfully', 'success')
-        return redirect(url_for('admin_categories'))
-    
-    return render_template("admin/category_form.html", category=category)
 
-@app.route("/admin/categories/<int:category_id>/delete", methods=['POST'])
-@admin_required
-def admin_delete_category(category_id):
-    category = db_session.get(Category, category_id)
-    if category:
-        db_session.delete(category)
-        db_session.commit()
-        flash('Category deleted successfully', 'success')
-    return redirect(url_for('admin_categories'))
+# Catalog vocabulary for each nutrient the recommenders can return
+NUTRIENT_QUERY_TERMS = {
+    "Nitrogen": ["nitrogen", "urea", "npk", "नाइट्रोजन", "यूरिया"],
+    "Phosphorus": ["phosphorus", "phosphate", "dap", "npk", "फॉस्फोरस"],
+    "Potassium": ["potassium", "potash", "mop", "npk", "पोटैशियम"],
+}
+
+product_index = ProductTextIndex()
+
+
+def match_catalog_products(recommendation, limit=3):
+    """Catalog products (with live stock) that best fit a recommendation"""
+    query_terms = ["fertilizer", "fertiliser", "खाद"]
+    for nutrient in recommendation.get("nutrients") or []:
+        query_terms.extend(NUTRIENT_QUERY_TERMS.get(nutrient, [nutrient.lower()]))
+    query_terms.extend(ProductTextIndex.tokenize(recommendation.get("product_name")))
+    return product_index.search(query_terms, limit=limit)
+
 
 # ============================================
-# ADMIN - ORDERS MANAGEMENT
+# SEARCH SUGGESTIONS
 # ============================================
 
-@app.route("/admin/orders")
-@admin_required
-def admin_orders():
-    orders = db_session.query(Order).order_by(Order.created_at.desc()).all()
-    return render_template("admin/orders.html", orders=orders)
+class SuggestIndex:
+    """
+    Prefix index for search-as-you-type over product names, SKUs and tags.
 
-@app.route("/admin/orders/<int:order_id>")
-@admin_required
-def admin_order_details(order_id):
-    order = db_session.get(Order, order_id)
-    if not order:
-        flash('Order not found', 'error')
-        return redirect(url_for('admin_orders'))
-    return render_template("admin/order_details.html", order=order)
+    Every product contributes keys: its lowercased name, the name from each
+    later word on (so "lily" finds "Peace Lily"), its SKU and each tag. The
+    distinct keys are kept in one sorted list, so all keys with a prefix are a
+    contiguous range found with two bisects. Each key maps to its products,
+    most popular (units sold) first.
 
-@app.route("/admin/orders/<int:order_id>/update-status", methods=['POST'])
-@admin_required
-def admin_update_order_status(order_id):
-    order = db_session.get(Order, order_id)
-    if order:
-        new_status = request.form.get('status')
-        order.status = new_status
-        db_session.commit()
-        flash(f'Order #{order_id} status updated to {new_status}', 'success')
-    return redirect(url_for('admin_order_details', order_id=order_id))
+    A small range is answered by merging the heads of its postings. A large
+    range, such as a one-letter prefix, is answered from a memoized top list
+    stored under the longest prefix shared by the whole range. Product writes
+    update keys, postings and the affected top lists in place after their
+    commit. Popularity drifts with every order, so the whole index is rebuilt
+    in a background thread every `popularity_ttl` seconds (and after bulk
+    product statements, whose rows are unknown).
+    """
 
-@app.route("/admin/orders/<int:order_id>/delete", methods=['POST'])
-@admin_required
-def admin_delete_order(order_id):
-    order = db_session.get(Order, order_id)
-    if order:
-        db_session.delete(order)
-        db_session.commit()
-        flash('Order deleted successfully', 'success')
-    return redirect(url_for('admin_orders'))
+    # Key ranges wider than this are answered from the memoized top lists
+    SCAN_LIMIT = 32
+    COLUMNS = (Product.id, Product.name, Product.sku, Product.tags, Product.price,
+               Product.image_filename, Product.is_featured)
 
-# ============================================
-# ADMIN - CHANGE PASSWORD
-# ============================================
+    def __init__(self, max_suggestions, popularity_ttl):
+        self.max_suggestions = max_suggestions
+        self.popularity_ttl = popularity_ttl
+        self._keys = []           # sorted distinct keys
+        self._postings = {}       # key -> product ids, best first
+        self._product_keys = {}   # product_id -> keys
+        self._units = {}          # product_id -> units sold
+        self._rank = {}           # product_id -> sort key, smaller is better
+        self._meta = {}           # product_id -> display fields
+        self._top = {}            # shared prefix -> best product ids under it
+        self._dirty = set()
+        self._journal = None      # product ids changed while a rebuild is reading the database
+        self._needs_rebuild = False
+        self._loaded_at = None
+        self._rebuilding = False
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.stats = {"queries": 0, "builds": 0, "incremental_updates": 0, "last_build_seconds": 0.0}
 
-@app.route("/admin/change-password", methods=['GET', 'POST'])
-@admin_required
-def admin_change_password():
-    if request.method == 'POST':
-        current_password = request.form.get('current_password')
-        new_password = request.form.get('new_password')
-        confirm_password = request.form.get('confirm_password')
-        
-        # Verify current password
-        if not check_password_hash(current_user.password_hash, current_password):
-            flash('Current password is incorrect', 'error')
-            return redirect(url_for('admin_change_password'))
-        
-        # Check if new passwords match
-        if new_password != confirm_password:
-            flash('New passwords do not match', 'error')
-            return redirect(url_for('admin_change_password'))
-        
-        # Check password length
-        if len(new_password) < 6:
-            flash('New password must be at least 6 characters long', 'error')
-            return redirect(url_for('admin_change_password'))
-        
-        # Update password - get fresh user from database
-        user = db_session.get(User, current_user.id)
-        user.password_hash = generate_password_hash(new_password)
-        db_session.commit()
-        
-        flash('Password changed successfully!', 'success')
-        return redirect(url_for('admin_dashboard'))
-    
-    return render_template("admin/change_password.html")
+    @staticmethod
+    def normalize(text):
+        return ' '.join((text or '').lower().split())
+
+    @classmethod
+    def keys_for(cls, product):
+        words = cls.normalize(product.name).split(' ')
+        keys = {' '.join(words[start:]) for start in range(len(words))}
+        keys.add(cls.normalize(product.sku))
+        keys.update(cls.normalize(tag) for tag in (product.tags or '').split(','))
+        keys.discard('')
+        return frozenset(keys)
+
+    def _rank_for(self, product):
+        return (-self._units.get(product.id, 0), not product.is_featured, product.id)
+
+    @staticmethod
+    def _display(product):
+        # "url" is added the first time the product is suggested
+        return {
+            "id": product.id,
+            "name": product.name,
+            "sku": product.sku,
+            "price": product.price,
+            "image_filename": product.image_filename,
+        }
+
+    # --- building ---
+
+    @staticmethod
+    def _load_units(index_session):
+        from sqlalchemy import func
+        return dict(index_session.query(OrderItem.product_id, func.sum(OrderItem.quantity))
+                    .group_by(OrderItem.product_id).all())
+
+    def _build(self):
+        """Fresh index structures from the database, built without holding the lock"""
+        started = time.perf_counter()
+        fresh = SuggestIndex(self.max_suggestions, self.popularity_ttl)
+        with Session(engine) as index_session:
+            fresh._units = self._load_units(index_session)
+            for product in index_session.execute(select(*self.COLUMNS)):
+                keys = self.keys_for(product)
+                fresh._product_keys[product.id] = keys
+                fresh._rank[product.id] = fresh._rank_for(product)
+                fresh._meta[product.id] = fresh._display(product)
+                for key in keys:
+                    fresh._postings.setdefault(key, []).append(product.id)
+        for product_ids in fresh._postings.values():
+            product_ids.sort(key=fresh._rank.__getitem__)
+        fresh._keys = sorted(fresh._postings)
+        # Warm the widest ranges, the one- and two-character prefixes people type first
+        for length in (1, 2):
+            for prefix in sorted({key[:length] for key in fresh._keys}):
+                fresh._lookup(prefix)
+        fresh.stats["last_build_seconds"] = round(time.perf_counter() - started, 4)
+        return fresh
+
+    def _install(self, fresh):
+        """Swap in structures from _build(); changes committed while building are re-applied"""
+        with self._lock:
+            for name in ('_keys', '_postings', '_product_keys', '_units', '_rank', '_meta', '_top'):
+                setattr(self, name, getattr(fresh, name))
+            self._dirty |= self._journal
+            self._journal = None
+            self._loaded_at = time.monotonic()
+            self.stats["builds"] += 1
+            self.stats["last_build_seconds"] = fresh.stats["last_build_seconds"]
+
+    def _rebuild(self, only_if_unloaded=False):
+        with self._build_lock:
+            if only_if_unloaded and self._loaded_at is not None:
+                return
+            with self._lock:
+                self._journal = set()
+            try:
+                fresh = self._build()
+            except Exception:
+                with self._lock:
+                    self._journal = None
+                raise
+            self._install(fresh)
+
+    def _background_rebuild(self):
+        try:
+            self._rebuild()
+        except Exception:
+            app.logger.exception("Suggest index rebuild failed")
+        finally:
+            self._rebuilding = False
+
+    def products_changed(self, product_ids, rebuild=False):
+        """Called after a commit that wrote products; rebuild=True when the rows are unknown"""
+        with self._lock:
+            self._dirty.update(product_ids)
+            if self._journal is not None:
+                self._journal.update(product_ids)
+            if rebuild:
+                self._needs_rebuild = True
+
+    def _refresh(self):
+        if self._loaded_at is None:
+            # Concurrent first requests wait for a single build
+            self._rebuild(only_if_unloaded=True)
+        elif self._needs_rebuild or time.monotonic() - self._loaded_at > self.popularity_ttl:
+            # Keep answering from the current index while a fresh one is built
+            with self._lock:
+                start = not self._rebuilding
+                self._rebuilding = True
+                self._needs_rebuild = False
+            if start:
+                threading.Thread(target=self._background_rebuild, name="suggest-index-rebuild", daemon=True).start()
+        if self._dirty:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+            with Session(engine) as index_session:
+                products = {product.id: product for product in
+                            index_session.execute(select(*self.COLUMNS).where(Product.id.in_(dirty)))}
+                with self._lock:
+                    for product_id in dirty:
+                        self._apply(product_id, products.get(product_id))
+                    self.stats["incremental_updates"] += len(dirty)
+
+    # --- incremental updates (called with the lock held) ---
+
+    def _apply(self, product_id, product):
+        """Re-index one product; product is None when it was deleted"""
+        old_keys = self._product_keys.pop(product_id, frozenset())
+        old_rank = self._rank.pop(product_id, None)
+        new_keys = self.keys_for(product) if product is not None else frozenset()
+        new_rank = self._rank_for(product) if product is not None else None
+
+        for key in old_keys:
+            postings = self._postings[key]
+            postings.remove(product_id)
+            if not postings:
+                del self._postings[key]
+                del self._keys[bisect.bisect_left(self._keys, key)]
+        if product is None:
+            self._meta.pop(product_id, None)
+        else:
+            self._product_keys[product_id] = new_keys
+            self._rank[product_id] = new_rank
+            self._meta[product_id] = self._display(product)
+            for key in new_keys:
+                if key not in self._postings:
+                    self._postings[key] = []
+                    bisect.insort(self._keys, key)
+                bisect.insort(self._postings[key], product_id, key=self._rank.__getitem__)
+
+        labels = {key[:length] for key in old_keys | new_keys for length in range(len(key) + 1)}
+        for label in labels & self._top.keys():
+            top = self._top[label]
+            qualifies = any(key.startswith(label) for key in new_keys)
+            if product_id in top:
+                top.remove(product_id)
+                if not qualifies or new_rank > old_rank:
+                    # Something outside the list may now beat it; recompute on next use
+                    del self._top[label]
+                    continue
+            elif not qualifies:
+                continue
+            bisect.insort(top, product_id, key=self._rank.__getitem__)
+            del top[self.max_suggestions:]
 
+    # --- queries ---
 
+    def _best(self, low, high, limit):
+        candidates = {product_id for key in self._keys[low:high] for product_id in self._postings[key][:limit]}
+        return heapq.nsmallest(limit, candidates, key=self._rank.__getitem__)
 
+    def _lookup(self, prefix):
+        """Best product ids whose keys start with prefix (up to max_suggestions)"""
+        low = bisect.bisect_left(self._keys, prefix)
+        high = bisect.bisect_left(self._keys, prefix + '\U0010ffff', low)
+        if high - low <= self.SCAN_LIMIT:
+            return self._best(low, high, self.max_suggestions)
+        # Every prefix of the range's shared prefix selects this same range
+        label = os.path.commonprefix([self._keys[low], self._keys[high - 1]])
+        top = self._top.get(label)
+        if top is None:
+            top = self._top[label] = self._best(low, high, self.max_suggestions)
+        return top
 
+    def suggest(self, text, limit):
+        prefix = self.normalize(text)
+        if not prefix:
+            return []
+        self._refresh()
+        with self._lock:
+            self.stats["queries"] += 1
+            results = []
+            for product_id in self._lookup(prefix)[:limit]:
+                meta = self._meta[product_id]
+                if "url" not in meta:
+                    meta["url"] = app.url_map.bind('').build('shop_details', {'product_id': product_id})
+                matched = min(key for key in self._product_keys[product_id] if key.startswith(prefix))
+                results.append(dict(meta, matched=matched))
+            return results
 
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+            data["products"] = len(self._product_keys)
+            data["keys"] = len(self._keys)
+            data["memoized_prefixes"] = len(self._top)
+            data["pending_updates"] = len(self._dirty)
+        data["popularity_ttl_seconds"] = self.popularity_ttl
+        return data
 
 
+SUGGEST_MAX_RESULTS = int(os.environ.get('SUGGEST_MAX_RESULTS', 10))
 
+suggest_index = SuggestIndex(
+    max_suggestions=SUGGEST_MAX_RESULTS,
+    popularity_ttl=float(os.environ.get('SUGGEST_POPULARITY_TTL', 900)),
+)
 
 
+# ============================================
+# BULKHEADS FOR OUTBOUND AI ENDPOINTS
+# ============================================
 
+class Bulkhead:
+    """
+    Concurrency limit for one group of endpoints. Up to `limit` requests run at
+    once, up to `max_queue` more wait at most `queue_timeout` seconds for a
+    slot, and anything beyond that is rejected immediately.
+    """
 
-def init_db():
-    """Initialize the database with tables"""
-    Base.metadata.create_all(engine)
-    print("Database tables created successfully!")
+    def __init__(self, name, limit, max_queue, queue_timeout):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.stats = {"admitted": 0, "rejected_full": 0, "rejected_timeout": 0}
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                self.stats["admitted"] += 1
+                return True
+            if self.queued >= self.max_queue:
+                self.stats["rejected_full"] += 1
+                return False
+            self.queued += 1
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while self.in_flight >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["rejected_timeout"] += 1
+                        return False
+                    self._condition.wait(remaining)
+                self.in_flight += 1
+                self.stats["admitted"] += 1
+                return True
+            finally:
+                self.queued -= 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def snapshot(self):
+        with self._condition:
+            data = dict(self.stats)
+            data.update(in_flight=self.in_flight, queued=self.queued, limit=self.limit,
+                        max_queue=self.max_queue, queue_timeout=self.queue_timeout)
+        return data
+
+
+def _make_bulkhead(name, limit, max_queue, queue_timeout):
+    """Bulkhead configured by BULKHEAD_<NAME>_LIMIT / _QUEUE / _TIMEOUT"""
+    prefix = f"BULKHEAD_{name.upper()}"
+    return Bulkhead(
+        name,
+        limit=int(os.environ.get(f"{prefix}_LIMIT", limit)),
+        max_queue=int(os.environ.get(f"{prefix}_QUEUE", max_queue)),
+        queue_timeout=float(os.environ.get(f"{prefix}_TIMEOUT", queue_timeout)),
+    )
+
+
+# Advisor traffic gets its own slots so it can never take every worker thread from /shop and /checkout
+bulkheads = {
+    "transcription": _make_bulkhead("transcription", limit=4, max_queue=4, queue_timeout=1.0),
+    "recommendation": _make_bulkhead("recommendation", limit=8, max_queue=8, queue_timeout=1.0),
+}
+# The event-loop bulkheads in front of the same groups; asgi.py fills this in when it is loaded
+async_bulkheads = {}
+
+
+BULKHEAD_BUSY_PAYLOAD = {
+    "success": False,
+    "error": "Advisor is busy, please retry shortly",
+    "user_message": "अभी बहुत अनुरोध हैं। कृपया थोड़ी देर में फिर से कोशिश करें। / The advisor is busy. Please try again in a moment."
+}
+
+
+def bulkhead_busy_headers(limiter):
+    """Retry-After for a request turned away by `limiter`"""
+    return {'Retry-After': str(max(1, math.ceil(limiter.queue_timeout)))}
+
+
+def bulkhead(group):
+    """Run the view inside the named bulkhead, answering 503 with Retry-After when it is full"""
+    from functools import wraps
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            limiter = bulkheads[group]
+            if not limiter.acquire():
+                response = jsonify(BULKHEAD_BUSY_PAYLOAD)
+                response.headers.update(bulkhead_busy_headers(limiter))
+                return response, 503
+            
+            released = False
+            try:
+                response = app.make_response(f(*args, **kwargs))
+                if response.is_streamed:
+                    # Streaming bodies keep working after the view returns
+                    response.call_on_close(limiter.release)
+                    released = True
+                return response
+            finally:
+                if not released:
+                    limiter.release()
+        return decorated_function
+    return decorator
 
-def add_sample_data():
-    """Add sample products and categories for testing"""
-    # Check if data already exists
-    if db_session.query(Category).count() > 0:
-        print("Sample data already exists!")
-        return
-    
-    # Add categories
-    categories_data = [
-        {"name": "Outdoor Plants", "description": "Plants perfect for outdoor gardens"},
-        {"name": "Indoor Plants", "description": "Plants for indoor decoration"},
-        {"name": "Office Plants", "description": "Low maintenance plants for offices"},
-        {"name": "Potted Plants", "description": "Plants in decorative pots"},
-        {"name": "Flowering Plants", "description": "Beautiful flowering plants"}
-    ]
-    
-    categories = []
-    for cat_data in categories_data:
-        category = Category(**cat_data)
-        db_session.add(category)
-        categories.append(category)
-    
-    db_session.commit()
-    
-    # Add sample products
-    products_data = [
-        {"name": "Cactus Flower", "description": "Beautiful cactus with colorful flowers", "price": 10.99, "image_filename": "img/bg-img/40.png", "stock": 50, "category": categories[0], "sku": "CT201801", "tags": "cactus, flower, hot", "is_hot": True, "is_featured": True},
-        {"name": "Tulip Flower", "description": "Classic tulip plant", "price": 11.99, "image_filename": "img/bg-img/41.png", "stock": 30, "category": categories[4], "sku": "CT201802", "tags": "tulip, flower", "is_featured": True},
-        {"name": "Recuerdos Plant", "description": "Elegant indoor plant", "price": 9.99, "image_filename": "img/bg-img/34.jpg", "stock": 40, "category": categories[1], "sku": "CT201803", "tags": "indoor, green", "is_featured": True},
-        {"name": "Succulent Mix", "description": "Mixed succulent arrangement", "price": 15.99, "image_filename": "img/bg-img/42.png", "stock": 25, "category": categories[3], "sku": "CT201804", "tags": "succulent, potted"},
-        {"name": "Fern Plant", "description": "Lush green fern", "price": 12.50, "image_filename": "img/bg-img/43.png", "stock": 35, "category": categories[1], "sku": "CT201805", "tags": "fern, indoor, green"},
-        {"name": "Aloe Vera", "description": "Medicinal aloe vera plant", "price": 8.99, "image_filename": "img/bg-img/44.png", "stock": 60, "category": categories[2], "sku": "CT201806", "tags": "aloe, medicinal"},
-        {"name": "Snake Plant", "description": "Low maintenance snake plant", "price": 14.99, "image_filename": "img/bg-img/45.png", "stock": 45, "category": categories[2], "sku": "CT201807", "tags": "snake plant, office"},
-        {"name": "Orchid", "description": "Beautiful orchid flower", "price": 25.99, "image_filename": "img/bg-img/46.png", "stock": 20, "category": categories[4], "sku": "CT201808", "tags": "orchid, flower, elegant"},
-        {"name": "Peace Lily", "description": "Peaceful white lily", "price": 18.99, "image_filename": "img/bg-img/47.png", "stock": 28, "category": categories[1], "sku": "CT201809", "tags": "lily, flower, peace", "is_sale": True},
-        {"name": "Bonsai Tree", "description": "Miniature bonsai tree", "price": 35.99, "image_filename": "img/bg-img/48.png", "stock": 15, "category": categories[3], "sku": "CT201810", "tags": "bonsai, tree, miniature"},
-    ]
-    
-    for prod_data in products_data:
-        product = Product(**prod_data)
-        db_session.add(product)
-    
-    db_session.commit()
-    print("Sample data added successfully!")
 
 # ============================================
 # FERTILIZER ADVISOR ROUTES WITH DEEPGRAM
@@ -1034,104 +3999,233 @@ def fertilizer_advisor():
     """Fertilizer advisor page with Deepgram speech recognition"""
     return render_template("fertilizer-advisor-deepgram.html")
 
-@app.route("/api/transcribe-audio", methods=['POST'])
-def transcribe_audio():
+def transcribe_request_audio(language="hi"):
+    """transcribe_audio_body() for the current request"""
+    return transcribe_audio_body(
+        request.stream, request.headers.get('Content-Type', ''), request.content_length,
+        request.headers.get('X-Audio-SHA256', ''), language
+    )
+
+def transcribe_audio_body(stream, content_type, content_length, client_hash, language="hi"):
     """
-    API endpoint to transcribe audio using Deepgram
-    Accepts audio file and returns transcribed text in Hindi/English/Hinglish
+    Shared upload -> cache -> backend pipeline for the 'audio' field of a multipart body.
+    
+    The upload is streamed from `stream` straight to the backend, so memory per
+    request is bounded by AUDIO_UPLOAD_CHUNK_SIZE rather than the recording length.
+    The bytes are hashed on the way through and the transcript cached under that hash;
+    a request whose `client_hash` (X-Audio-SHA256) is already known is answered
+    without calling the backend. asgi.py runs the same steps with await.
+    
+    Returns:
+        tuple: (payload dict, HTTP status code, extra response headers)
     """
+    upload = None
     try:
-        from deepgram import DeepgramClient, PrerecordedOptions, FileSource
+        # Reject oversized bodies up front when the client declares the length
+        problem = declared_size_problem(content_length)
+        if problem:
+            return problem
         
         # Check if audio file is present
-        if 'audio' not in request.files:
-            return jsonify({
-                "success": False,
-                "error": "No audio file provided"
-            }), 400
-        
-        audio_file = request.files['audio']
+        upload = StreamingAudioUpload.from_body(stream, content_type, 'audio')
+        problem = audio_field_problem(upload, upload is not None and upload.open())
+        if problem:
+            return problem
         
-        if audio_file.filename == '':
-            return jsonify({
-                "success": False,
-                "error": "Empty filename"
-            }), 400
+        try:
+            backend = get_transcription_backend()
+        except TranscriptionUnavailableError as e:
+            return {"success": False, "error": str(e)}, 500, {}
         
-        # Get Deepgram API key
-        deepgram_api_key = os.getenv('DEEPGRAM_API_KEY')
-        if not deepgram_api_key:
-            return jsonify({
-                "success": False,
-                "error": "Deepgram API key not configured"
-            }), 500
+        cached = cached_transcript_response(backend, client_hash, language)
+        if cached:
+            return cached
         
-        # Save audio file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as temp_audio:
-            audio_file.save(temp_audio.name)
-            temp_audio_path = temp_audio.name
+        # Pull the first chunk so empty uploads never reach the backend
+        chunks = iter(upload)
+        first_chunk = next(chunks, b'')
+        if not first_chunk:
+            return empty_audio_payload()
         
+        # Transcribe audio
+        transcript = backend.transcribe(itertools.chain([first_chunk], chunks), language)
+        return transcript_response(upload, backend, transcript, language)
+    
+    except Exception as e:
+        return transcription_error_response(e, upload)
+
+
+def empty_audio_payload():
+    return {"success": False, "error": "Empty audio file"}, 400, {}
+
+
+def declared_size_problem(content_length):
+    """Error response when the declared body length is already over AUDIO_MAX_UPLOAD_BYTES"""
+    if content_length and content_length > app.config['AUDIO_MAX_UPLOAD_BYTES'] + 64 * 1024:
+        return upload_too_large_payload()
+    return None
+
+
+def audio_field_problem(upload, opened):
+    """Error response when the body has no usable audio file field"""
+    if upload is None or not opened:
+        return {"success": False, "error": "No audio file provided"}, 400, {}
+    if upload.filename == '':
+        return {"success": False, "error": "Empty filename"}, 400, {}
+    return None
+
+
+def cached_transcript_response(backend, client_hash, language):
+    """Clients that send the recording's SHA-256 get retries answered from the cache"""
+    client_hash = (client_hash or '').strip().lower()
+    if not re.fullmatch(r'[0-9a-f]{64}', client_hash):
+        return None
+    cached, cache_tier = transcript_cache.get(client_hash, backend.model, language)
+    if cached is None:
+        return None
+    return (
+        {"success": True, "transcription": cached["transcript"], "cached": True},
+        200,
+        {'X-Cache': f"HIT-{cache_tier.upper()}"}
+    )
+
+
+def transcript_response(upload, backend, transcript, language):
+    """Cache a fresh transcript under the hash of the streamed audio and build the response"""
+    if not transcript or not transcript.strip():
+        return {"success": False, "error": "No speech detected in audio"}, 400, {}
+    
+    # The hash now covers every byte the backend received
+    audio_hash = upload.sha256.hexdigest()
+    transcript_cache.put(audio_hash, transcript.strip(), backend.model, language, upload.bytes_read)
+    
+    return (
+        {"success": True, "transcription": transcript.strip()},
+        200,
+        {'X-Audio-SHA256': audio_hash, 'X-Cache': "MISS"}
+    )
+
+
+def transcription_error_response(e, upload):
+    if isinstance(e, ImportError):
+        return {"success": False, "error": "Deepgram SDK not installed. Run: pip install deepgram-sdk"}, 500, {}
+    # The size limit trips inside the HTTP client while it pulls chunks
+    if isinstance(e, UploadTooLargeError) or (upload is not None and upload.bytes_read > upload.max_bytes):
+        return upload_too_large_payload()
+    return {"success": False, "error": f"Transcription failed: {str(e)}"}, 500, {}
+
+
+@app.route("/api/transcribe-audio", methods=['POST'])
+@bulkhead("transcription")
+def transcribe_audio():
+    """
+    API endpoint to transcribe audio using the configured transcription backend (Deepgram by default)
+    Accepts audio file and returns transcribed text in Hindi/English/Hinglish
+    """
+    payload, status_code, headers = transcribe_request_audio()
+    response = jsonify(payload)
+    response.headers.update(headers)
+    return response, status_code
+
+
+@app.route("/api/voice-recommendation", methods=['POST'])
+@bulkhead("transcription")
+def voice_recommendation_api():
+    """
+    Single round trip from recorded audio to fertilizer recommendation
+    
+    Form Parameters:
+        - audio: Audio file (required)
+    
+    Query Parameters:
+        - stream: If set, respond with newline-delimited JSON: a `transcript` event as
+          soon as the transcription is ready, then a `recommendation` event
+        - latency_budget_ms: Same as for /api/fertilizer-recommendation
+    
+    Returns:
+        JSON with transcription and fertilizer recommendation
+    
+    The transcription bulkhead covers the whole request and the recommendation
+    step also takes a recommendation slot, so voice traffic counts against the
+    same Gemini limit as the text endpoints.
+    """
+    payload, status_code, headers = transcribe_request_audio()
+    if not payload["success"]:
+        payload.setdefault("user_message", "कोई आवाज़ नहीं सुनाई दी। कृपया फिर से रिकॉर्ड करें। / No voice detected. Please record again.")
+        return jsonify(payload), status_code
+    
+    transcription = payload["transcription"]
+    
+    # Same noise and too-short checks as the reference speech pipeline
+    problem = check_transcription_quality(transcription)
+    if problem:
+        problem["transcription"] = transcription
+        return jsonify(problem), 400
+    
+    try:
         try:
-            # Initialize Deepgram client
-            deepgram = DeepgramClient(deepgram_api_key)
-            
-            # Read audio file
-            with open(temp_audio_path, 'rb') as audio:
-                buffer_data = audio.read()
-            
-            payload: FileSource = {
-                "buffer": buffer_data,
-            }
-            
-            # Configure Deepgram options - Force Hindi transcription
-            options = PrerecordedOptions(
-                model="nova-2",
-                language="hi",  # Force Hindi only
-                smart_format=True,
-                punctuate=True,
-            )
-            
-            # Transcribe audio
-            response = deepgram.listen.prerecorded.v("1").transcribe_file(payload, options)
-            
-            # Extract transcription
-            transcript = response["results"]["channels"][0]["alternatives"][0]["transcript"]
-            
-            if not transcript or not transcript.strip():
-                return jsonify({
-                    "success": False,
-                    "error": "No speech detected in audio"
-                }), 400
-            
-            return jsonify({
-                "success": True,
-                "transcription": transcript.strip()
-            })
+            budget = parse_latency_budget(request.args.get('latency_budget_ms'))
+        except ValueError:
+            budget = app.config['ADVISOR_LATENCY_BUDGET']
+        
+        limiter = bulkheads["recommendation"]
+        
+        if request.args.get('stream'):
+            def generate():
+                yield json.dumps({"event": "transcript", "success": True, "transcription": transcription}, ensure_ascii=False) + "\n"
+                # Headers are already sent, so a full bulkhead or a failure is reported as the final event
+                if not limiter.acquire():
+                    event = dict(BULKHEAD_BUSY_PAYLOAD, event="recommendation")
+                else:
+                    try:
+                        recommendation, _ = recommend_for_input(transcription, budget)
+                        event = {"event": "recommendation", "success": True, "recommendation": recommendation}
+                    except Exception as e:
+                        event = {"event": "recommendation", "success": False, "error": str(e)}
+                    finally:
+                        limiter.release()
+                yield json.dumps(event, ensure_ascii=False) + "\n"
             
+            response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+            response.headers.update(headers)
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
+        
+        if not limiter.acquire():
+            # The transcript is returned so the client can retry the text endpoint
+            response = jsonify(dict(BULKHEAD_BUSY_PAYLOAD, transcription=transcription))
+            response.headers.update(bulkhead_busy_headers(limiter))
+            return response, 503
+        try:
+            recommendation, _ = recommend_for_input(transcription, budget)
         finally:
-            # Clean up temporary file
-            if os.path.exists(temp_audio_path):
-                os.remove(temp_audio_path)
-    
-    except ImportError:
-        return jsonify({
-            "success": False,
-            "error": "Deepgram SDK not installed. Run: pip install deepgram-sdk"
-        }), 500
+            limiter.release()
+        response = jsonify({
+            "success": True,
+            "transcription": transcription,
+            "recommendation": recommendation
+        })
+        response.headers.update(headers)
+        return response
     
     except Exception as e:
         return jsonify({
             "success": False,
-            "error": f"Transcription failed: {str(e)}"
+            "error": str(e),
+            "transcription": transcription,
+            "user_message": "कुछ तकनीकी समस्या हुई। कृपया फिर से कोशिश करें। / A technical issue occurred. Please try again."
         }), 500
 
 @app.route("/api/fertilizer-recommendation", methods=['POST'])
+@bulkhead("recommendation")
 def fertilizer_recommendation_api():
     """
     API endpoint to get fertilizer recommendation based on user input
     
     JSON Parameters:
         - user_input: String containing farmer's description of land, soil, and crops
+        - latency_budget_ms: Optional. Return the keyword fallback (marked provisional)
+          if Gemini has not answered within this many milliseconds
     
     Returns:
         JSON with fertilizer recommendation including product_name, amount, and why
@@ -1141,23 +4235,51 @@ def fertilizer_recommendation_api():
         user_input = data.get('user_input', '').strip()
         
         # Validate input
-        if not user_input:
+        error = validate_advisor_input(user_input)
+        if error:
             return jsonify({
                 "success": False,
-                "error": "Empty input received"
+                "error": error
             }), 400
         
-        if len(user_input) < 10:
+        try:
+            budget = parse_latency_budget(data.get('latency_budget_ms'))
+        except ValueError as e:
             return jsonify({
                 "success": False,
-                "error": "Input too short. Please provide more details about your land and crops."
+                "error": str(e)
             }), 400
         
-        # Simple keyword-based fertilizer recommendation
-        # This is a basic implementation - you can enhance it with AI/ML later
-        recommendation = get_simple_fertilizer_recommendation(user_input)
+        recommendation, cache_tier = recommend_for_input(user_input, budget)
+        
+        response = jsonify(recommendation)
+        response.headers['X-Cache'] = f"HIT-{cache_tier.upper()}" if cache_tier else "MISS"
+        return response
         
-        return jsonify(recommendation)
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route("/api/fertilizer-recommendation/batch", methods=['POST'])
+@bulkhead("recommendation")
+def fertilizer_recommendation_batch_api():
+    """
+    Batch version of /api/fertilizer-recommendation for field agents
+    
+    JSON Parameters:
+        - inputs: List of farmer descriptions (at most ADVISOR_BATCH_MAX)
+    
+    Returns:
+        JSON with a `results` list in the same order as `inputs`. Each item has the
+        same shape as the single endpoint's response; invalid items carry their
+        own error without failing the batch.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        payload, status_code = recommend_batch(data.get('inputs'))
+        return jsonify(payload), status_code
         
     except Exception as e:
         return jsonify({
@@ -1165,33 +4287,127 @@ def fertilizer_recommendation_api():
             "error": str(e)
         }), 500
 
+def recommend_batch(inputs):
+    """
+    Body of the batch endpoint. asgi.py runs the same steps with async Gemini calls.
+    
+    Returns:
+        tuple: (payload dict, HTTP status code)
+    """
+    try:
+        results, pending = prepare_batch(inputs)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+    
+    # Run the remaining Gemini calls concurrently on the bounded advisor executor;
+    # they are cached as they finish
+    futures = {text: submit_gemini_recommendation(text) for text in pending}
+    recommendations = {}
+    for text, future in futures.items():
+        try:
+            recommendations[text] = future.result() if future is not None else get_fallback_recommendation(text)
+        except Exception:
+            app.logger.exception("Batch recommendation failed")
+            recommendations[text] = get_fallback_recommendation(text)
+    
+    return finish_batch(results, pending, recommendations), 200
+
+def prepare_batch(inputs):
+    """
+    Validate a batch and answer what the recommendation cache can.
+    
+    Returns:
+        tuple: (results list with None where Gemini is still needed,
+                {normalized input: [positions]} for those)
+    Raises:
+        ValueError: the batch itself is unusable
+    """
+    if not isinstance(inputs, list) or not inputs:
+        raise ValueError("inputs must be a non-empty list")
+    
+    if len(inputs) > app.config['ADVISOR_BATCH_MAX']:
+        raise ValueError(f"Too many inputs. Maximum is {app.config['ADVISOR_BATCH_MAX']} per batch.")
+    
+    results = [None] * len(inputs)
+    pending = {}  # normalized input -> [positions]
+    
+    for position, raw_input in enumerate(inputs):
+        user_input = raw_input.strip() if isinstance(raw_input, str) else ''
+        error = validate_advisor_input(user_input)
+        if error:
+            results[position] = {"success": False, "error": error}
+            continue
+        
+        # Identical descriptions share one lookup and one Gemini call
+        text = normalize_advisor_input(user_input)
+        if text in pending:
+            pending[text].append(position)
+            continue
+        
+        recommendation, _ = recommendation_cache.get(text)
+        if recommendation is not None:
+            results[position] = recommendation
+        else:
+            pending[text] = [position]
+    
+    return results, pending
+
+def finish_batch(results, pending, recommendations):
+    """Fill in the `pending` positions from `recommendations` and attach catalog products"""
+    for text, positions in pending.items():
+        for position in positions:
+            results[position] = dict(recommendations[text])
+    
+    for result in results:
+        if result.get("success"):
+            result["catalog_products"] = match_catalog_products(result)
+    
+    return {
+        "success": True,
+        "count": len(results),
+        "results": results
+    }
+
 def get_simple_fertilizer_recommendation(user_input):
     """
     Generate fertilizer recommendation using Gemini AI to extract structured data
     
     Args:
-        user_input (str): Farmer's description in Hindi/English/Hinglish
+        user_input (str): Farmer's description in Hindi/English/Hinglish, as returned by normalize_advisor_input
         
     Returns:
         dict: Contains product_name, amount, why, nutrients, and land_acres
     """
     try:
-        import google.generativeai as genai
-        import re
-        import json
-        
-        # Get Gemini API key
-        gemini_api_key = os.getenv('GEMINI_API_KEY')
-        if not gemini_api_key:
+        # Get the shared Gemini client
+        gemini = get_gemini_client()
+        if gemini is None:
             # Fallback to simple keyword-based recommendation
             return get_fallback_recommendation(user_input)
         
-        # Configure Gemini
-        genai.configure(api_key=gemini_api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        # Skip the upstream entirely while it is failing
+        if gemini.breaker.is_open():
+            return get_fallback_recommendation(user_input)
         
         # Create prompt for Gemini to extract structured information
-        prompt = f"""
+        prompt = build_recommendation_prompt(user_input)
+        
+        # Generate response (bounded by deadline, retries and the circuit breaker)
+        llm_text = gemini.generate_text(prompt).strip()
+        
+        app.logger.debug("Gemini response for %r: %s", user_input, llm_text)
+        
+        return parse_gemini_recommendation(llm_text, user_input)
+        
+    except Exception as e:
+        app.logger.warning("Gemini AI error: %s", e)
+        # Fallback to keyword-based recommendation
+        return get_fallback_recommendation(user_input)
+
+
+def build_recommendation_prompt(user_input):
+    """Prompt asking Gemini to extract nutrients, land size and reasoning as JSON"""
+    return f"""
 You are an expert agronomist AI assistant. A farmer is providing information about their farming needs in English, Hindi, or Hinglish (mix of Hindi and English).
 
 **CRITICAL INSTRUCTIONS:**
@@ -1228,145 +4444,142 @@ You are an expert agronomist AI assistant. A farmer is providing information abo
   "why": "<brief explanation in English>"
 }}
 """
-        
-        # Generate response
-        response = model.generate_content(prompt)
-        llm_text = response.text.strip()
-        
-        # Debug logging
-        print(f"=== GEMINI DEBUG ===")
-        print(f"User Input: {user_input}")
-        print(f"Gemini Raw Response: {llm_text}")
-        print(f"===================")
-        
-        # Remove markdown code blocks if present
-        llm_text = re.sub(r'```json\s*', '', llm_text)
-        llm_text = re.sub(r'```\s*', '', llm_text)
-        llm_text = llm_text.strip()
-        
-        # Parse JSON response
-        try:
-            llm_dict = json.loads(llm_text)
-        except json.JSONDecodeError:
-            # Try to extract JSON from text
-            json_match = re.search(r'\{.*\}', llm_text, re.DOTALL)
-            if json_match:
-                llm_dict = json.loads(json_match.group(0))
-            else:
-                return get_fallback_recommendation(user_input)
-        
-        # Extract values
-        nutrients_list = llm_dict.get("nutrients", ["Nitrogen", "Phosphorus", "Potassium"])
-        land_acres = float(llm_dict.get("land_acres", 0))
-        why_text = llm_dict.get("why", "Recommended for healthy crop growth")
-        
-        # Validate extracted data
-        if not isinstance(nutrients_list, list) or len(nutrients_list) == 0:
-            nutrients_list = ["Nitrogen", "Phosphorus", "Potassium"]
-        
-        if land_acres < 0 or land_acres > 10000:
-            land_acres = 0
-        
-        # Generate product name based on nutrients
-        if len(nutrients_list) == 3:
-            product_name = "Avanii NPK Complete"
-        elif len(nutrients_list) == 2:
-            product_name = f"Avanii {nutrients_list[0][0]}{nutrients_list[1][0]} Mix"
-        elif len(nutrients_list) == 1:
-            product_name = f"Avanii {nutrients_list[0]} Booster"
-        else:
-            product_name = "Avanii General Purpose Fertilizer"
-        
-        # Calculate amount using original formula: nutrients * land_acres * 12 kg
-        if land_acres > 0:
-            amount = len(nutrients_list) * land_acres * 12  # kg per nutrient per acre
-            amount_str = f"{int(amount)} kg"
-        else:
-            amount_str = "Contact for consultation (land size not provided)"
-        
-        return {
-            "success": True,
-            "product_name": product_name,
-            "amount": amount_str,
-            "why": why_text,
-            "nutrients": nutrients_list,
-            "land_acres": land_acres if land_acres > 0 else "Not specified"
-        }
-        
-    except Exception as e:
-        print(f"Gemini AI error: {str(e)}")
-        # Fallback to keyword-based recommendation
-        return get_fallback_recommendation(user_input)
 
 
-def get_fallback_recommendation(user_input):
+def parse_gemini_recommendation(llm_text, user_input):
     """
-    Fallback keyword-based fertilizer recommendation when Gemini is unavailable
+    Turn Gemini's raw text into a recommendation dict, falling back to the
+    keyword recommender when no JSON object can be found in it
     """
-    user_input_lower = user_input.lower()
+    # Remove markdown code blocks if present
+    llm_text = re.sub(r'```json\s*', '', llm_text)
+    llm_text = re.sub(r'```\s*', '', llm_text)
+    llm_text = llm_text.strip()
     
-    # Extract land size (simple pattern matching)
-    land_acres = 0
-    import re
-    
-    # Hindi number word to digit mapping
-    hindi_numbers = {
-        'एक': 1, 'दो': 2, 'तीन': 3, 'चार': 4, 'पांच': 5, 'पाँच': 5,
-        'छह': 6, 'सात': 7, 'आठ': 8, 'नौ': 9, 'दस': 10,
-        'ek': 1, 'do': 2, 'teen': 3, 'char': 4, 'paanch': 5,
-        'chhe': 6, 'saat': 7, 'aath': 8, 'nau': 9, 'das': 10
-    }
+    # Parse JSON response
+    try:
+        llm_dict = json.loads(llm_text)
+    except json.JSONDecodeError:
+        # Try to extract JSON from text
+        json_match = re.search(r'\{.*\}', llm_text, re.DOTALL)
+        if json_match:
+            llm_dict = json.loads(json_match.group(0))
+        else:
+            return get_fallback_recommendation(user_input)
     
-    # Look for patterns like "5 acre", "2 bigha", "दो एकड़", etc.
-    acre_match = re.search(r'(\d+\.?\d*)\s*(?:acre|acres|एकड़)', user_input_lower)
-    bigha_match = re.search(r'(\d+\.?\d*)\s*(?:bigha|बीघा)', user_input_lower)
-    
-    # Try Hindi word numbers
-    if not acre_match and not bigha_match:
-        for hindi_word, digit in hindi_numbers.items():
-            if hindi_word in user_input_lower:
-                # Check if followed by land unit
-                if 'एकड़' in user_input_lower or 'acre' in user_input_lower:
-                    land_acres = digit
-                    break
-                elif 'बीघा' in user_input_lower or 'bigha' in user_input_lower:
-                    land_acres = digit * 0.62
-                    break
+    # Extract values
+    nutrients_list = llm_dict.get("nutrients", ["Nitrogen", "Phosphorus", "Potassium"])
+    land_acres = float(llm_dict.get("land_acres", 0))
+    why_text = llm_dict.get("why", "Recommended for healthy crop growth")
     
-    if acre_match:
-        land_acres = float(acre_match.group(1))
-    elif bigha_match:
-        # Convert bigha to acres (1 bigha ≈ 0.62 acres)
-        land_acres = float(bigha_match.group(1)) * 0.62
+    # Validate extracted data
+    if not isinstance(nutrients_list, list) or len(nutrients_list) == 0:
+        nutrients_list = ["Nitrogen", "Phosphorus", "Potassium"]
     
-    print(f"=== FALLBACK DEBUG ===")
-    print(f"Extracted land acres: {land_acres}")
-    print(f"======================")
+    if land_acres < 0 or land_acres > 10000:
+        land_acres = 0
     
+    # Generate product name based on nutrients
+    if len(nutrients_list) == 3:
+        product_name = "Avanii NPK Complete"
+    elif len(nutrients_list) == 2:
+        product_name = f"Avanii {nutrients_list[0][0]}{nutrients_list[1][0]} Mix"
+    elif len(nutrients_list) == 1:
+        product_name = f"Avanii {nutrients_list[0]} Booster"
+    else:
+        product_name = "Avanii General Purpose Fertilizer"
+    
+    # Calculate amount using original formula: nutrients * land_acres * 12 kg
+    if land_acres > 0:
+        amount = len(nutrients_list) * land_acres * 12  # kg per nutrient per acre
+        amount_str = f"{int(amount)} kg"
+    else:
+        amount_str = "Contact for consultation (land size not provided)"
+    
+    return {
+        "success": True,
+        "product_name": product_name,
+        "amount": amount_str,
+        "why": why_text,
+        "nutrients": nutrients_list,
+        "land_acres": land_acres if land_acres > 0 else "Not specified",
+        "source": "gemini"
+    }
+
+
+# Keyword table for the fallback recommender, compiled once into a single regex
+FALLBACK_KEYWORDS = {
+    'nitrogen': ['nitrogen', 'n', 'npk', 'leaf', 'green', 'growth', 'wheat', 'rice', 'paddy', 'गेहूं', 'धान', 'नाइट्रोजन'],
+    'phosphorus': ['phosphorus', 'p', 'npk', 'root', 'flower', 'fruit', 'फॉस्फोरस', 'जड़', 'फूल'],
+    'potassium': ['potassium', 'k', 'npk', 'disease', 'resistance', 'पोटैशियम', 'रोग'],
+    'vegetable': ['tomato', 'potato', 'vegetable', 'टमाटर', 'आलू', 'सब्जी'],
+    'cereal': ['wheat', 'rice', 'corn', 'maize', 'गेहूं', 'धान', 'मक्का'],
+}
+
+
+def _compile_fallback_pattern():
+    """
+    Build one alternation covering land sizes and every keyword.
+    Terms must start at a word boundary; romanized terms of three characters
+    or fewer must also end at one, so 'n', 'p' and 'k' only match as standalone
+    tokens while other words still match inflected forms ('roots', 'फूलों').
+    """
+    word_char = r'0-9A-Za-z\u0900-\u097F'
+    left, right = rf'(?<![{word_char}])', rf'(?![{word_char}])'
+
+    number = r'(?P<number>\d+(?:\.\d+)?)'
+    unit = rf'(?P<unit>{regex_alternation(LAND_UNITS_IN_ACRES)})'
+    land = rf'{left}{number}\s*{unit}'
+
+    terms = {term for keywords in FALLBACK_KEYWORDS.values() for term in keywords}
+    short_terms = [term for term in terms if term.isascii() and len(term) <= 3]
+    long_terms = [term for term in terms if term not in short_terms]
+    keyword = rf'{left}(?P<keyword>(?:{regex_alternation(long_terms)})|(?:{regex_alternation(short_terms)}){right})'
+
+    return re.compile(f'{land}|{keyword}')
+
+
+FALLBACK_PATTERN = _compile_fallback_pattern()
+FALLBACK_TERM_GROUPS = {}
+for _group, _keywords in FALLBACK_KEYWORDS.items():
+    for _term in _keywords:
+        FALLBACK_TERM_GROUPS.setdefault(_term, set()).add(_group)
+
+
+def get_fallback_recommendation(user_input):
+    """
+    Fallback keyword-based fertilizer recommendation when Gemini is unavailable.
+    Expects the output of normalize_advisor_input and makes a single pass over
+    it with the precompiled FALLBACK_PATTERN.
+    """
+    land_acres = 0
+    matched = set()
+
+    for match in FALLBACK_PATTERN.finditer(user_input):
+        if match.group('keyword'):
+            matched |= FALLBACK_TERM_GROUPS.get(match.group('keyword'), set())
+        elif not land_acres:
+            # First land size mentioned wins, e.g. "5 acre", "2 एकड़" (number words are already digits)
+            land_acres = float(match.group('number')) * LAND_UNITS_IN_ACRES[match.group('unit')]
+
     # Detect nutrients needed based on keywords
     nutrients = []
     reasons = []
     
-    # Nitrogen detection
-    nitrogen_keywords = ['nitrogen', 'n', 'leaf', 'green', 'growth', 'wheat', 'rice', 'paddy', 'गेहूं', 'धान', 'नाइट्रोजन']
-    if any(keyword in user_input_lower for keyword in nitrogen_keywords):
+    if 'nitrogen' in matched:
         nutrients.append("Nitrogen")
         reasons.append("Nitrogen promotes leaf growth and green color")
     
-    # Phosphorus detection
-    phosphorus_keywords = ['phosphorus', 'p', 'root', 'flower', 'fruit', 'फॉस्फोरस', 'जड़', 'फूल']
-    if any(keyword in user_input_lower for keyword in phosphorus_keywords):
+    if 'phosphorus' in matched:
         nutrients.append("Phosphorus")
         reasons.append("Phosphorus strengthens roots and promotes flowering")
     
-    # Potassium detection
-    potassium_keywords = ['potassium', 'k', 'disease', 'resistance', 'पोटैशियम', 'रोग']
-    if any(keyword in user_input_lower for keyword in potassium_keywords):
+    if 'potassium' in matched:
         nutrients.append("Potassium")
         reasons.append("Potassium improves disease resistance")
     
     # Crop-specific recommendations
-    if any(crop in user_input_lower for crop in ['tomato', 'potato', 'vegetable', 'टमाटर', 'आलू', 'सब्जी']):
+    if 'vegetable' in matched:
         if "Nitrogen" not in nutrients:
             nutrients.append("Nitrogen")
             reasons.append("Vegetables need nitrogen for leafy growth")
@@ -1374,7 +4587,7 @@ def get_fallback_recommendation(user_input):
             nutrients.append("Phosphorus")
             reasons.append("Phosphorus for strong root development")
     
-    if any(crop in user_input_lower for crop in ['wheat', 'rice', 'corn', 'maize', 'गेहूं', 'धान', 'मक्का']):
+    if 'cereal' in matched:
         if "Nitrogen" not in nutrients:
             nutrients.append("Nitrogen")
             reasons.append("Cereal crops require high nitrogen")
@@ -1410,7 +4623,8 @@ def get_fallback_recommendation(user_input):
         "amount": amount_str,
         "why": why,
         "nutrients": nutrients,
-        "land_acres": land_acres if land_acres > 0 else "Not specified"
+        "land_acres": land_acres if land_acres > 0 else "Not specified",
+        "source": "fallback"
     }
 
 # Vercel requires the app to be available at module level
@@ -165,6 +165,20 @@ farmer input :
         }
 
 
+# Diacritics left by ISO transliteration, mapped to plain Latin in a single pass.
+# This standalone prototype keeps its own table rather than importing main.py's
+# NORMALIZE_TABLE: it only ever sees ISO output, so it also rewrites 'c' (च) to
+# 'ch', which would corrupt the romanized text main.py normalizes.
+TRANSLITERATION_CLEANUP = str.maketrans({
+    'ā': 'a', 'ī': 'i', 'ū': 'u', 'ṛ': 'ri', 'ṝ': 'ri', 'ḷ': 'l', 'ḹ': 'l',
+    'ē': 'e', 'ō': 'o',
+    'ṃ': 'n', 'ṁ': 'n',  # Anusvara
+    'ḥ': 'h', 'ṅ': 'ng', 'ñ': 'ny',
+    'ṭ': 't', 'ḍ': 'd', 'ṇ': 'n', 'ś': 'sh', 'ṣ': 'sh',
+    'c': 'ch',  # च is actually 'ch' sound
+})
+
+
 # Transliteration function (Devanagari to Latin script)
 def transliterate_to_english(text):
     """
@@ -183,29 +197,7 @@ def transliterate_to_english(text):
         transliterated = transliterate(text, sanscript.DEVANAGARI, sanscript.ISO)
         
         # Clean up the output - make it completely English (no diacritical marks)
-        transliterated = transliterated.replace('ā', 'a')
-        transliterated = transliterated.replace('ī', 'i')
-        transliterated = transliterated.replace('ū', 'u')
-        transliterated = transliterated.replace('ṛ', 'ri')
-        transliterated = transliterated.replace('ṝ', 'ri')
-        transliterated = transliterated.replace('ḷ', 'l')
-        transliterated = transliterated.replace('ḹ', 'l')
-        transliterated = transliterated.replace('ē', 'e')
-        transliterated = transliterated.replace('ō', 'o')
-        transliterated = transliterated.replace('ṃ', 'n')
-        transliterated = transliterated.replace('ṁ', 'n')  # Anusvara
-        transliterated = transliterated.replace('ḥ', 'h')
-        transliterated = transliterated.replace('ṅ', 'ng')
-        transliterated = transliterated.replace('ñ', 'ny')
-        transliterated = transliterated.replace('ṭ', 't')
-        transliterated = transliterated.replace('ḍ', 'd')
-        transliterated = transliterated.replace('ṇ', 'n')
-        transliterated = transliterated.replace('ś', 'sh')
-        transliterated = transliterated.replace('ṣ', 'sh')
-        transliterated = transliterated.replace('c', 'ch')  # च is actually 'ch' sound
-        transliterated = transliterated.replace('ñ', 'n')
-        
-        return transliterated
+        return transliterated.translate(TRANSLITERATION_CLEANUP)
     except ImportError:
         return f"[Transliteration library not installed. Original: {text}]"
     except Exception as e:
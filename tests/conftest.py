@@ -0,0 +1,74 @@
+"""
+Shared fixtures. main.py picks its database from DATABASE_URL at import time,
+so it is pointed at a scratch SQLite file before the first import; the
+development site.db is never touched.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+_DB_DIR = tempfile.mkdtemp(prefix='avanii-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_DB_DIR, 'test.db')
+os.environ['TRANSCRIPTION_BACKEND'] = 'local'
+os.environ.pop('GEMINI_API_KEY', None)
+os.environ.pop('TRUSTED_PROXIES', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+PASSWORD = 'correct horse battery'
+
+
+@pytest.fixture(scope='session', autouse=True)
+def database():
+    main.init_db()
+    main.add_sample_data()
+    main.db_session.add_all([
+        main.User(username='farmer', email='farmer@example.com', password_hash=generate_password_hash(PASSWORD)),
+        main.User(username='admin', email='admin@example.com', password_hash=generate_password_hash(PASSWORD),
+                  is_admin=True),
+    ])
+    main.db_session.commit()
+    main.db_session.remove()
+    yield
+    main.db_session.remove()
+    main.engine.dispose()
+    shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def fresh_catalog_caches():
+    # A version bump invalidates the page, listing and summary caches together
+    main.catalog_version.bump()
+    yield
+    main.db_session.remove()
+
+
+@pytest.fixture
+def client():
+    main.app.config['TESTING'] = True
+    return main.app.test_client()
+
+
+def login(client, username, password=PASSWORD):
+    return client.post('/login', data={'username': username, 'password': password})
+
+
+def add_product(**columns):
+    """Commit one product and return its id"""
+    values = dict(price=10.0, image_filename='test.jpg', stock=5)
+    values.update(columns)
+    product = main.Product(**values)
+    main.db_session.add(product)
+    main.db_session.commit()
+    return product.id
+
+
+def delete_product(product_id):
+    main.db_session.delete(main.db_session.get(main.Product, product_id))
+    main.db_session.commit()
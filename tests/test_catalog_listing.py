@@ -0,0 +1,70 @@
+import itertools
+
+import pytest
+
+import main
+from conftest import add_product, delete_product
+
+np = pytest.importorskip('numpy')
+
+
+@pytest.fixture
+def tie_products():
+    """Products sharing names and prices, so every sort order needs its id tiebreaker"""
+    category_id = main.db_session.query(main.Category.id).first()[0]
+    product_ids = [
+        add_product(name='Tie Basil', price=25.0, category_id=category_id, sku=f'TIE-{number}')
+        for number in range(3)
+    ] + [add_product(name='tie basil', price=25.0, sku='TIE-LOWER')]
+    yield product_ids
+    for product_id in product_ids:
+        delete_product(product_id)
+
+
+@pytest.fixture
+def listings(monkeypatch):
+    """(SQL listing, snapshot listing) for a filter tuple, both uncached"""
+    monkeypatch.setattr(main.listing_cache, 'max_entries', 0)
+    engine = main.CatalogSnapshotEngine(np)
+
+    def run(filters):
+        monkeypatch.setattr(main, 'catalog_snapshots', None)
+        sql = main.shop_listing(filters)
+        monkeypatch.setattr(main, 'catalog_snapshots', engine)
+        snapshot = main.shop_listing(filters)
+        return sql, snapshot
+
+    return run
+
+
+def test_snapshot_listing_matches_sql(tie_products, listings):
+    category_ids = [None] + [row[0] for row in main.db_session.query(main.Category.id)]
+    price_bounds = [(None, None), (20.0, None), (None, 25.0), (25.0, 25.0)]
+    searches = ['', 'tie', 'lily', 'plant', '%', 'no such product']
+
+    for category, (min_price, max_price), sort_by, search in itertools.product(
+            category_ids, price_bounds, main.SHOP_SORT_ORDERS, searches):
+        for page, per_page in ((1, 9), (2, 3)):
+            filters = (category, min_price, max_price, sort_by, page, per_page, search)
+            sql, snapshot = listings(filters)
+            assert snapshot == sql, filters
+
+
+def test_snapshot_summary_matches_sql(tie_products, monkeypatch):
+    monkeypatch.setattr(main.listing_cache, 'max_entries', 0)
+    monkeypatch.setattr(main, 'catalog_snapshots', None)
+    sql = main.catalog_summary()
+    monkeypatch.setattr(main, 'catalog_snapshots', main.CatalogSnapshotEngine(np))
+    assert main.catalog_summary() == sql
+
+
+def test_snapshot_is_replaced_after_a_commit(listings):
+    filters = (None, None, None, 'newest', 1, 9, 'snapshot fresh')
+    assert listings(filters) == (((), 0), ((), 0))
+
+    product_id = add_product(name='Snapshot Fresh Mint')
+    try:
+        sql, snapshot = listings(filters)
+        assert sql == snapshot == ((product_id,), 1)
+    finally:
+        delete_product(product_id)
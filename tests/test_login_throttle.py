@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+import main
+from conftest import login
+
+
+@pytest.fixture
+def throttle(monkeypatch):
+    limiter = main.LoginThrottle(main.MemoryThrottleStore(), ip_limit=5, username_limit=3, window=2)
+    monkeypatch.setattr(main, 'login_throttle', limiter)
+    return limiter
+
+
+def test_username_limit_answers_429_with_retry_after(client, throttle):
+    for _ in range(3):
+        assert login(client, 'farmer', 'wrong').status_code == 200
+
+    response = login(client, 'farmer', 'wrong')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    assert throttle.stats['rejected_username'] == 1
+
+
+def test_rejected_attempt_does_not_check_the_password(client, throttle):
+    for _ in range(3):
+        login(client, 'farmer', 'wrong')
+
+    # Even the right password is turned away while the username is throttled
+    assert login(client, 'farmer').status_code == 429
+
+
+def test_retry_after_counts_down_and_the_window_slides(client, throttle):
+    for _ in range(3):
+        login(client, 'farmer', 'wrong')
+    assert login(client, 'farmer', 'wrong').headers['Retry-After'] == '2'
+
+    time.sleep(1.1)
+    assert login(client, 'farmer', 'wrong').headers['Retry-After'] == '1'
+
+    time.sleep(1.0)
+    assert login(client, 'farmer', 'wrong').status_code == 200
+
+
+def test_ip_limit_spans_usernames(client, throttle):
+    for number in range(5):
+        login(client, f'nobody{number}', 'wrong')
+
+    response = login(client, 'someone-else', 'wrong')
+    assert response.status_code == 429
+    assert throttle.stats['rejected_ip'] == 1
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(client, throttle):
+    for number in range(5):
+        client.post('/login', data={'username': f'nobody{number}', 'password': 'wrong'},
+                    headers={'X-Forwarded-For': f'203.0.113.{number}'})
+
+    response = client.post('/login', data={'username': 'another', 'password': 'wrong'},
+                           headers={'X-Forwarded-For': '198.51.100.7'})
+    assert response.status_code == 429
+
+
+def test_success_resets_the_username_count(client, throttle):
+    for _ in range(2):
+        login(client, 'farmer', 'wrong')
+    assert login(client, 'farmer').status_code == 302
+
+    client.get('/logout')
+    for _ in range(2):
+        assert login(client, 'farmer', 'wrong').status_code == 200
+
+
+def test_memory_store_drops_expired_keys():
+    store = main.MemoryThrottleStore()
+    now = time.time()
+    for number in range(1000):
+        store.add(f'login:user:spray{number}', 60, now)
+    assert len(store) == 1000
+
+    # The first add a window later sweeps every key whose hits have all expired
+    store.add('login:ip:127.0.0.1', 60, now + 61)
+    assert len(store) == 1
+    assert store.count('login:user:spray1', 60, now + 61) == (0, None)
@@ -0,0 +1,53 @@
+import main
+from conftest import add_product, delete_product, login
+
+
+def test_anonymous_pages_are_served_from_the_cache(client):
+    first = client.get('/shop?sort=name_asc')
+    assert first.status_code == 200
+    assert first.headers['X-Page-Cache'] == 'MISS'
+
+    second = client.get('/shop?sort=name_asc')
+    assert second.headers['X-Page-Cache'] == 'HIT'
+    assert second.get_data() == first.get_data()
+
+
+def test_committed_product_write_invalidates_cached_pages(client):
+    product_id = add_product(name='Page Cache Marigold', price=12.5)
+    try:
+        page = client.get(f'/shop/{product_id}')
+        assert client.get(f'/shop/{product_id}').headers['X-Page-Cache'] == 'HIT'
+
+        product = main.db_session.get(main.Product, product_id)
+        product.name = 'Page Cache Sunflower'
+        main.db_session.commit()
+
+        response = client.get(f'/shop/{product_id}')
+        assert response.headers['X-Page-Cache'] == 'MISS'
+        assert b'Page Cache Sunflower' in response.get_data()
+        assert b'Page Cache Sunflower' not in page.get_data()
+    finally:
+        delete_product(product_id)
+
+
+def test_rolled_back_write_keeps_cached_pages(client):
+    client.get('/about')
+    version = main.catalog_version.current()
+
+    product = main.db_session.query(main.Product).first()
+    product.name = 'Never Committed'
+    main.db_session.flush()
+    main.db_session.rollback()
+
+    assert main.catalog_version.current() == version
+    assert client.get('/about').headers['X-Page-Cache'] == 'HIT'
+
+
+def test_logged_in_pages_bypass_the_cache(client):
+    client.get('/shop')
+    login(client, 'farmer')
+
+    response = client.get('/shop')
+    assert response.status_code == 200
+    assert 'X-Page-Cache' not in response.headers
+    assert b'farmer' in response.get_data()
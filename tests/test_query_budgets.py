@@ -0,0 +1,75 @@
+"""
+Every view declaring @query_budget is requested with QUERY_AUDIT=raise, which
+fails the request with QueryBudgetExceeded if it runs more SQL statements
+than its budget. Catalogs get several products per page, so an N+1 query
+shows up as an overrun rather than hiding under the budget.
+"""
+
+import pytest
+
+import main
+from conftest import PASSWORD, login
+
+CHECKOUT_FORM = {
+    'first_name': 'Asha', 'last_name': 'Patel', 'email': 'asha@example.com', 'phone': '9876543210',
+    'address': '12 Market Road', 'city': 'Pune', 'state': 'Maharashtra',
+}
+
+
+@pytest.fixture
+def audited(monkeypatch):
+    monkeypatch.setitem(main.app.config, 'QUERY_AUDIT', 'raise')
+    # Rendered pages, not cached copies, are what the budgets are for
+    monkeypatch.setattr(main.page_cache, 'max_entries', 0)
+    return main.query_audit_reports
+
+
+def get_within_budget(client, url, exercised):
+    response = client.get(url)
+    assert response.status_code == 200, url
+    assert 'X-Query-Budget' in response.headers, url
+    assert int(response.headers['X-Query-Count']) <= int(response.headers['X-Query-Budget']), url
+    exercised.add(main.query_audit_reports[-1]['route'])
+    return response
+
+
+def budgeted_rules():
+    return {
+        rule.rule for rule in main.app.url_map.iter_rules()
+        if getattr(main.app.view_functions[rule.endpoint], 'query_budget', None) is not None
+    }
+
+
+def test_every_budgeted_view_stays_within_budget(client, audited):
+    exercised = set()
+    product_ids = [row[0] for row in main.db_session.query(main.Product.id).limit(3)]
+
+    for url in ('/shop', '/shop?sort=price_low&per_page=24', '/shop?category=1&search=plant&page=2&per_page=3',
+                f'/shop/{product_ids[0]}', '/api/shop/price-histogram?buckets=30',
+                '/api/search/suggest?q=p', '/cart'):
+        get_within_budget(client, url, exercised)
+
+    login(client, 'farmer')
+    for product_id in product_ids:
+        client.post(f'/add-to-cart/{product_id}', data={'quantity': 2})
+    get_within_budget(client, '/cart', exercised)
+    get_within_budget(client, '/checkout', exercised)
+    response = client.post('/checkout', data=CHECKOUT_FORM)
+    assert response.status_code == 302
+    order_id = int(response.headers['Location'].rstrip('/').rsplit('/', 1)[-1])
+    get_within_budget(client, '/orders', exercised)
+    get_within_budget(client, f'/order/{order_id}', exercised)
+    client.get('/logout')
+
+    client.post('/admin/login', data={'username': 'admin', 'password': PASSWORD})
+    for url in ('/admin/dashboard', '/admin/users', '/admin/products', '/admin/categories',
+                '/admin/orders', f'/admin/orders/{order_id}'):
+        get_within_budget(client, url, exercised)
+
+    assert exercised == budgeted_rules()
+
+
+def test_going_over_budget_fails_the_request(client, audited, monkeypatch):
+    monkeypatch.setattr(main.shop, 'query_budget', 1)
+    with pytest.raises(main.QueryBudgetExceeded):
+        client.get('/shop?sort=name_desc')
@@ -0,0 +1,61 @@
+import time
+
+import main
+from conftest import add_product, delete_product
+
+
+def suggested_names(client, query):
+    response = client.get('/api/search/suggest', query_string={'q': query})
+    assert response.status_code == 200
+    return [suggestion['name'] for suggestion in response.get_json()['suggestions']]
+
+
+def test_suggestions_match_word_prefixes(client):
+    product_id = add_product(name='Zephyrine Trailing Fern', sku='ZTF-001', tags='hanging,shade')
+    try:
+        assert 'Zephyrine Trailing Fern' in suggested_names(client, 'zephy')
+        assert 'Zephyrine Trailing Fern' in suggested_names(client, 'trailing f')
+        assert 'Zephyrine Trailing Fern' in suggested_names(client, 'ztf-0')
+    finally:
+        delete_product(product_id)
+
+
+def test_committed_insert_rename_and_delete_update_the_index(client):
+    product_id = add_product(name='Quokkaberry Shrub', sku='QBS-001')
+    try:
+        assert suggested_names(client, 'quokka') == ['Quokkaberry Shrub']
+
+        product = main.db_session.get(main.Product, product_id)
+        product.name = 'Xanthoria Shrub'
+        main.db_session.commit()
+        assert suggested_names(client, 'quokka') == []
+        assert suggested_names(client, 'xanthoria') == ['Xanthoria Shrub']
+    finally:
+        delete_product(product_id)
+
+    assert suggested_names(client, 'xanthoria') == []
+
+
+def test_rolled_back_insert_is_not_suggested(client):
+    main.db_session.add(main.Product(name='Phantom Orchid', price=1.0, image_filename='x.jpg'))
+    main.db_session.flush()
+    main.db_session.rollback()
+
+    assert suggested_names(client, 'phantom') == []
+
+
+def test_bulk_update_rebuilds_the_index(client):
+    product_id = add_product(name='Bulkwort Original', sku='BLK-001')
+    try:
+        assert suggested_names(client, 'bulkwort') == ['Bulkwort Original']
+        main.db_session.query(main.Product).filter(main.Product.id == product_id) \
+            .update({main.Product.name: 'Bulkwort Renamed'})
+        main.db_session.commit()
+
+        # Bulk statements trigger a background rebuild; stale answers are served meanwhile
+        deadline = time.monotonic() + 5
+        while suggested_names(client, 'bulkwort') != ['Bulkwort Renamed'] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert suggested_names(client, 'bulkwort') == ['Bulkwort Renamed']
+    finally:
+        delete_product(product_id)